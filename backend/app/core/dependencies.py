@@ -0,0 +1,21 @@
+from typing import AsyncIterator
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.mysql_connection import get_async_connection
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Request-scoped database session (unit of work).
+
+    FastAPI caches dependencies per request, so get_current_user and the route
+    share this one session and a single pooled connection. Write CRUD functions
+    commit it before the response is built; anything left uncommitted when the
+    request fails is rolled back here, and the connection is returned once.
+    """
+    session = get_async_connection()
+    try:
+        yield session
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
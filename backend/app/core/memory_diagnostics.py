@@ -0,0 +1,183 @@
+"""
+Memory diagnostics for a running worker
+Starts/stops tracemalloc, keeps a few named snapshots and diffs them grouped
+by line, file or traceback; also reports RSS, GC generations and the size of
+the in-process caches
+"""
+from dotenv import load_dotenv
+import gc
+import os
+import threading
+import time
+import tracemalloc
+
+load_dotenv()
+
+MEMORY_MAX_SNAPSHOTS = int(os.getenv("MEMORY_MAX_SNAPSHOTS", "10"))
+
+# allocations made by tracemalloc itself and by the import system are noise in every diff
+_NOISE = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def start_tracing(frames: int = 1) -> dict:
+    """Start tracemalloc; more frames give deeper tracebacks at a higher cost."""
+    if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+        tracemalloc.stop()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return tracing_status()
+
+
+def stop_tracing() -> dict:
+    """Stop tracemalloc and drop every snapshot, releasing the memory they hold."""
+    tracemalloc.stop()
+    with _lock:
+        _snapshots.clear()
+    return tracing_status()
+
+
+def tracing_status() -> dict:
+    status = {"tracing": tracemalloc.is_tracing(), "snapshots": snapshot_names()}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        status.update({
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_kb": round(current / 1024, 1),
+            "traced_peak_kb": round(peak / 1024, 1),
+            "tracemalloc_overhead_kb": round(tracemalloc.get_tracemalloc_memory() / 1024, 1),
+        })
+    return status
+
+
+def _take():
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running; start it first")
+    return tracemalloc.take_snapshot().filter_traces(_NOISE)
+
+
+def take_snapshot(name: str) -> dict:
+    snapshot = _take()
+    with _lock:
+        _snapshots.pop(name, None)
+        _snapshots[name] = (time.time(), snapshot)
+        # keep the newest few; each snapshot holds a copy of every live trace
+        while len(_snapshots) > MEMORY_MAX_SNAPSHOTS:
+            _snapshots.pop(next(iter(_snapshots)))
+    return {"name": name, "traces": len(snapshot.traces), "size_kb": round(_total(snapshot) / 1024, 1)}
+
+
+def snapshot_names() -> list:
+    with _lock:
+        return [{"name": name, "taken_at": taken_at} for name, (taken_at, _) in _snapshots.items()]
+
+
+def _total(snapshot) -> int:
+    return sum(trace.size for trace in snapshot.traces)
+
+
+def _get(name: str):
+    with _lock:
+        entry = _snapshots.get(name)
+    if entry is None:
+        raise KeyError(name)
+    return entry[1]
+
+
+def _location(stat, group_by: str) -> str:
+    if group_by == "traceback":
+        return " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback)
+    frame = stat.traceback[0]
+    return frame.filename if group_by == "filename" else f"{frame.filename}:{frame.lineno}"
+
+
+def diff_snapshots(base: str, target: str = None, group_by: str = "lineno", limit: int = 25) -> dict:
+    """Top allocation changes from `base` to `target` (or to a fresh snapshot when omitted)."""
+    old = _get(base)
+    new = _get(target) if target else _take()
+    stats = new.compare_to(old, group_by)
+    return {
+        "base": base,
+        "target": target or "now",
+        "group_by": group_by,
+        "total_diff_kb": round((_total(new) - _total(old)) / 1024, 1),
+        "top": [
+            {
+                "location": _location(stat, group_by),
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "size_kb": round(stat.size / 1024, 1),
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+            }
+            for stat in stats[:limit]
+        ],
+    }
+
+
+def _rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB on Linux
+    return peak // 1024 if os.uname().sysname == "Darwin" else peak
+
+
+def gc_status() -> dict:
+    return {
+        "counts": gc.get_count(),
+        "thresholds": gc.get_threshold(),
+        "generations": gc.get_stats(),
+        "uncollectable": len(gc.garbage),
+        "tracked_objects": len(gc.get_objects()),
+    }
+
+
+def cache_sizes() -> dict:
+    """Entry counts of the long-lived in-process caches and queues."""
+    from app.core.principal_cache import principal_cache
+    from app.core.revocation import token_state
+    from app.database.mongodb_connection import get_client, get_fs
+    from app.middleware.log_writer import log_writer
+    from app.middleware.metrics import _http_children
+    from app.middleware.slow_queries import slow_query_log
+
+    slow = slow_query_log.stats()
+    return {
+        "principal_cache": principal_cache.stats()["size"],
+        "token_state": token_state.stats()["users"],
+        "log_writer_queue": log_writer.stats()["queue_depth"],
+        "slow_query_queue": slow["queue_depth"],
+        "slow_query_explained_shapes": slow["explained_shapes"],
+        "metrics_label_sets": len(_http_children),
+        "mongo_clients": get_client.cache_info().currsize,
+        "gridfs_handles": get_fs.cache_info().currsize,
+    }
+
+
+def memory_report() -> dict:
+    return {
+        "pid": os.getpid(),
+        "rss_kb": _rss_kb(),
+        "peak_rss_kb": _peak_rss_kb(),
+        "gc": gc_status(),
+        "caches": cache_sizes(),
+        "tracemalloc": tracing_status(),
+    }
@@ -0,0 +1,198 @@
+"""
+In-process pub/sub for remark notifications
+Each open stream subscribes for its user with a bounded queue; new remarks
+are dispatched to the subscribers listed in their notify_to. Across workers
+the remark inserts themselves are the events when MongoDB runs as a replica
+set (change stream); otherwise add_remark dispatches locally
+"""
+from dotenv import load_dotenv
+from app.database.mongo_health import mongo_breaker, is_mongo_unavailable
+from app.utils.mongo_serializer import serialize_mongo
+import asyncio
+import json
+import logging
+import os
+import threading
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "auto" uses a change stream when MongoDB is a replica set, "local" never does
+NOTIFY_BACKEND = os.getenv("NOTIFY_BACKEND", "auto").lower()
+NOTIFY_HEARTBEAT_SECONDS = float(os.getenv("NOTIFY_HEARTBEAT_SECONDS", "15"))
+# events buffered per stream before a slow client is told to reconnect and resume
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "100"))
+NOTIFY_REPLAY_LIMIT = int(os.getenv("NOTIFY_REPLAY_LIMIT", "200"))
+
+RESET = object()
+
+
+def remark_event(remark: dict):
+    """(event id, JSON payload) for a remark document; the id is the remark's ObjectId."""
+    data = serialize_mongo(dict(remark))
+    return str(remark["_id"]), json.dumps(data, default=str)
+
+
+class Subscriber:
+    def __init__(self, e_id: int, maxsize: int = NOTIFY_QUEUE_SIZE):
+        self.e_id = e_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.loop = asyncio.get_running_loop()
+        self.overflowed = False
+
+    def offer(self, event):
+        # dispatch may run on the change stream thread; the queue belongs to the subscriber's loop
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # loop already closed at shutdown
+
+    def _put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # drop the backlog rather than buffer without bound; the client resumes from its last event id
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESET)
+
+
+class LocalBackend:
+    """Single-worker stand-in: add_remark hands its remark straight to the hub."""
+    name = "local"
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, remark: dict):
+        self.hub.dispatch(remark)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class ChangeStreamBackend:
+    """Every worker watches remark inserts, so a remark added on one worker reaches streams on all of them."""
+    name = "changestream"
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._stop = threading.Event()
+        self._thread = None
+        self._resume_token = None
+
+    def publish(self, remark: dict):
+        # the insert itself comes back through the change stream
+        pass
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="notification-changestream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _run(self):
+        from app.database.mongodb_connection import get_remarks_collection
+
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        while not self._stop.is_set():
+            try:
+                with get_remarks_collection().watch(pipeline, resume_after=self._resume_token, max_await_time_ms=1000) as stream:
+                    while not self._stop.is_set() and stream.alive:
+                        change = stream.try_next()
+                        if change is not None:
+                            self.hub.dispatch(change["fullDocument"])
+                        self._resume_token = stream.resume_token
+            except Exception as e:
+                if is_mongo_unavailable(e):
+                    mongo_breaker.record_failure()
+                logger.warning(f"Notification change stream failed: {str(e)}")
+                self._stop.wait(5)
+
+
+def _supports_change_streams() -> bool:
+    from app.database.mongodb_connection import get_client
+
+    hello = get_client().admin.command("hello")
+    return bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+
+
+class NotificationHub:
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.backend = LocalBackend(self)
+        self.dispatched = 0
+        self.overflows = 0
+
+    def subscribe(self, e_id: int) -> Subscriber:
+        subscriber = Subscriber(e_id)
+        with self._lock:
+            self._subscribers.setdefault(e_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber.overflowed:
+            self.overflows += 1
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.e_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.e_id]
+
+    def publish(self, remark: dict):
+        """Called by add_remark once the remark is stored."""
+        self.backend.publish(remark)
+
+    def dispatch(self, remark: dict):
+        with self._lock:
+            targets = [s for e_id in remark.get("notify_to") or [] for s in self._subscribers.get(e_id, ())]
+        if not targets:
+            return
+        event = remark_event(remark)
+        for subscriber in targets:
+            subscriber.offer(event)
+        self.dispatched += 1
+
+    def start(self):
+        """Pick the backend (may query MongoDB; run off the event loop) and start it."""
+        backend = LocalBackend(self)
+        if NOTIFY_BACKEND != "local":
+            try:
+                if NOTIFY_BACKEND == "changestream" or _supports_change_streams():
+                    backend = ChangeStreamBackend(self)
+            except Exception as e:
+                logger.warning(f"Change stream check failed, notifications stay worker-local: {str(e)}")
+        backend.start()
+        self.backend = backend
+
+    def stop(self):
+        self.backend.stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            streams = sum(len(s) for s in self._subscribers.values())
+            users = len(self._subscribers)
+        return {
+            "backend": self.backend.name,
+            "streams": streams,
+            "users": users,
+            "dispatched": self.dispatched,
+            "overflows": self.overflows,
+        }
+
+
+notification_hub = NotificationHub()
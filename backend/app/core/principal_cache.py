@@ -0,0 +1,246 @@
+"""
+Per-process cache of resolved principals for get_current_user
+TTL + LRU keyed by e_id, with optional cross-worker invalidation
+"""
+from collections import OrderedDict
+from dotenv import load_dotenv
+import logging
+import os
+import threading
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+# "mongo" enables cross-worker invalidation; empty keeps invalidation process-local
+PRINCIPAL_CACHE_CHANNEL = os.getenv("PRINCIPAL_CACHE_CHANNEL", "").lower()
+PRINCIPAL_CACHE_POLL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_POLL_SECONDS", "2"))
+# how long a missing invalidation number is waited for, and how long published invalidations are kept
+PRINCIPAL_CACHE_GAP_SECONDS = float(os.getenv("PRINCIPAL_CACHE_GAP_SECONDS", "30"))
+PRINCIPAL_CACHE_INVALIDATION_TTL = float(os.getenv("PRINCIPAL_CACHE_INVALIDATION_TTL", "86400"))
+
+# job_state document holding the last invalidation sequence number
+_COUNTER_ID = "principal_invalidations"
+
+
+class PrincipalCache:
+    """Thread-safe LRU map of e_id -> principal whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.channel = None
+
+    def get(self, e_id: int):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(e_id)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(e_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[e_id]
+            self.misses += 1
+            return None
+
+    def put(self, e_id: int, principal):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[e_id] = (time.monotonic() + self.ttl, principal)
+            self._data.move_to_end(e_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, e_id: int, broadcast: bool = True):
+        """Drop e_id here and, unless the call came from the channel, tell the other workers."""
+        self._discard(e_id)
+        if broadcast and self.channel is not None:
+            # only queued here; the channel thread talks to Mongo
+            self.channel.publish(e_id)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _discard(self, e_id: int):
+        with self._lock:
+            if self._data.pop(e_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "channel": type(self.channel).__name__ if self.channel else None,
+                "pending_publishes": self.channel.pending if self.channel else 0,
+            }
+
+
+class MongoInvalidationChannel:
+    """Cross-worker invalidation through a small Mongo collection.
+
+    publish() only queues the e_id, so callers on the event loop never wait on Mongo.
+    A daemon thread in every worker sends the queue (the next number from a counter
+    ($inc), then an insert of {_id: seq, e_id}), reads the documents past the last
+    sequence it processed and drops those e_ids from its local cache. While the
+    Mongo breaker is open the thread leaves Mongo alone and the queue is sent after
+    recovery. Numbers are taken before the insert, so a gap may be an insert still
+    on its way: the poller waits for it (up to PRINCIPAL_CACHE_GAP_SECONDS) instead
+    of moving past it. Entries expire after PRINCIPAL_CACHE_INVALIDATION_TTL seconds.
+    """
+
+    def __init__(self, cache: PrincipalCache, poll_seconds: float = PRINCIPAL_CACHE_POLL_SECONDS):
+        self.cache = cache
+        self.poll_seconds = poll_seconds
+        self._last_seq = None
+        # sequences already applied past a gap, and when the oldest open gap was first seen
+        self._applied = set()
+        self._gap_since = None
+        self._indexes_ready = False
+        # e_ids waiting to be published, in arrival order
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _collection(self):
+        from app.database.mongodb_connection import get_mongodb
+        return get_mongodb()["principal_invalidations"]
+
+    def _next_seq(self) -> int:
+        from pymongo import ReturnDocument
+        from app.database.mongodb_connection import get_job_state_collection
+
+        counter = get_job_state_collection().find_one_and_update(
+            {"_id": _COUNTER_ID}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        return counter["seq"]
+
+    def _current_seq(self) -> int:
+        from app.database.mongodb_connection import get_job_state_collection
+
+        counter = get_job_state_collection().find_one({"_id": _COUNTER_ID})
+        return counter["seq"] if counter else 0
+
+    def _ensure_indexes(self):
+        self._collection().create_index("created_at", expireAfterSeconds=int(PRINCIPAL_CACHE_INVALIDATION_TTL))
+        self._indexes_ready = True
+
+    def publish(self, e_id: int):
+        """Queue an invalidation for the other workers; the channel thread sends it."""
+        with self._pending_lock:
+            self._pending[e_id] = None
+        self._wake.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _flush(self):
+        from datetime import datetime
+        with self._pending_lock:
+            e_ids = list(self._pending)
+        if not e_ids:
+            return
+        if not self._indexes_ready:
+            self._ensure_indexes()
+        for e_id in e_ids:
+            self._collection().insert_one({"_id": self._next_seq(), "e_id": e_id, "created_at": datetime.now()})
+            with self._pending_lock:
+                self._pending.pop(e_id, None)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="principal-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread = None
+
+    def _run(self):
+        from app.database.mongo_health import mongo_breaker, is_mongo_unavailable
+
+        while not self._stop.is_set():
+            # during an outage the queue waits for the probe to close the breaker
+            if not mongo_breaker.is_open:
+                try:
+                    self._flush()
+                    self._poll()
+                except Exception as e:
+                    if is_mongo_unavailable(e):
+                        mongo_breaker.record_failure()
+                    logger.warning(f"Principal invalidation sync failed: {str(e)}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _poll(self):
+        if self._last_seq is None:
+            # only events published after this worker started are relevant
+            if not self._indexes_ready:
+                self._ensure_indexes()
+            self._last_seq = self._current_seq()
+            return
+        for doc in self._collection().find({"_id": {"$gt": self._last_seq}}).sort("_id", 1):
+            seq = doc["_id"]
+            if seq not in self._applied:
+                self._applied.add(seq)
+                self.cache.invalidate(doc["e_id"], broadcast=False)
+        self._advance()
+
+    def _advance(self):
+        # move the mark over every contiguous sequence; hold it at a gap until it fills or times out
+        while self._applied:
+            if self._last_seq + 1 in self._applied:
+                self._last_seq += 1
+                self._applied.discard(self._last_seq)
+                self._gap_since = None
+                continue
+            now = time.monotonic()
+            if self._gap_since is None:
+                self._gap_since = now
+            elif now - self._gap_since >= PRINCIPAL_CACHE_GAP_SECONDS:
+                # the publisher died between taking a number and inserting; skip the hole
+                self._last_seq = min(self._applied) - 1
+                self._gap_since = None
+                continue
+            break
+
+
+principal_cache = PrincipalCache()
+
+
+def start_invalidation_channel():
+    """Attach and start the configured cross-worker channel (no-op when not configured)."""
+    if PRINCIPAL_CACHE_CHANNEL == "mongo" and principal_cache.channel is None:
+        principal_cache.channel = MongoInvalidationChannel(principal_cache)
+        principal_cache.channel.start()
+
+
+def stop_invalidation_channel():
+    if principal_cache.channel is not None:
+        principal_cache.channel.stop()
@@ -0,0 +1,106 @@
+"""
+Deferred notification upkeep for SQL task changes
+update_task and delete_task only queue the Mongo side of a change of
+recipients (retargeting the task's remarks, recounting badges); a background
+task applies it. While the Mongo breaker is open the work stays queued, keyed
+by task so only the latest recipients are applied, and is retried on recovery
+"""
+from app.database.mongo_health import mongo_breaker, is_mongo_unavailable, MONGO_PROBE_INTERVAL
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RemarkSync:
+    def __init__(self, retry_seconds: float = MONGO_PROBE_INTERVAL):
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        # task id -> recipients its remarks should carry; users whose unread counter needs a recount
+        self._tasks = {}
+        self._users = set()
+        self._wake = asyncio.Event()
+        self._task = None
+        self.applied = 0
+        self.retries = 0
+        self.errors = 0
+
+    def retarget(self, task_id: int, targets: list, users):
+        """Queue new recipients for a task's remarks and a recount for everyone who gained or lost them."""
+        with self._lock:
+            self._tasks[task_id] = list(targets)
+            self._users.update(u for u in users if u is not None)
+        self._ensure_running()
+        self._wake.set()
+
+    def forget_task(self, task_id: int, users):
+        """A deleted task's remarks notify nobody; its former recipients get recounted."""
+        self.retarget(task_id, [], users)
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            timeout = self.retry_seconds if self._tasks or self._users else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if mongo_breaker.is_open:
+                continue
+            with self._lock:
+                tasks, users = self._tasks, self._users
+                self._tasks, self._users = {}, set()
+            if not tasks and not users:
+                continue
+            try:
+                await asyncio.to_thread(_apply, tasks, users)
+                self.applied += len(tasks)
+            except Exception as e:
+                if not is_mongo_unavailable(e):
+                    self.errors += 1
+                    logger.warning(f"Failed to retarget remarks of tasks {sorted(tasks)}: {str(e)}")
+                    continue
+                mongo_breaker.record_failure()
+                self.retries += 1
+                # both steps are idempotent; anything queued since is newer and wins
+                with self._lock:
+                    for task_id, targets in tasks.items():
+                        self._tasks.setdefault(task_id, targets)
+                    self._users.update(users)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending_tasks": len(self._tasks),
+                "pending_recounts": len(self._users),
+                "applied": self.applied,
+                "retries": self.retries,
+                "errors": self.errors,
+            }
+
+
+def _apply(tasks: dict, users: set):
+    from app.crud.remarks_crud import retarget_remarks
+    from app.crud.notification_crud import recount_unread
+
+    for task_id, targets in tasks.items():
+        retarget_remarks(task_id, targets)
+    for e_id in users:
+        recount_unread(e_id)
+
+
+remark_sync = RemarkSync()
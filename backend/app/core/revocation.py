@@ -0,0 +1,109 @@
+"""
+In-memory token version / revocation table for the stateless JWT fast path
+A token's embedded claims are trusted only while its `ver` matches the
+user's current token_version here; everything else falls back to the DB
+"""
+from dotenv import load_dotenv
+import asyncio
+import logging
+import os
+import threading
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# sign roles/status/version into access tokens and accept them without a DB lookup
+JWT_EMBED_CLAIMS = os.getenv("JWT_EMBED_CLAIMS", "false").lower() == "true"
+JWT_REVOCATION_REFRESH_SECONDS = float(os.getenv("JWT_REVOCATION_REFRESH_SECONDS", "5"))
+
+
+class TokenStateTable:
+    """e_id -> (token_version, status) snapshot of the users table, refreshed in the background."""
+
+    def __init__(self, max_age: float = JWT_REVOCATION_REFRESH_SECONDS * 3):
+        self.max_age = max_age
+        self._versions = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def replace(self, rows):
+        versions = {e_id: (version, status) for e_id, version, status in rows}
+        with self._lock:
+            self._versions = versions
+            self._loaded_at = time.monotonic()
+            self.refreshes += 1
+
+    def update(self, e_id: int, version: int, status):
+        """Apply a local change immediately, without waiting for the next refresh."""
+        with self._lock:
+            self._versions[e_id] = (version, status)
+
+    def revoke(self, e_id: int):
+        with self._lock:
+            self._versions.pop(e_id, None)
+
+    def is_current(self, e_id: int, version) -> bool:
+        """True only when the snapshot is fresh, knows e_id, and the versions match."""
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age:
+                return False
+            entry = self._versions.get(e_id)
+        return entry is not None and entry[0] == version
+
+    def stats(self) -> dict:
+        with self._lock:
+            age = time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+            return {
+                "enabled": JWT_EMBED_CLAIMS,
+                "users": len(self._versions),
+                "age_seconds": round(age, 3) if age is not None else None,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+            }
+
+
+token_state = TokenStateTable()
+
+
+async def refresh_token_state():
+    from app.crud.users_crud import get_token_states
+    from app.database.mysql_connection import get_async_connection
+
+    session = get_async_connection()
+    try:
+        token_state.replace(await get_token_states(session))
+    finally:
+        await session.close()
+
+
+async def _refresh_loop():
+    while True:
+        try:
+            await refresh_token_state()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            token_state.refresh_errors += 1
+            logger.warning(f"Token state refresh failed: {str(e)}")
+        await asyncio.sleep(JWT_REVOCATION_REFRESH_SECONDS)
+
+
+_refresh_task = None
+
+
+def start_token_state_refresh():
+    """Start the background refresher when the claims fast path is enabled."""
+    global _refresh_task
+    if JWT_EMBED_CLAIMS and _refresh_task is None:
+        _refresh_task = asyncio.get_running_loop().create_task(_refresh_loop())
+
+
+def stop_token_state_refresh():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        _refresh_task = None
@@ -5,6 +5,12 @@ from datetime import datetime, timezone, timedelta
 from typing import Optional
 from app.models.models import UserReqRes, Token, LoginRequest
 from app.crud.users_crud import get_user_by_id
+from app.core.dependencies import get_db
+from app.database.mysql_connection import get_async_connection
+from app.core.principal_cache import principal_cache
+from app.core.revocation import token_state, JWT_EMBED_CLAIMS
+from app.middleware.request_timing import timed_phase
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 import os
 load_dotenv()
@@ -18,16 +24,19 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 security = HTTPBearer()
 
 
-def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
+def create_access_token(subject: str, expires_delta: Optional[timedelta] = None, claims: Optional[dict] = None) -> str:
     to_encode = {"sub": subject}
+    if claims:
+        # e.g. roles/status/ver for the stateless fast path in get_current_user
+        to_encode.update(claims)
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def authenticate_user(e_id: int, password: str) -> Optional[UserReqRes]:
+async def authenticate_user(session: AsyncSession, e_id: int, password: str) -> Optional[UserReqRes]:
     try:
-        user = get_user_by_id(e_id)
+        user = await get_user_by_id(session, e_id)
     except Exception:
         return None
     # users_crud returns UserReqRes with password field
@@ -36,8 +45,43 @@ def authenticate_user(e_id: int, password: str) -> Optional[UserReqRes]:
     return user
 
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserReqRes:
-    token = credentials.credentials
+def _principal_from_claims(e_id: int, payload: dict) -> Optional[UserReqRes]:
+    """Build the principal from verified token claims when the revocation table vouches for them."""
+    if not JWT_EMBED_CLAIMS or "ver" not in payload or "roles" not in payload or "status" not in payload:
+        return None
+    if not token_state.is_current(e_id, payload["ver"]):
+        return None
+    try:
+        return UserReqRes(e_id=e_id, roles=payload["roles"], status=payload["status"])
+    except ValueError:
+        return None
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    session: AsyncSession = Depends(get_db),
+) -> UserReqRes:
+    # reported as the `auth` entry of the Server-Timing header
+    with timed_phase("auth"):
+        return await _resolve_principal(credentials.credentials, session)
+
+
+async def get_stream_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserReqRes:
+    """get_current_user for long-lived responses (SSE).
+
+    Does not use the request-scoped session, which would stay open for the life
+    of the stream: a principal-cache miss loads the user on a session of its own
+    that is closed (and its connection returned to the pool) before the route runs.
+    """
+    with timed_phase("auth"):
+        session = get_async_connection()
+        try:
+            return await _resolve_principal(credentials.credentials, session)
+        finally:
+            await session.close()
+
+
+async def _resolve_principal(token: str, session: AsyncSession) -> UserReqRes:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
@@ -48,8 +92,30 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
 
     try:
-        user = get_user_by_id(int(user_id))
+        e_id = int(user_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+
+    user = _principal_from_claims(e_id, payload)
+    if user is not None:
+        return user
+
+    user = principal_cache.get(e_id)
+    if user is not None:
+        return user
+
+    try:
+        user = await get_user_by_id(session, e_id)
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
-    return user
\ No newline at end of file
+    # only what authorization needs; the password hash is neither cached nor handed to routes
+    user = UserReqRes(e_id=user.e_id, roles=user.roles, status=user.status)
+    principal_cache.put(e_id, user)
+    return user
+
+
+async def require_admin(user: UserReqRes = Depends(get_current_user)) -> UserReqRes:
+    if "Admin" not in user.roles:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin role required")
+    return user
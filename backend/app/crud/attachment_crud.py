@@ -1,78 +1,144 @@
 import os
-from app.database.mysql_connection import get_connection
-from app.schemas.schemas import AttachmentSchema
+from app.schemas.schemas import AttachmentSchema, TaskSchema
 from app.models.models import TaskReqRes
+from app.utils.blob_store import release_blob
+from app.utils.attachment_io import run_io, discard
+from sqlalchemy import select, or_
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 from datetime import datetime
 
 
-def add_attachment(task_id: int, filename: str, filepath: str, remark: str, user):
-    session = None
+def _to_dict(att: AttachmentSchema) -> dict:
+    return {
+        "id": att.id,
+        "task_id": att.task_id,
+        "filename": att.filename,
+        "filepath": att.filepath,
+        "blob_id": att.blob_id,
+        "remark": att.remark,
+        "created_by": att.created_by,
+        "created_at": att.created_at.isoformat() if att.created_at else None,
+    }
+
+
+async def release_attachment_file(att):
+    """Drop the attachment's reference to its blob, or remove a pre-blob-store file from disk."""
+    try:
+        if att.blob_id:
+            await run_io(release_blob, att.blob_id)
+        elif att.filepath and os.path.exists(att.filepath):
+            await run_io(discard, att.filepath)
+    except Exception:
+        # ignore file deletion failures
+        pass
+
+
+async def add_attachment(session: AsyncSession, task_id: int, filename: str, filepath: str, remark: str, user, blob_id: str = None):
     try:
-        session = get_connection()
         att = AttachmentSchema(
             task_id=task_id,
             filename=filename,
             filepath=filepath,
+            blob_id=blob_id,
             remark=remark,
             created_by=user.e_id,
             created_at=datetime.now(),
         )
         session.add(att)
-        session.commit()
-        session.refresh(att)
-        return {
-            "id": att.id,
-            "task_id": att.task_id,
-            "filename": att.filename,
-            "filepath": att.filepath,
-            "remark": att.remark,
-            "created_by": att.created_by,
-            "created_at": att.created_at.isoformat(),
-        }
+        await session.commit()
+        return _to_dict(att)
     except SQLAlchemyError as e:
-        if session:
-            session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        if session:
-            session.close()
 
 
-def get_attachments(task_id: int):
-    session = None
+async def replace_attachments(session: AsyncSession, task_id: int, filename: str, blob_id: str, remark: str, user,
+                              filepath: str = None):
+    """Swap the user's previous attachments on the task for a new one in a single commit.
+
+    The new row references `blob_id` (the caller already holds a reference for
+    it), or a file on disk at `filepath` when blob_id is None; the rows it
+    replaced release their files only after the commit.
+    """
     try:
-        session = get_connection()
-        rows = session.query(AttachmentSchema).filter(AttachmentSchema.task_id == task_id).all()
-        return [
-            {
-                "id": r.id,
-                "task_id": r.task_id,
-                "filename": r.filename,
-                "filepath": r.filepath,
-                "remark": r.remark,
-                "created_by": r.created_by,
-                "created_at": r.created_at.isoformat() if r.created_at else None,
-            }
-            for r in rows
-        ]
+        old = (await session.execute(
+            select(AttachmentSchema).where(
+                AttachmentSchema.task_id == task_id,
+                AttachmentSchema.created_by == user.e_id,
+            )
+        )).scalars().all()
+        for r in old:
+            await session.delete(r)
+        att = AttachmentSchema(
+            task_id=task_id,
+            filename=filename,
+            # blob rows are served by the /uploads/<task_id>/<filename> route from the blob store
+            filepath=filepath or f"/uploads/{task_id}/{filename}",
+            blob_id=blob_id,
+            remark=remark,
+            created_by=user.e_id,
+            created_at=datetime.now(),
+        )
+        session.add(att)
+        await session.commit()
     except SQLAlchemyError as e:
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        if session:
-            session.close()
+    for r in old:
+        await release_attachment_file(r)
+    return _to_dict(att)
 
 
-def delete_attachment_by_id(attachment_id: int, user=None):
-    """Delete an attachment record and its file from disk.
+async def get_attachments(session: AsyncSession, task_id: int):
+    try:
+        rows = (await session.execute(
+            select(AttachmentSchema).where(AttachmentSchema.task_id == task_id)
+        )).scalars().all()
+        return [_to_dict(r) for r in rows]
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+async def find_attachment(session: AsyncSession, task_id: int, filename: str):
+    """Newest attachment of the task with that file name (the /uploads/<task_id>/<filename> links)."""
+    try:
+        return (await session.execute(
+            select(AttachmentSchema)
+            .where(AttachmentSchema.task_id == task_id, AttachmentSchema.filename == filename)
+            .order_by(AttachmentSchema.id.desc())
+            .limit(1)
+        )).scalars().first()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+async def blob_visible(session: AsyncSession, user, blob_id: str) -> bool:
+    """True when the content is attached to a task the user can see, or was attached by them.
+
+    Managers and admins see every task; anyone else sees the tasks assigned to them.
+    """
+    try:
+        query = (
+            select(AttachmentSchema.id)
+            .join(TaskSchema, TaskSchema.t_id == AttachmentSchema.task_id)
+            .where(AttachmentSchema.blob_id == blob_id)
+        )
+        if not {"Manager", "Admin"} & set(user.roles or []):
+            query = query.where(or_(AttachmentSchema.created_by == user.e_id, TaskSchema.assigned_to == user.e_id))
+        return (await session.execute(query.limit(1))).first() is not None
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+async def delete_attachment_by_id(session: AsyncSession, attachment_id: int, user=None):
+    """Delete an attachment record and release its file.
 
     Only ADMIN or the creator of the attachment can delete.
     """
-    session = None
     try:
-        session = get_connection()
-        att = session.query(AttachmentSchema).filter(AttachmentSchema.id == attachment_id).first()
+        att = await session.get(AttachmentSchema, attachment_id)
         if not att:
             raise HTTPException(status_code=404, detail="Attachment not found")
 
@@ -80,53 +146,36 @@ def delete_attachment_by_id(attachment_id: int, user=None):
         if getattr(user, "e_id", None) != att.created_by and not (hasattr(user, "roles") and "Admin" in user.roles):
             raise HTTPException(status_code=403, detail="Not allowed to delete this attachment")
 
-        # delete physical file if exists
-        try:
-            if att.filepath and os.path.exists(att.filepath):
-                os.remove(att.filepath)
-        except Exception:
-            # ignore file deletion failures
-            pass
-
-        session.delete(att)
-        session.commit()
+        await session.delete(att)
+        await session.commit()
+        # the blob loses this reference only once the row is gone
+        await release_attachment_file(att)
         return {"detail": "Attachment deleted", "id": attachment_id}
     except SQLAlchemyError as e:
-        if session:
-            session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        if session:
-            session.close()
 
 
-def delete_attachments_by_task_and_creator(task_id: int, creator_id: int):
+async def delete_attachments_by_task_and_creator(session: AsyncSession, task_id: int, creator_id: int):
     """Remove existing attachments for a task created by the same user.
 
     Returns list of deleted ids.
     """
-    session = None
     deleted_ids = []
     try:
-        session = get_connection()
-        rows = session.query(AttachmentSchema).filter(
-            AttachmentSchema.task_id == task_id,
-            AttachmentSchema.created_by == creator_id,
-        ).all()
+        rows = (await session.execute(
+            select(AttachmentSchema).where(
+                AttachmentSchema.task_id == task_id,
+                AttachmentSchema.created_by == creator_id,
+            )
+        )).scalars().all()
         for r in rows:
-            try:
-                if r.filepath and os.path.exists(r.filepath):
-                    os.remove(r.filepath)
-            except Exception:
-                pass
             deleted_ids.append(r.id)
-            session.delete(r)
-        session.commit()
+            await session.delete(r)
+        await session.commit()
+        for r in rows:
+            await release_attachment_file(r)
         return deleted_ids
     except SQLAlchemyError as e:
-        if session:
-            session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        if session:
-            session.close()
@@ -1,13 +1,13 @@
-from app.database.mysql_connection import get_connection
 from app.models.models import EmployeeReqRes  # Pydantic Model
 from app.schemas.schemas import EmployeeSchema
+from sqlalchemy import select, func
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 
 
-def add_emplyee(new_emp: EmployeeReqRes):
+async def add_emplyee(session: AsyncSession, new_emp: EmployeeReqRes):
     try:
-        session = get_connection()
         new_employee = EmployeeSchema(
             name=new_emp.name,
             email=new_emp.email,
@@ -15,17 +15,14 @@ def add_emplyee(new_emp: EmployeeReqRes):
             mgr_id=new_emp.mgr_id
         )
         session.add(new_employee)
-        session.commit()
-        session.refresh(new_employee)
+        await session.commit()
         return EmployeeReqRes.model_validate(new_employee)  # Convert to Pydantic model
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        session.close()
 
 
-def get_all_employees(mgr_id: int | None = None, designation: str | None = None):
+async def get_all_employees(session: AsyncSession, mgr_id: int | None = None, designation: str | None = None):
     """Return all employees, or filter by manager id and/or designation.
 
     Args:
@@ -33,87 +30,76 @@ def get_all_employees(mgr_id: int | None = None, designation: str | None = None)
         designation: optional designation (e.g. 'Developer', 'Manager') to filter by role/title
     """
     try:
-        session = get_connection()
-        query = session.query(EmployeeSchema)
+        query = select(EmployeeSchema)
         if mgr_id is not None:
-            query = query.filter(EmployeeSchema.mgr_id == mgr_id)
+            query = query.where(EmployeeSchema.mgr_id == mgr_id)
         if designation:
             # simple case-insensitive match
-            query = query.filter(EmployeeSchema.designation.ilike(f"%{designation}%"))
+            query = query.where(EmployeeSchema.designation.ilike(f"%{designation}%"))
 
-        employees = query.all()
+        employees = (await session.execute(query)).scalars().all()
         return [EmployeeReqRes.model_validate(emp) for emp in employees]  # Convert to list of Pydantic models
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        session.close()
 
 
-def get_by_employee_id(id: int):
+async def get_by_employee_id(session: AsyncSession, id: int):
     try:
-        session = get_connection()
-        emp = session.query(EmployeeSchema).filter(EmployeeSchema.e_id == id).first()
+        emp = await session.get(EmployeeSchema, id)
         if not emp:
             raise HTTPException(status_code=404, detail="Employee Not Found")
         return EmployeeReqRes.model_validate(emp)  # Convert to Pydantic model
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        session.close()
 
 
-def update_employee(id: int, updated: dict):
+async def update_employee(session: AsyncSession, id: int, updated: dict):
     try:
-        session = get_connection()
-        emp = session.query(EmployeeSchema).filter(EmployeeSchema.e_id == id).first()
+        emp = await session.get(EmployeeSchema, id)
         if not emp:
             raise HTTPException(status_code=404, detail="Employee Not Found")
         for key, value in updated.items():
             setattr(emp, key, value)
-        session.commit()
-        session.refresh(emp)
+        await session.commit()
         return EmployeeReqRes.model_validate(emp)  # Convert to Pydantic model
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        session.close()
 
 
-def delete_employee(id: int):
+async def delete_employee(session: AsyncSession, id: int):
     try:
-        session = get_connection()
-        emp = session.query(EmployeeSchema).filter(EmployeeSchema.e_id == id).first()
+        emp = await session.get(EmployeeSchema, id)
         if not emp:
             raise HTTPException(status_code=404, detail="Employee Not Found")
 
         # Prevent deletion if this employee is referenced by any tasks (strong FK constraints)
         from app.schemas.schemas import TaskSchema
 
-        refs = session.query(TaskSchema).filter(
-            (TaskSchema.assigned_to == id)
-            | (TaskSchema.assigned_by == id)
-            | (TaskSchema.reviewer == id)
-            | (TaskSchema.created_by == id)
-            | (TaskSchema.updated_by == id)
-        ).all()
+        refs = (await session.execute(
+            select(func.count()).select_from(TaskSchema).where(
+                (TaskSchema.assigned_to == id)
+                | (TaskSchema.assigned_by == id)
+                | (TaskSchema.reviewer == id)
+                | (TaskSchema.created_by == id)
+                | (TaskSchema.updated_by == id)
+            )
+        )).scalar_one()
 
-        if refs and len(refs) > 0:
+        if refs > 0:
             raise HTTPException(
                 status_code=400,
                 detail=(
-                    f"Employee cannot be deleted: referenced by {len(refs)} task(s). "
+                    f"Employee cannot be deleted: referenced by {refs} task(s). "
                     "Reassign or remove those tasks before deleting the employee."
                 ),
             )
 
-        session.delete(emp)
-        session.commit()
+        await session.delete(emp)
+        await session.commit()
         return {"detail": "Employee Deleted Successfully"}
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        session.close()
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""
+Per-user notification read state
+One document per user in `notification_state`: a watermark (everything
+created at or before it is read), the ids of newer remarks read one by one,
+and an `unread` counter kept in step with remark inserts, reads and deletes
+so the badge is a primary-key lookup. Every write bumps `ver`, so a recount
+only stores its result if nothing changed the counter while it was counting
+"""
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from datetime import datetime, timezone
+from itertools import groupby
+from app.database.mongodb_connection import get_remarks_collection, get_notification_state_collection
+
+# recounts retried when a concurrent write changed the state under them
+_RECOUNT_ATTEMPTS = 5
+
+
+def _newer_than_watermark(created_at) -> dict:
+    return {"$or": [{"watermark": None}, {"watermark": {"$lt": created_at}}]}
+
+
+def _unread_filter(e_id: int, watermark, read: list) -> dict:
+    # remarks marked read through the old read_by array stay read
+    query = {"notify_to": e_id, "read_by": {"$ne": e_id}}
+    if watermark is not None:
+        query["created_at"] = {"$gt": watermark}
+    if read:
+        query["_id"] = {"$nin": read}
+    return query
+
+
+def _create_state(e_id: int):
+    from pymongo.errors import DuplicateKeyError
+
+    try:
+        get_notification_state_collection().insert_one({"_id": e_id, "watermark": None, "read": [], "unread": 0, "ver": 0})
+    except DuplicateKeyError:
+        pass
+
+
+def recount_unread(e_id: int) -> int:
+    """Recompute the counter from the remarks (first use, or after a task changed hands)."""
+    state = get_notification_state_collection()
+    unread = 0
+    for _ in range(_RECOUNT_ATTEMPTS):
+        doc = state.find_one({"_id": e_id})
+        if doc is None:
+            # exists before counting, so a remark counted in the meantime bumps ver and forces a retry
+            _create_state(e_id)
+            continue
+        unread = get_remarks_collection().count_documents(_unread_filter(e_id, doc.get("watermark"), doc.get("read", [])))
+        # states written before `ver` existed have no field; {"ver": None} matches them
+        result = state.update_one({"_id": e_id, "ver": doc.get("ver")}, {"$set": {"unread": unread}, "$inc": {"ver": 1}})
+        if result.matched_count:
+            break
+    return unread
+
+
+def unread_count(e_id: int) -> int:
+    doc = get_notification_state_collection().find_one({"_id": e_id}, {"unread": 1})
+    if doc is None:
+        return recount_unread(e_id)
+    return max(doc.get("unread", 0), 0)
+
+
+def count_new_remark(targets: list, created_at):
+    """Bump the counter of every recipient of a remark that was just inserted."""
+    if not targets:
+        return
+    # a mark-all-read that landed after the insert already covers this remark
+    get_notification_state_collection().update_many(
+        {"_id": {"$in": targets}, **_newer_than_watermark(created_at)},
+        {"$inc": {"unread": 1, "ver": 1}},
+    )
+
+
+def forget_remark(remark: dict):
+    """Drop a deleted remark from its recipients' counters and read sets."""
+    targets = [u for u in remark.get("notify_to") or [] if u not in (remark.get("read_by") or [])]
+    if not targets:
+        return
+    state = get_notification_state_collection()
+    state.update_many(
+        {"_id": {"$in": targets}, "read": {"$ne": remark["_id"]}, **_newer_than_watermark(remark["created_at"])},
+        {"$inc": {"unread": -1, "ver": 1}},
+    )
+    state.update_many({"_id": {"$in": targets}, "read": remark["_id"]}, {"$pull": {"read": remark["_id"]}, "$inc": {"ver": 1}})
+
+
+def mark_read(e_id: int, remark_id: str) -> bool:
+    """Mark one remark read; returns False when it was already read or not addressed to the user."""
+    try:
+        oid = ObjectId(remark_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid remark id")
+    remark = get_remarks_collection().find_one({"_id": oid}, {"created_at": 1, "notify_to": 1, "read_by": 1})
+    if not remark:
+        raise HTTPException(status_code=404, detail="Remark not found")
+    if e_id not in (remark.get("notify_to") or []) or e_id in (remark.get("read_by") or []):
+        return False
+    state = get_notification_state_collection()
+    if state.find_one({"_id": e_id}, {"_id": 1}) is None:
+        recount_unread(e_id)
+    # the filter makes a repeated or already-covered read a no-op, so the counter cannot drift
+    result = state.update_one(
+        {"_id": e_id, "read": {"$ne": oid}, **_newer_than_watermark(remark["created_at"])},
+        {"$push": {"read": oid}, "$inc": {"unread": -1, "ver": 1}},
+    )
+    if result.modified_count != 1:
+        return False
+    _compact_read(e_id)
+    return True
+
+
+def _compact_read(e_id: int):
+    """Advance the watermark over the oldest remarks that are all read and drop them from `read`.
+
+    Reading notifications oldest first therefore keeps `read` short without a
+    mark-all-read. The watermark covers a whole created_at value, so it stops
+    before a timestamp that still has an unread remark.
+    """
+    state = get_notification_state_collection()
+    doc = state.find_one({"_id": e_id}, {"watermark": 1, "read": 1, "ver": 1})
+    read = set(doc.get("read", [])) if doc else set()
+    if not read:
+        return
+    query = {"notify_to": e_id}
+    if doc.get("watermark") is not None:
+        query["created_at"] = {"$gt": doc["watermark"]}
+    # the remarks read one by one plus those read through read_by bound the walk
+    limit = len(read) * 2 + 1
+    remarks = list(
+        get_remarks_collection().find(query, {"created_at": 1, "read_by": 1}).sort([("created_at", 1), ("_id", 1)]).limit(limit)
+    )
+    groups = [(created_at, list(group)) for created_at, group in groupby(remarks, key=lambda r: r["created_at"])]
+    watermark, covered = None, []
+    for i, (created_at, group) in enumerate(groups):
+        if any(r["_id"] not in read and e_id not in (r.get("read_by") or []) for r in group):
+            break
+        if i == len(groups) - 1 and len(remarks) == limit:
+            # the walk may have cut this timestamp short
+            break
+        watermark = created_at
+        covered += [r["_id"] for r in group]
+    if watermark is None:
+        return
+    # a write since the read (new read, recount, mark-all-read) wins; the next read compacts again
+    state.update_one(
+        {"_id": e_id, "ver": doc.get("ver")},
+        {"$set": {"watermark": watermark}, "$pull": {"read": {"$in": covered}}, "$inc": {"ver": 1}},
+    )
+
+
+def mark_all_read(e_id: int):
+    """Move the watermark to now in one write; the per-remark read set is no longer needed."""
+    get_notification_state_collection().update_one(
+        {"_id": e_id},
+        {"$set": {"watermark": datetime.now(timezone.utc), "read": [], "unread": 0}, "$inc": {"ver": 1}},
+        upsert=True,
+    )
+
+
+def read_state(e_id: int):
+    """(watermark, set of read ids) for flagging a page of notifications."""
+    doc = get_notification_state_collection().find_one({"_id": e_id}, {"watermark": 1, "read": 1}) or {}
+    return doc.get("watermark"), set(doc.get("read", []))
+
+
+def is_read(remark: dict, e_id: int, watermark, read: set) -> bool:
+    if remark["_id"] in read or e_id in (remark.get("read_by") or []):
+        return True
+    created_at = remark.get("created_at")
+    if watermark is None or created_at is None:
+        return False
+    # pymongo hands back naive UTC datetimes
+    return created_at.replace(tzinfo=None) <= watermark.replace(tzinfo=None)
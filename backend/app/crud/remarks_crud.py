@@ -1,13 +1,241 @@
 from bson import ObjectId
+from bson.errors import InvalidId
 from fastapi import HTTPException
 from datetime import datetime, timezone
-from app.database.mysql_connection import get_connection
-from app.database.mongodb_connection import remarks_collection
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from app.database.mongodb_connection import get_remarks_collection
+from app.database.mongo_health import is_mongo_unavailable, mongo_breaker
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.schemas.schemas import TaskSchema
-from app.utils.file_upload import save_file, delete_file
+from app.utils.file_upload import delete_file
+from app.utils.blob_store import store_upload, add_ref, release_blob, is_blob_id
+from app.utils.attachment_io import run_io
+from app.crud.attachment_crud import blob_visible
 from app.utils.mongo_serializer import serialize_mongo
- 
+from app.utils.helpers import encode_cursor, decode_cursor
+from app.crud.notification_crud import count_new_remark, forget_remark
+from app.core.notification_hub import notification_hub
+from itertools import islice
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# newest-first notifications for one recipient; notify_to is multikey
+NOTIFY_INDEX = [("notify_to", 1), ("created_at", -1), ("_id", -1)]
+# a task's remarks in conversation order; also covers the page-boundary probe
+TASK_INDEX = [("task_id", 1), ("created_at", 1), ("_id", 1)]
+# /api/file/<file_id> downloads, and the visibility check for known-hash uploads
+FILE_INDEX = [("file_id", 1)]
+BLOB_INDEX = [("blob_id", 1), ("created_by", 1)]
+BACKFILL_BATCH = 1000
+
+# fields a remark listing may ask for; notify_to/read_by are internal
+REMARK_FIELDS = ("_id", "task_id", "comment", "created_by", "e_id", "role", "file_id", "file_name", "created_at", "updated_at")
+DEFAULT_REMARK_FIELDS = ("_id", "task_id", "comment", "created_by", "created_at")
+DEFAULT_REMARK_PAGE = 100
+MAX_REMARK_PAGE = 1000
+REMARK_STREAM_BATCH = 200
+
+
+def notify_targets(task, exclude=None) -> list:
+    """Users told about new remarks on `task` (assigner and reviewer), minus `exclude`."""
+    targets = []
+    for e_id in (task.assigned_by, task.reviewer):
+        if e_id is not None and e_id != exclude and e_id not in targets:
+            targets.append(e_id)
+    return targets
+
+
+def ensure_remark_indexes():
+    remarks = get_remarks_collection()
+    remarks.create_index(NOTIFY_INDEX, name="notify_to_created_at")
+    remarks.create_index(TASK_INDEX, name="task_id_created_at")
+    remarks.create_index(FILE_INDEX, name="file_id")
+    remarks.create_index(BLOB_INDEX, name="blob_id_created_by", sparse=True)
+
+
+def retarget_remarks(task_id: int, targets: list):
+    """Recompute notify_to on a task's remarks after its assigner or reviewer changed."""
+    # pipeline update so each remark still excludes its own author
+    get_remarks_collection().update_many(
+        {"task_id": task_id},
+        [{"$set": {"notify_to": {"$setDifference": [targets, ["$created_by"]]}}}],
+    )
+
+
+def backfill_notify_to() -> int:
+    """Fill notify_to on remarks written before it existed; returns the number updated."""
+    from pymongo import UpdateOne
+    from sqlalchemy import select
+    from app.database.mysql_connection import get_connection
+
+    remarks = get_remarks_collection()
+    updated = 0
+    while True:
+        batch = list(remarks.find({"notify_to": {"$exists": False}}, {"task_id": 1, "created_by": 1}).limit(BACKFILL_BATCH))
+        if not batch:
+            return updated
+        task_ids = {d.get("task_id") for d in batch}
+        session = get_connection()
+        try:
+            tasks = {t.t_id: t for t in session.execute(select(TaskSchema).where(TaskSchema.t_id.in_(task_ids))).scalars()}
+        finally:
+            session.close()
+        # remarks of deleted tasks get an empty list so they are not picked up again
+        updates = [
+            UpdateOne({"_id": d["_id"]}, {"$set": {"notify_to": notify_targets(tasks[d["task_id"]], d.get("created_by")) if d.get("task_id") in tasks else []}})
+            for d in batch
+        ]
+        remarks.bulk_write(updates, ordered=False)
+        updated += len(updates)
+
+
+def _remark_position(cursor: str):
+    """(created_at, _id) of the last remark of the previous page."""
+    data = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(data["c"]), ObjectId(data["i"])
+    except (KeyError, TypeError, ValueError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _remark_cursor(doc: dict) -> str:
+    return encode_cursor({"c": doc["created_at"].isoformat(), "i": str(doc["_id"])})
+
+
+def _after(cursor: str, op: str) -> dict:
+    created_at, last_id = _remark_position(cursor)
+    return {"$or": [
+        {"created_at": {op: created_at}},
+        {"created_at": created_at, "_id": {op: last_id}},
+    ]}
+
+
+def get_notifications(e_id: int, cursor: str | None = None, limit: int = 50):
+    """One page of remarks addressed to `e_id`, newest first, and the cursor for the next page."""
+    query = {"notify_to": e_id}
+    if cursor:
+        query.update(_after(cursor, "$lt"))
+    docs = list(
+        get_remarks_collection().find(query).sort([("created_at", -1), ("_id", -1)]).limit(limit + 1)
+    )
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = _remark_cursor(docs[-1])
+    return docs, next_cursor
+
+
+def remark_projection(fields: str | None) -> dict:
+    """Mongo projection for a comma-separated `fields` list (DEFAULT_REMARK_FIELDS when omitted)."""
+    names = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(DEFAULT_REMARK_FIELDS)
+    unknown = [f for f in names if f not in REMARK_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown remark fields: {', '.join(unknown)}")
+    projection = {f: 1 for f in names}
+    if "_id" not in projection:
+        projection["_id"] = 0
+    return projection
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def page_remarks_by_task(task_id: int, cursor: str | None = None, limit: int = DEFAULT_REMARK_PAGE, fields: str | None = None):
+    """One page of a task's remarks, oldest first, as an iterator of JSON array chunks, plus the next cursor.
+
+    The next cursor is found first with a probe served from the index alone, so
+    it can go in a header while the page itself is serialised straight off the
+    Mongo cursor in REMARK_STREAM_BATCH-sized chunks. The first batch is read
+    before the response starts, so an unreachable server still gets an error
+    status; if a later batch fails, the array ends with a {"error", "truncated"}
+    record instead of being cut off.
+    """
+    projection = remark_projection(fields)
+    query = {"task_id": task_id}
+    if cursor:
+        query.update(_after(cursor, "$gt"))
+    order = [("created_at", 1), ("_id", 1)]
+    remarks = get_remarks_collection()
+
+    probe = list(remarks.find(query, {"created_at": 1}).sort(order).skip(limit - 1).limit(2))
+    next_cursor = _remark_cursor(probe[0]) if len(probe) == 2 else None
+    if not cursor and not probe and remarks.find_one(query, {"_id": 1}) is None:
+        raise HTTPException(status_code=404, detail="No remarks found for task")
+
+    docs = remarks.find(query, projection).sort(order).limit(limit).batch_size(REMARK_STREAM_BATCH)
+    try:
+        head = list(islice(docs, REMARK_STREAM_BATCH))
+    except BaseException:
+        docs.close()
+        raise
+
+    def serialise(doc) -> str:
+        if "_id" in doc:
+            doc["_id"] = str(doc["_id"])
+        return json.dumps(doc, default=_json_default)
+
+    def chunks():
+        first = True
+
+        def piece(batch):
+            nonlocal first
+            text = ("" if first else ",") + ",".join(batch)
+            first = False
+            return text.encode("utf-8")
+
+        try:
+            yield b"["
+            if head:
+                yield piece([serialise(doc) for doc in head])
+            batch = []
+            try:
+                for doc in docs:
+                    batch.append(serialise(doc))
+                    if len(batch) >= REMARK_STREAM_BATCH:
+                        yield piece(batch)
+                        batch = []
+            except Exception as e:
+                # the 200 is already sent; end the array with a record the client can detect
+                if is_mongo_unavailable(e):
+                    mongo_breaker.record_failure()
+                logger.warning(f"Remark listing for task {task_id} failed mid-stream: {str(e)}")
+                batch.append(json.dumps({"error": "Remark listing was interrupted", "truncated": True}))
+            if batch:
+                yield piece(batch)
+            yield b"]"
+        finally:
+            docs.close()
+
+    return chunks(), next_cursor
+
+
+def replay_notifications(e_id: int, last_event_id: str, limit: int):
+    """Remarks for `e_id` after the one whose id is `last_event_id`, oldest first; None when more than `limit`."""
+    try:
+        last_id = ObjectId(last_event_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    remarks = get_remarks_collection()
+    last = remarks.find_one({"_id": last_id}, {"created_at": 1})
+    # a deleted remark still dates itself through its ObjectId
+    created_at = last["created_at"] if last else last_id.generation_time.replace(tzinfo=None)
+    docs = list(
+        remarks.find({
+            "notify_to": e_id,
+            "$or": [
+                {"created_at": {"$gt": created_at}},
+                {"created_at": created_at, "_id": {"$gt": last_id}},
+            ],
+        }).sort([("created_at", 1), ("_id", 1)]).limit(limit + 1)
+    )
+    return None if len(docs) > limit else docs
+
+
 def _is_manager(user) -> bool:
     return hasattr(user, "role") and ("Manager" in user.role if isinstance(user.role, list) else "Manager" in str(user.role))
 
@@ -16,15 +244,16 @@ def _is_developer(user) -> bool:
     return hasattr(user, "role") and ("Developer" in user.role if isinstance(user.role, list) else "Developer" in str(user.role))
 
 
-def add_remark(task_id: int, comment: str, e_id: int, file=None, role: str = None, user=None):
+async def add_remark(session: AsyncSession, task_id: int, comment: str, e_id: int, file=None, role: str = None, user=None,
+                     sha256: str = None, file_name: str = None):
     """Add a remark for a task. Allow any role/phase to create a remark (development/dev requirement).
 
-    The function will persist the optional file to GridFS and store both `created_by` and `e_id`
-    fields so downstream code that expects either name will work.
+    The function will persist the optional file to the blob store and store both `created_by` and `e_id`
+    fields so downstream code that expects either name will work. The task lookup uses the
+    request's session; file and Mongo calls are blocking and run off the event loop.
     """
-    session: Session = get_connection()
     try:
-        task = session.query(TaskSchema).filter(TaskSchema.t_id == task_id).first()
+        task = await session.get(TaskSchema, task_id)
         if not task:
             raise HTTPException(status_code=404, detail="Task not found")
 
@@ -32,11 +261,23 @@ def add_remark(task_id: int, comment: str, e_id: int, file=None, role: str = Non
         # and delegates fine-grained permission checks to higher-level business logic when needed.
 
         # Handle file upload (optional)
-        file_id = None
-        file_name = None
+        file_id = blob_id = None
         if file:
-            file_id = save_file(file)
+            blob_id = await run_io(store_upload, file)
             file_name = file.filename
+        elif sha256:
+            # content the user can already see is referenced without another upload
+            blob_id = sha256.lower()
+            if not is_blob_id(blob_id):
+                raise HTTPException(status_code=400, detail="Invalid sha256")
+            if not await can_link_blob(session, user, blob_id) or not await run_io(add_ref, blob_id):
+                raise HTTPException(status_code=404, detail="Unknown content; upload the file")
+            file_name = file_name or blob_id
+        else:
+            file_name = None
+        if blob_id:
+            # downloads go through this opaque id, never the content hash
+            file_id = str(ObjectId())
 
         remark = {
             "task_id": task_id,
@@ -45,62 +286,57 @@ def add_remark(task_id: int, comment: str, e_id: int, file=None, role: str = Non
             "created_by": e_id,
             "e_id": e_id,
             "role": role,
+            # denormalised recipients so notifications are one indexed query
+            "notify_to": notify_targets(task, exclude=e_id),
             "file_id": file_id,
             "file_name": file_name,
+            "blob_id": blob_id,
             "created_at": datetime.now(timezone.utc),
         }
-        result = remarks_collection.insert_one(remark)
+        try:
+            result = await run_in_threadpool(get_remarks_collection().insert_one, remark)
+        except BaseException:
+            if blob_id:
+                await run_io(release_blob, blob_id)
+            raise
         remark["_id"] = result.inserted_id
+        await run_in_threadpool(count_new_remark, remark["notify_to"], remark["created_at"])
+        notification_hub.publish(remark)
         return serialize_mongo(remark)
     except HTTPException:
         raise
     except Exception as e:
+        if is_mongo_unavailable(e):
+            raise  # error handler turns this into a 503 and trips the breaker
         # wrap unexpected errors
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
  
  
-def get_remarks_by_task(task_id: int):
-    docs = list(remarks_collection.find({"task_id": task_id}))
-    return [serialize_mongo(d) for d in docs]
-
-
-def update_remark(remark_id: str, comment: str | None, file, e_id: int, role: str):
-    remark = remarks_collection.find_one({"_id": ObjectId(remark_id)})
-    if not remark:
-        raise HTTPException(status_code=404, detail="Remark not found")
-
-    # Only admin or owner can update
-    if not (role and role.upper() == "ADMIN") and remark.get("created_by") != e_id:
-        raise HTTPException(status_code=403, detail="Not allowed to update this remark")
-
-    update_data = {}
-    if comment:
-        update_data["comment"] = comment
+async def can_link_blob(session: AsyncSession, user, blob_id: str) -> bool:
+    """True when the user can already read content with this hash, so linking it by hash reveals nothing.
 
-    if file:
-        if remark.get("file_id"):
-            try:
-                delete_file(remark["file_id"])
-            except Exception:
-                pass
-
-        file_id = save_file(file)
-        update_data["file_id"] = file_id
-        update_data["file_name"] = file.filename
+    That is an attachment on a task they can see, or a remark they wrote or were
+    notified of; managers and admins see every remark. "Not visible" and "not
+    stored" must look the same to the caller.
+    """
+    if await blob_visible(session, user, blob_id):
+        return True
+    query = {"blob_id": blob_id}
+    if not {"Manager", "Admin"} & set(user.roles or []):
+        query["$or"] = [{"created_by": user.e_id}, {"notify_to": user.e_id}]
+    return await run_in_threadpool(get_remarks_collection().find_one, query, {"_id": 1}) is not None
 
-    if not update_data:
-        raise HTTPException(status_code=400, detail="Nothing to update")
 
-    update_data["updated_at"] = datetime.now(timezone.utc)
-    remarks_collection.update_one({"_id": ObjectId(remark_id)}, {"$set": update_data})
-    updated = remarks_collection.find_one({"_id": ObjectId(remark_id)})
-    return serialize_mongo(updated)
+def _release_file(remark: dict):
+    # blob store reference, or a GridFS file from before the blob store
+    if remark.get("blob_id"):
+        release_blob(remark["blob_id"])
+    elif remark.get("file_id"):
+        delete_file(str(remark["file_id"]))
 
 
 def delete_remark_by_id(remark_id: str, role: str, user):
-    remark = remarks_collection.find_one({"_id": ObjectId(remark_id)})
+    remark = get_remarks_collection().find_one({"_id": ObjectId(remark_id)})
     if not remark:
         raise HTTPException(status_code=404, detail="Remark not found")
 
@@ -108,13 +344,13 @@ def delete_remark_by_id(remark_id: str, role: str, user):
     if not (role and role.upper() == "ADMIN") and remark.get("created_by") != getattr(user, "e_id", None):
         raise HTTPException(status_code=403, detail="Not allowed to delete this remark")
 
-    if remark.get("file_id"):
-        try:
-            delete_file(str(remark["file_id"]))
-        except Exception:
-            pass
-
-    remarks_collection.delete_one({"_id": ObjectId(remark_id)})
+    get_remarks_collection().delete_one({"_id": ObjectId(remark_id)})
+    forget_remark(remark)
+    # the file goes only once the remark no longer points at it
+    try:
+        _release_file(remark)
+    except Exception as e:
+        logger.warning(f"Failed to release the file of remark {remark_id}: {str(e)}")
     return {"message": "Remark and file deleted successfully", "remark_id": remark_id}
  
  
@@ -125,7 +361,7 @@ def update_remark(
     e_id: int,
     role: str
 ):
-    remark = remarks_collection.find_one({"_id": ObjectId(remark_id)})
+    remark = get_remarks_collection().find_one({"_id": ObjectId(remark_id)})
  
     if not remark:
         raise HTTPException(status_code=404, detail="Remark not found")
@@ -141,11 +377,9 @@ def update_remark(
  
     # 📎 replace file if uploaded
     if file:
-        if remark.get("file_id"):
-            delete_file(remark["file_id"])
- 
-        file_id = save_file(file)
-        update_data["file_id"] = file_id
+        # store the new file first; a rejected upload must not lose the current one
+        update_data["blob_id"] = store_upload(file)
+        update_data["file_id"] = str(ObjectId())
         update_data["file_name"] = file.filename
  
     if not update_data:
@@ -153,28 +387,17 @@ def update_remark(
  
     update_data["updated_at"] = datetime.now(timezone.utc)
  
-    remarks_collection.update_one(
-        {"_id": ObjectId(remark_id)},
-        {"$set": update_data}
-    )
+    try:
+        get_remarks_collection().update_one(
+            {"_id": ObjectId(remark_id)},
+            {"$set": update_data}
+        )
+    except BaseException:
+        if file:
+            release_blob(update_data["blob_id"])
+        raise
+    if file:
+        _release_file(remark)
  
-    updated = remarks_collection.find_one({"_id": ObjectId(remark_id)})
+    updated = get_remarks_collection().find_one({"_id": ObjectId(remark_id)})
     return serialize_mongo(updated)
- 
- 
-def delete_remark_by_id(remark_id: str):
-    remark = remarks_collection.find_one({"_id": ObjectId(remark_id)})
- 
-    if not remark:
-        raise Exception("Remark not found")
- 
-    # delete attached file if exists
-    if remark.get("file_id"):
-        delete_file(str(remark["file_id"]))
- 
-    remarks_collection.delete_one({"_id": ObjectId(remark_id)})
- 
-    return {
-        "message": "Remark and file deleted successfully",
-        "remark_id": remark_id
-    }
\ No newline at end of file
@@ -1,17 +1,23 @@
-from app.database.mysql_connection import get_connection
 from app.schemas.schemas import TaskSchema
 from app.models.models import TaskReqRes
+from app.utils.helpers import encode_cursor, decode_cursor
+from sqlalchemy import select, and_, or_
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 from datetime import datetime, timezone
+from app.crud.remarks_crud import notify_targets
+from app.core.remark_sync import remark_sync
 
+# page size bounds for keyset-paginated task listings
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
 
-def add_task(new_task: TaskReqRes,role,user):
-	session = None
+
+async def add_task(session: AsyncSession, new_task: TaskReqRes,role,user):
 	try:
 		if role != "Admin" and role != "Manager":
 			raise HTTPException(status_code=400,detail="Not Authorized")
-		session = get_connection()
 		task = TaskSchema(
 			title=new_task.title,
 			description=new_task.description,
@@ -31,80 +37,143 @@ def add_task(new_task: TaskReqRes,role,user):
 		if task.assigned_to :
 			task.assigned_at = datetime.now()
 		session.add(task)
-		session.commit()
-		session.refresh(task)
+		await session.commit()
 		return TaskReqRes.model_validate(task)
 	except SQLAlchemyError as e:
-		if session:
-			session.rollback()
+		await session.rollback()
 		raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-	finally:
-		if session:
-			session.close()
 
-def get_all_tasks(role,user):
-	session = None
-	try:
-		session = get_connection()
-		if role == "Manager":
-			# Allow Managers to view all tasks in the "All Tasks" section.
-			# Previously this returned only tasks where reviewer == manager. Change to return all tasks
-			# for Manager role so managers can inspect and manage tasks across the board.
-			if "Manager" in user.roles:
-				tasks = session.query(TaskSchema).all()
-			else:
-				raise HTTPException(status_code=403,detail="Not Authorized")
-		elif role=="Admin" :
-			if "Admin" in user.roles:
-				tasks=session.query(TaskSchema).all()
-			else:
-				raise HTTPException(status_code=403,detail="Not Authorized")
-		else:
-			if role in user.roles:
-				tasks=session.query(TaskSchema).filter(TaskSchema.assigned_to==user.e_id).all()
+
+def _scoped_task_query(role, user):
+	"""Base tasks query restricted to what the acting role may see."""
+	if role == "Manager":
+		# Managers can view all tasks in the "All Tasks" section.
+		if "Manager" not in user.roles:
+			raise HTTPException(status_code=403,detail="Not Authorized")
+		return select(TaskSchema)
+	elif role=="Admin" :
+		if "Admin" not in user.roles:
+			raise HTTPException(status_code=403,detail="Not Authorized")
+		return select(TaskSchema)
+	else:
+		if role not in user.roles:
+			raise HTTPException(status_code=403,detail="Not Authorized")
+		return select(TaskSchema).where(TaskSchema.assigned_to==user.e_id)
+
+
+def _apply_keyset(query, sort, cursor):
+	"""Order the query for keyset pagination and skip past `cursor` (t_id, updated_at).
+
+	sort="t_id" walks the primary key ascending. sort="updated_at" walks most
+	recently updated first with t_id as tie-breaker; MySQL sorts NULLs last
+	in DESC order, so never-updated tasks come after all updated ones.
+	"""
+	if sort == "updated_at":
+		query = query.order_by(TaskSchema.updated_at.desc(), TaskSchema.t_id.desc())
+		if cursor:
+			last_id, last_updated = cursor
+			if last_updated is None:
+				query = query.where(TaskSchema.updated_at.is_(None), TaskSchema.t_id < last_id)
 			else:
-				raise HTTPException(status_code=403,detail="Not Authorized")
-		return [TaskReqRes.model_validate(t) for t in tasks]
+				query = query.where(or_(
+					TaskSchema.updated_at < last_updated,
+					and_(TaskSchema.updated_at == last_updated, TaskSchema.t_id < last_id),
+					TaskSchema.updated_at.is_(None),
+				))
+		return query
+
+	query = query.order_by(TaskSchema.t_id.asc())
+	if cursor:
+		query = query.where(TaskSchema.t_id > cursor[0])
+	return query
+
+
+def _parse_cursor(token, sort):
+	"""Decode a next-cursor token into (t_id, updated_at) for `sort`."""
+	data = decode_cursor(token)
+	try:
+		if data.get("s") != sort:
+			raise ValueError("cursor was issued for a different sort order")
+		last_updated = data.get("u")
+		if last_updated is not None:
+			last_updated = datetime.fromisoformat(last_updated)
+		return int(data["i"]), last_updated
+	except (ValueError, KeyError, TypeError):
+		raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _cursor_for(task, sort):
+	data = {"s": sort, "i": task.t_id}
+	if sort == "updated_at":
+		data["u"] = task.updated_at.isoformat() if task.updated_at else None
+	return encode_cursor(data)
+
+
+async def get_all_tasks(session: AsyncSession, role,user,status=None,priority=None,assigned_to=None,reviewer=None,
+		due_from=None,due_to=None,cursor=None,limit=DEFAULT_PAGE_SIZE,sort="t_id"):
+	"""Return one page of tasks visible to `role` and the token for the next page.
+
+	All filters are applied in SQL. `cursor` is the opaque token returned by the
+	previous call; the returned next cursor is None when there are no more rows.
+	Pass limit=None to fetch every matching row (internal callers only).
+	"""
+	try:
+		if sort not in ("t_id", "updated_at"):
+			raise HTTPException(status_code=400, detail="sort must be 't_id' or 'updated_at'")
+		position = _parse_cursor(cursor, sort) if cursor else None
+
+		query = _scoped_task_query(role, user)
+		if status:
+			query = query.where(TaskSchema.status == status)
+		if priority:
+			query = query.where(TaskSchema.priority == priority)
+		if assigned_to is not None:
+			query = query.where(TaskSchema.assigned_to == assigned_to)
+		if reviewer is not None:
+			query = query.where(TaskSchema.reviewer == reviewer)
+		if due_from is not None:
+			query = query.where(TaskSchema.expected_closure >= due_from)
+		if due_to is not None:
+			query = query.where(TaskSchema.expected_closure <= due_to)
+
+		query = _apply_keyset(query, sort, position)
+		if limit is None:
+			rows = (await session.execute(query)).scalars().all()
+			return [TaskReqRes.model_validate(t) for t in rows], None
+
+		# fetch one extra row to learn whether another page exists
+		rows = (await session.execute(query.limit(limit + 1))).scalars().all()
+		next_cursor = None
+		if len(rows) > limit:
+			rows = rows[:limit]
+			next_cursor = _cursor_for(rows[-1], sort)
+		return [TaskReqRes.model_validate(t) for t in rows], next_cursor
 	except SQLAlchemyError as e:
-		if session:
-			session.rollback()
+		await session.rollback()
 		raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-	finally:
-		if session:
-			session.close()
 
-def get_task_by_id(t_id: int):
-	session = None
+
+async def get_task_by_id(session: AsyncSession, t_id: int):
 	try:
-		session = get_connection()
-		t = session.query(TaskSchema).filter(TaskSchema.t_id == t_id).first()
+		t = await session.get(TaskSchema, t_id)
 		if not t:
 			raise HTTPException(status_code=404, detail="Task Not Found")
 		return TaskReqRes.model_validate(t)
 	except SQLAlchemyError as e:
-		if session:
-			session.rollback()
+		await session.rollback()
 		raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-	finally:
-		if session:
-			session.close()
-
-def get_task_by_status(status,role,user):
-    try:
-        data=get_all_tasks(role,user)
-        new_data = [task for task in data if task.status == status]
-        return new_data
-    except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-
-def update_task(t_id: int, updated: dict, role,user):
-	session = None
+
+async def get_task_by_status(session: AsyncSession, status,role,user):
+	"""Return every task in `status` visible to `role`; the status filter runs in SQL."""
+	tasks, _ = await get_all_tasks(session,role,user,status=status,limit=None)
+	return tasks
+
+async def update_task(session: AsyncSession, t_id: int, updated: dict, role,user):
 	try:
 		if role != "Admin" and role != "Manager":
 			raise HTTPException(status_code=403,detail="Not Authorized")
 
-		session = get_connection()
-		t = session.query(TaskSchema).filter(TaskSchema.t_id == t_id).first()
+		t = await session.get(TaskSchema, t_id)
 		if not t:
 			raise HTTPException(status_code=404, detail="Task Not Found")
 
@@ -130,26 +199,25 @@ def update_task(t_id: int, updated: dict, role,user):
 					# Only assigned employee should be moving IN_PROGRESS -> REVIEW via patch endpoint; disallow via update
 					raise HTTPException(status_code=403,detail="Only assigned employee can change the status of a task in progress")
 
+		targets_before = notify_targets(t)
 		for key, value in updated.items():
 			setattr(t, key, value)
 
 		t.updated_at = datetime.now()
-		session.commit()
-		session.refresh(t)
+		await session.commit()
+		# remarks carry their recipients; follow a change of assigner or reviewer and recount their badges
+		# in the background, so this SQL endpoint never waits on MongoDB
+		targets = notify_targets(t)
+		if targets != targets_before:
+			remark_sync.retarget(t_id, targets, set(targets) | set(targets_before))
 		return TaskReqRes.model_validate(t)
 	except SQLAlchemyError as e:
-		if session:
-			session.rollback()
+		await session.rollback()
 		raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-	finally:
-		if session:
-			session.close()
-
-def patch_status(t_id,status,role,user):
 
+async def patch_status(session: AsyncSession, t_id,status,role,user):
 	try:
-		session = get_connection()
-		t = session.query(TaskSchema).filter(TaskSchema.t_id == t_id).first()
+		t = await session.get(TaskSchema, t_id)
 		if role == "Manager":
 			if user.e_id != t.reviewer:
 				raise HTTPException(status_code=403, detail="Not Reviewer for the task")
@@ -168,25 +236,17 @@ def patch_status(t_id,status,role,user):
 			else:
 				raise HTTPException(status_code=409, detail="Only change the status from To Do -> In Progress or In Progress -> Review")
 
-		session.commit()
-		session.refresh(t)
+		await session.commit()
 		return TaskReqRes.model_validate(t)
 	except SQLAlchemyError as e:
-		if session:
-			session.rollback()
+		await session.rollback()
 		raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-	finally:
-		if session:
-			session.close()
 
 
-def delete_task(role,user,t_id: int):
-	session = None
+async def delete_task(session: AsyncSession, role,user,t_id: int):
 	try:
-		# Acquire DB session first
-		session = get_connection()
 		# Load task
-		t = session.query(TaskSchema).filter(TaskSchema.t_id == t_id).first()
+		t = await session.get(TaskSchema, t_id)
 		if not t:
 			raise HTTPException(status_code=404, detail="Task Not Found")
 
@@ -195,15 +255,13 @@ def delete_task(role,user,t_id: int):
 			raise HTTPException(status_code=403, detail="Only the Admin can delete the task")
 
 		# Proceed to delete
-		session.delete(t)
-		session.commit()
+		targets_before = notify_targets(t)
+		await session.delete(t)
+		await session.commit()
+		# the task's remarks must stop showing up as notifications
+		remark_sync.forget_task(t_id, targets_before)
 		return {"detail": "Task Deleted Successfully"}
 
 	except SQLAlchemyError as e:
-		if session:
-			session.rollback()
+		await session.rollback()
 		raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-
-	finally:
-		if session:
-			session.close()
\ No newline at end of file
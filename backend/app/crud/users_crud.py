@@ -1,9 +1,15 @@
-from app.database.mysql_connection import get_connection
 from app.schemas.schemas import UserSchema
 from app.models.models import UserReqRes
+from app.core.principal_cache import principal_cache
+from app.core.revocation import token_state
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 
+# fields that are signed into access tokens (password change also revokes them)
+_PRINCIPAL_FIELDS = {"roles", "status", "password"}
+
 
 def _ensure_roles_list(roles):
     # Normalize roles to a Python list
@@ -27,9 +33,8 @@ def _ensure_roles_list(roles):
     return list(roles)
 
 
-def add_user(new_user: UserReqRes):
+async def add_user(session: AsyncSession, new_user: UserReqRes):
     try:
-        session = get_connection()
         user = UserSchema(
             e_id=new_user.e_id,
             password=new_user.password or "password123",
@@ -37,8 +42,7 @@ def add_user(new_user: UserReqRes):
             status=new_user.status
         )
         session.add(user)
-        session.commit()
-        session.refresh(user)
+        await session.commit()
         res = UserReqRes(
             e_id=user.e_id,
             password=user.password,
@@ -47,16 +51,13 @@ def add_user(new_user: UserReqRes):
         )
         return res
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        session.close()
 
 
-def get_all_users():
+async def get_all_users(session: AsyncSession):
     try:
-        session = get_connection()
-        users = session.query(UserSchema).all()
+        users = (await session.execute(select(UserSchema))).scalars().all()
         res = []
         for u in users:
             res.append(UserReqRes(
@@ -67,58 +68,70 @@ def get_all_users():
             ))
         return res
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        session.close()
 
 
-def get_user_by_id(e_id: int):
+async def get_user_by_id(session: AsyncSession, e_id: int):
     try:
-        session = get_connection()
-        u = session.query(UserSchema).filter(UserSchema.e_id == e_id).first()
+        u = await session.get(UserSchema, e_id)
         if not u:
             raise HTTPException(status_code=404, detail="User Not Found")
         return UserReqRes(e_id=u.e_id, password=u.password, roles=_ensure_roles_list(u.roles), status=u.status)
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        session.close()
 
 
-def update_user(e_id: int, updated: dict):
+async def update_user(session: AsyncSession, e_id: int, updated: dict):
     try:
-        session = get_connection()
-        u = session.query(UserSchema).filter(UserSchema.e_id == e_id).first()
+        u = await session.get(UserSchema, e_id)
         if not u:
             raise HTTPException(status_code=404, detail="User Not Found")
         if "roles" in updated:
             # normalize to stored representation (JSON/list supported by SQLAlchemy JSON)
             updated["roles"] = updated["roles"] if updated["roles"] is not None else u.roles
+        updated.pop("token_version", None)
         for key, value in updated.items():
             setattr(u, key, value)
-        session.commit()
-        session.refresh(u)
+        if _PRINCIPAL_FIELDS.intersection(updated):
+            # outstanding tokens carry the old roles/status; stop trusting their claims
+            u.token_version = (u.token_version or 1) + 1
+        await session.commit()
+        principal_cache.invalidate(e_id)
+        token_state.update(e_id, u.token_version, u.status)
         return UserReqRes(e_id=u.e_id, password=u.password, roles=_ensure_roles_list(u.roles), status=u.status)
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        session.close()
 
 
-def delete_user(e_id: int):
+async def delete_user(session: AsyncSession, e_id: int):
     try:
-        session = get_connection()
-        u = session.query(UserSchema).filter(UserSchema.e_id == e_id).first()
+        u = await session.get(UserSchema, e_id)
         if not u:
             raise HTTPException(status_code=404, detail="User Not Found")
-        session.delete(u)
-        session.commit()
+        await session.delete(u)
+        await session.commit()
+        principal_cache.invalidate(e_id)
+        token_state.revoke(e_id)
         return {"detail": "User Deleted Successfully"}
     except SQLAlchemyError as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        session.close()
\ No newline at end of file
+
+
+async def get_token_version(session: AsyncSession, e_id: int) -> int:
+    version = (await session.execute(
+        select(UserSchema.token_version).where(UserSchema.e_id == e_id)
+    )).scalar_one_or_none()
+    return version or 1
+
+
+async def get_token_states(session: AsyncSession):
+    """(e_id, token_version, status) for every user, for the revocation table."""
+    rows = (await session.execute(
+        select(UserSchema.e_id, UserSchema.token_version, UserSchema.status)
+    )).all()
+    return [(r.e_id, r.token_version, r.status) for r in rows]
+
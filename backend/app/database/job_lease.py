@@ -0,0 +1,67 @@
+"""
+Leases for periodic MongoDB maintenance jobs
+Every worker runs the jobs, but only the holder of a job's lease does the work;
+the job's watermark lives in the same `job_state` document
+"""
+from datetime import datetime, timedelta
+import os
+import socket
+import uuid
+
+_UNCHECKED = object()
+
+
+def new_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(name: str, owner: str, seconds: float, now: datetime = None):
+    """Take the lease if it is free or expired; returns the job's state document, or None if it is held."""
+    from pymongo import ReturnDocument
+    from pymongo.errors import DuplicateKeyError
+    from app.database.mongodb_connection import get_job_state_collection
+
+    now = now or datetime.now()
+    try:
+        return get_job_state_collection().find_one_and_update(
+            {"_id": name, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"lease_until": now + timedelta(seconds=seconds), "owner": owner}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # the document exists and another worker holds the lease
+        return None
+
+
+def release_lease(name: str, owner: str):
+    from app.database.mongodb_connection import get_job_state_collection
+
+    get_job_state_collection().update_one({"_id": name, "owner": owner}, {"$set": {"lease_until": None}})
+
+
+def get_state(name: str) -> dict:
+    from app.database.mongodb_connection import get_job_state_collection
+
+    return get_job_state_collection().find_one({"_id": name}) or {}
+
+
+def set_watermark(name: str, watermark: datetime, seq=_UNCHECKED):
+    """Store the job's watermark; given the state's `seq`, only if no rewind_watermark happened since it was read."""
+    from app.database.mongodb_connection import get_job_state_collection
+
+    query = {"_id": name}
+    if seq is not _UNCHECKED:
+        # a state that was never rewound has no seq; {"seq": None} matches the missing field
+        query["seq"] = seq
+    get_job_state_collection().update_one(query, {"$set": {"watermark": watermark}})
+
+
+def rewind_watermark(name: str, watermark: datetime):
+    """Move the watermark back to `watermark` (never forward) so the job processes that range again."""
+    from app.database.mongodb_connection import get_job_state_collection
+
+    get_job_state_collection().update_one(
+        {"_id": name, "watermark": {"$gt": watermark}},
+        {"$set": {"watermark": watermark}, "$inc": {"seq": 1}},
+    )
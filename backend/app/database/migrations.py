@@ -0,0 +1,100 @@
+"""
+Versioned schema migrations for the MySQL database
+Applied explicitly via `python migrate.py`; nothing here runs at app import
+"""
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, MetaData, Table, select, inspect, text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# bookkeeping table kept out of Base.metadata so create_all never touches it
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _meta,
+    Column("version", String(64), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _0001_initial_tables(conn):
+    from app.database.mysql_connection import Base
+    import app.schemas.schemas  # noqa: F401  registers the tables on Base
+
+    Base.metadata.create_all(bind=conn)
+
+
+def _0002_task_status_indexes(conn):
+    # create_all skips indexes on tables that already exist, so add any that are missing
+    from app.database.mysql_connection import Base
+    from app.schemas.schemas import check_indexes
+
+    missing = set(check_indexes(conn))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in missing:
+                index.create(bind=conn, checkfirst=True)
+
+
+def _0003_users_token_version(conn):
+    columns = {c["name"] for c in inspect(conn).get_columns("users")}
+    if "token_version" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 1"))
+
+
+def _0004_attachments_blob_id(conn):
+    columns = {c["name"] for c in inspect(conn).get_columns("attachments")}
+    if "blob_id" not in columns:
+        conn.execute(text("ALTER TABLE attachments ADD COLUMN blob_id VARCHAR(64) NULL"))
+
+
+def _0005_blobs(conn):
+    from app.schemas.schemas import BlobSchema
+
+    BlobSchema.__table__.create(bind=conn, checkfirst=True)
+
+
+def _0006_attachments_blob_id_index(conn):
+    from app.schemas.schemas import AttachmentSchema
+
+    for index in AttachmentSchema.__table__.indexes:
+        if index.name == "ix_attachments_blob_id":
+            index.create(bind=conn, checkfirst=True)
+
+
+# (version, description, upgrade) in apply order; never edit or reorder released entries
+MIGRATIONS = [
+    ("0001", "initial tables", _0001_initial_tables),
+    ("0002", "composite task indexes for status/assignee/reviewer lookups", _0002_task_status_indexes),
+    ("0003", "users.token_version for JWT claim revocation", _0003_users_token_version),
+    ("0004", "attachments.blob_id for the content-addressed attachment store", _0004_attachments_blob_id),
+    ("0005", "blobs table with reference counts for the attachment store", _0005_blobs),
+    ("0006", "attachments.blob_id index for blob reference lookups", _0006_attachments_blob_id_index),
+]
+
+
+def applied_versions(engine) -> set:
+    _meta.create_all(bind=engine)
+    with engine.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending_migrations(engine) -> list:
+    done = applied_versions(engine)
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def upgrade(engine) -> list:
+    """Apply every pending migration in order; each runs in its own transaction.
+
+    Returns the versions that were applied.
+    """
+    applied = []
+    for version, description, step in pending_migrations(engine):
+        logger.info(f"Applying migration {version}: {description}")
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.now()))
+        applied.append(version)
+    return applied
@@ -0,0 +1,107 @@
+"""
+MongoDB health tracking / circuit breaker
+After MONGO_BREAKER_FAILURES consecutive connection failures the breaker opens:
+Mongo-backed routes answer 503 immediately and request logs are spooled or
+skipped. A background probe pings Mongo and closes the breaker on recovery
+"""
+from fastapi import HTTPException
+from dotenv import load_dotenv
+import logging
+import os
+import sys
+import threading
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MONGO_BREAKER_FAILURES = int(os.getenv("MONGO_BREAKER_FAILURES", "3"))
+MONGO_PROBE_INTERVAL = float(os.getenv("MONGO_PROBE_INTERVAL", "5"))
+
+
+def is_mongo_unavailable(exc: Exception) -> bool:
+    """True for pymongo errors that mean the server could not be reached."""
+    if "pymongo" not in sys.modules:
+        return False
+    try:
+        from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+    except ImportError:
+        return False
+    return isinstance(exc, (ConnectionFailure, ServerSelectionTimeoutError))
+
+
+class MongoCircuitBreaker:
+    def __init__(self, failure_threshold: int = MONGO_BREAKER_FAILURES, probe_interval: float = MONGO_PROBE_INTERVAL):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probe_thread = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            if self._opened_at is not None:
+                logger.info(f"MongoDB recovered after {time.monotonic() - self._opened_at:.1f}s; closing breaker")
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._opened_at is not None or self._consecutive_failures < self.failure_threshold:
+                return
+            self._opened_at = time.monotonic()
+            self.times_opened += 1
+            logger.warning("MongoDB unavailable; opening circuit breaker")
+            self._start_probe()
+
+    def _start_probe(self):
+        if self._probe_thread is not None and self._probe_thread.is_alive():
+            return
+        self._probe_thread = threading.Thread(target=self._probe, name="mongo-probe", daemon=True)
+        self._probe_thread.start()
+
+    def _probe(self):
+        from app.database.mongodb_connection import get_client
+
+        while self.is_open:
+            time.sleep(self.probe_interval)
+            try:
+                get_client().admin.command("ping")
+            except Exception:
+                continue
+            self.record_success()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": "open" if self._opened_at is not None else "closed",
+                "open_for_seconds": round(time.monotonic() - self._opened_at, 3) if self._opened_at is not None else None,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+mongo_breaker = MongoCircuitBreaker()
+
+
+def require_mongo():
+    """Route dependency: fail fast with 503 while the breaker is open."""
+    if not mongo_breaker.allow():
+        raise HTTPException(status_code=503, detail="MongoDB is unavailable, try again later")
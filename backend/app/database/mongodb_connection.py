@@ -1,6 +1,5 @@
-from pymongo import MongoClient
 from typing import Optional
-from gridfs import GridFS
+from functools import lru_cache
 from dotenv import load_dotenv
 import os
 
@@ -10,12 +9,69 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB = os.getenv("MONGO_DB", "ust_task_logs")
 
-client = MongoClient(MONGO_URI)
-mongodb = client[MONGO_DB]
+# keep these short so an outage fails fast instead of stalling requests for 30s
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "2000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "2000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "5000"))
+
+# pymongo and gridfs are imported on first use so app import and SQL-only
+# workers never pay for them
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    from pymongo import MongoClient
+    from app.middleware.metrics import mongo_command_listener
+    from app.middleware.request_timing import mongo_timing_listener
+    from app.middleware.slow_queries import slow_query_log
+
+    listeners = [mongo_command_listener(), mongo_timing_listener()]
+    if slow_query_log.enabled:
+        listeners.append(slow_query_log.mongo_listener())
+    return MongoClient(
+        MONGO_URI,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        event_listeners=listeners,
+    )
+
+
+def get_mongodb():
+    return get_client()[MONGO_DB]
+
 
 # Collections
-remarks_collection = mongodb["remarks"]
-logs_collection = mongodb["logs"]
+def get_remarks_collection():
+    return get_mongodb()["remarks"]
+
+
+def get_logs_collection():
+    return get_mongodb()["logs"]
+
+
+def get_latency_rollups_collection():
+    return get_mongodb()["latency_rollups"]
+
+
+def get_slow_queries_collection():
+    return get_mongodb()["slow_queries"]
+
+
+def get_slow_query_plans_collection():
+    return get_mongodb()["slow_query_plans"]
+
+
+def get_job_state_collection():
+    return get_mongodb()["job_state"]
+
+
+def get_notification_state_collection():
+    return get_mongodb()["notification_state"]
+
 
 # GridFS for file upload / download
-fs = GridFS(mongodb)
+@lru_cache(maxsize=None)
+def get_fs():
+    from gridfs import GridFS
+    return GridFS(get_mongodb())
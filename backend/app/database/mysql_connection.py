@@ -1,5 +1,7 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
+from app.database.pool_metrics import MeteredQueuePool, MeteredAsyncQueuePool
 from dotenv import load_dotenv
 import os
 
@@ -12,15 +14,63 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "3306")
 DB_NAME = os.getenv("DB_NAME", "ust_emp_manag")
 
-DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Connection pool configuration
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
 
-engine = create_engine(DATABASE_URL, echo=True)
+# full SQLAlchemy URLs override the DB_* settings (the test suite points them at SQLite)
+DATABASE_URL = os.getenv("DATABASE_URL") or f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
+def _engine_options(poolclass) -> dict:
+    options = {
+        "echo": DB_ECHO,
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        # MySQL enforces max_execution_time on read-only SELECT statements
+        options["connect_args"] = {
+            "init_command": f"SET SESSION max_execution_time={DB_STATEMENT_TIMEOUT_MS}"
+        }
+    return options
+
+
+def create_db_engine(url: str = DATABASE_URL):
+    """Build a sync engine from the DB_* settings."""
+    return create_engine(url, **_engine_options(MeteredQueuePool))
+
+
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL):
+    """Build an async engine from the DB_* settings."""
+    return create_async_engine(url, **_engine_options(MeteredAsyncQueuePool))
+
+
+# sync engine for scripts (init_db, seed_data) and schema checks
+engine = create_db_engine()
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# async engine used by the API; sessions keep loaded attributes after commit
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 # Shared Base for all schema modules so ForeignKey references resolve
 Base = declarative_base()
 
 
 def get_connection():
     return SessionLocal()
-    
\ No newline at end of file
+
+
+def get_async_connection():
+    return AsyncSessionLocal()
@@ -0,0 +1,96 @@
+"""
+Connection pool instrumentation
+Times every pool checkout so pool sizing can be based on observed wait times
+"""
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+import threading
+import time
+
+# upper bounds (ms) of the checkout latency histogram buckets; the last bucket is open-ended
+CHECKOUT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolMetrics:
+    """Thread-safe counters for checkout count, wait time and a latency histogram."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # callables(seconds, failed) notified of every checkout, e.g. the Prometheus histogram
+        self.observers = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.errors = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.buckets = [0] * (len(CHECKOUT_BUCKETS_MS) + 1)
+
+    def record(self, seconds: float, failed: bool = False):
+        ms = seconds * 1000
+        index = len(CHECKOUT_BUCKETS_MS)
+        for i, bound in enumerate(CHECKOUT_BUCKETS_MS):
+            if ms <= bound:
+                index = i
+                break
+        with self._lock:
+            if failed:
+                self.errors += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+            self.buckets[index] += 1
+        for observer in self.observers:
+            observer(seconds, failed)
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.errors
+            histogram = {f"le_{bound}ms": count for bound, count in zip(CHECKOUT_BUCKETS_MS, self.buckets)}
+            histogram[f"gt_{CHECKOUT_BUCKETS_MS[-1]}ms"] = self.buckets[-1]
+            return {
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "checkouts": self.checkouts,
+                "checkout_errors": self.errors,
+                "wait_time_total_ms": round(self.total_wait * 1000, 3),
+                "wait_time_avg_ms": round(self.total_wait * 1000 / attempts, 3) if attempts else 0.0,
+                "wait_time_max_ms": round(self.max_wait * 1000, 3),
+                "checkout_latency_histogram": histogram,
+            }
+
+
+class _MeteredPoolMixin:
+    """Records how long each connect() waited for a pooled connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except Exception:
+            self.metrics.record(time.perf_counter() - start, failed=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return conn
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep accumulating into the same counters
+        new_pool = super().recreate()
+        new_pool.metrics = self.metrics
+        return new_pool
+
+
+class MeteredQueuePool(_MeteredPoolMixin, QueuePool):
+    pass
+
+
+class MeteredAsyncQueuePool(_MeteredPoolMixin, AsyncAdaptedQueuePool):
+    pass
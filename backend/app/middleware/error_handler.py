@@ -4,6 +4,7 @@ Error handling middleware for the FastAPI application
 from fastapi import Request, status
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
+from app.database.mongo_health import mongo_breaker, is_mongo_unavailable
 import traceback
 import logging
 
@@ -19,6 +20,14 @@ async def error_handler_middleware(request: Request, call_next):
         response = await call_next(request)
         return response
     except Exception as exc:
+        if is_mongo_unavailable(exc):
+            # count toward the breaker and tell the client to retry instead of a generic 500
+            mongo_breaker.record_failure()
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"detail": "MongoDB is unavailable, try again later", "path": str(request.url.path)}
+            )
+
         # Log the error
         logger.error(f"Error processing request {request.method} {request.url}")
         logger.error(f"Error: {str(exc)}")
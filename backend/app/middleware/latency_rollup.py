@@ -0,0 +1,329 @@
+"""
+Latency rollups over the request logs
+A periodic job folds raw `logs` documents into per-minute buckets per route
+(count, errors, sum/max and a log-scale histogram) and sums those into hourly
+ones. Histograms are sparse {bucket: count} maps, so buckets merge by addition
+and the latency API answers percentiles from the rollups without touching raw
+logs. Every fold recomputes whole buckets and $sets them, so folding the same
+range twice gives the same result
+"""
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from app.database.mongo_health import mongo_breaker, is_mongo_unavailable
+from app.database.job_lease import new_owner, acquire_lease, release_lease, get_state, set_watermark, rewind_watermark
+import asyncio
+import logging
+import math
+import os
+import re
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LATENCY_ROLLUP_ENABLED = os.getenv("LATENCY_ROLLUP_ENABLED", "true").lower() == "true"
+LATENCY_ROLLUP_INTERVAL = float(os.getenv("LATENCY_ROLLUP_INTERVAL", "60"))
+# logs reach Mongo after the writer's flush interval; only fold entries older than this
+LATENCY_ROLLUP_LAG = float(os.getenv("LATENCY_ROLLUP_LAG", "10"))
+# upper bound on the time range folded per run, so a large backlog is caught up in steps
+LATENCY_ROLLUP_MAX_WINDOW_HOURS = float(os.getenv("LATENCY_ROLLUP_MAX_WINDOW_HOURS", "24"))
+
+RESOLUTIONS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1)}
+
+# log-scale histogram: bucket i covers (HIST_MIN_MS * HIST_FACTOR**(i-1), HIST_MIN_MS * HIST_FACTOR**i];
+# four buckets per doubling keeps quantiles within ~10% from 0.1ms to ~2 minutes
+HIST_MIN_MS = 0.1
+HIST_FACTOR = 2 ** 0.25
+HIST_BUCKETS = 80
+
+_STATE_ID = "latency"
+_NUMERIC_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def bucket_index(ms: float) -> int:
+    if ms <= HIST_MIN_MS:
+        return 0
+    return min(math.ceil(math.log(ms / HIST_MIN_MS, HIST_FACTOR)), HIST_BUCKETS - 1)
+
+
+def bucket_upper_ms(index: int) -> float:
+    return HIST_MIN_MS * HIST_FACTOR ** index
+
+
+def merge_histograms(target: dict, hist: dict) -> dict:
+    for index, count in hist.items():
+        target[str(index)] = target.get(str(index), 0) + count
+    return target
+
+
+def quantile_ms(hist: dict, q: float):
+    """Upper bound of the bucket holding the q-th quantile, or None for an empty histogram."""
+    total = sum(hist.values())
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for index in sorted(hist, key=int):
+        seen += hist[index]
+        if seen >= rank:
+            return round(bucket_upper_ms(int(index)), 3)
+    return round(bucket_upper_ms(HIST_BUCKETS - 1), 3)
+
+
+def _route_of(entry: dict) -> str:
+    # older entries have no route template; collapse numeric ids so they do not explode the key space
+    return entry.get("route") or _NUMERIC_SEGMENT.sub("/{id}", entry.get("path") or "")
+
+
+def _bucket_start(ts: datetime, resolution: str) -> datetime:
+    if resolution == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(second=0, microsecond=0)
+
+
+def _empty_rollup() -> dict:
+    return {"count": 0, "errors": 0, "sum_ms": 0.0, "max_ms": 0.0, "hist": {}}
+
+
+def fold_logs(entries) -> dict:
+    """Aggregate raw log entries into {(bucket minute, method, route): rollup}."""
+    rollups = {}
+    for entry in entries:
+        ts = entry.get("timestamp")
+        if ts is None or entry.get("process_time") is None:
+            continue
+        ms = entry["process_time"] * 1000
+        key = (_bucket_start(ts, "minute"), entry.get("method") or "", _route_of(entry))
+        r = rollups.get(key)
+        if r is None:
+            r = rollups[key] = _empty_rollup()
+        r["count"] += 1
+        r["errors"] += (entry.get("status_code") or 0) >= 500
+        r["sum_ms"] += ms
+        r["max_ms"] = max(r["max_ms"], ms)
+        index = str(bucket_index(ms))
+        r["hist"][index] = r["hist"].get(index, 0) + 1
+    return rollups
+
+
+def _merge_rollup(target: dict, r: dict):
+    target["count"] += r.get("count", 0)
+    target["errors"] += r.get("errors", 0)
+    target["sum_ms"] += r.get("sum_ms", 0.0)
+    target["max_ms"] = max(target["max_ms"], r.get("max_ms", 0.0))
+    merge_histograms(target["hist"], r.get("hist", {}))
+
+
+def _set_rollups(resolution: str, rollups: dict) -> list:
+    # $set, not $inc: a bucket's document always holds its complete recomputed value
+    from pymongo import UpdateOne
+
+    return [
+        UpdateOne(
+            {"resolution": resolution, "bucket": bucket, "method": method, "route": route},
+            {"$set": {k: r[k] for k in ("count", "errors", "sum_ms", "max_ms", "hist")}},
+            upsert=True,
+        )
+        for (bucket, method, route), r in rollups.items()
+    ]
+
+
+def _hour_rollups(collection, hours) -> dict:
+    """Hourly rollups summed from the stored minute buckets of each hour."""
+    rollups = {}
+    for hour in hours:
+        minutes = collection.find({"resolution": "minute", "bucket": {"$gte": hour, "$lt": hour + RESOLUTIONS["hour"]}})
+        for doc in minutes:
+            key = (hour, doc["method"], doc["route"])
+            r = rollups.get(key)
+            if r is None:
+                r = rollups[key] = _empty_rollup()
+            _merge_rollup(r, doc)
+    return rollups
+
+
+def refold_late_logs(entries):
+    """Rewind the rollup watermark to the oldest entry written behind it (spool replays, slow batches)."""
+    if not LATENCY_ROLLUP_ENABLED:
+        return
+    oldest = min((e["timestamp"] for e in entries if e.get("timestamp") is not None), default=None)
+    if oldest is not None and oldest < datetime.now() - timedelta(seconds=LATENCY_ROLLUP_LAG):
+        rewind_watermark(_STATE_ID, oldest)
+
+
+def ensure_rollup_indexes():
+    # the logs timestamp index belongs to log_storage.ensure_log_storage
+    from app.database.mongodb_connection import get_latency_rollups_collection
+
+    get_latency_rollups_collection().create_index(
+        [("resolution", 1), ("bucket", 1), ("method", 1), ("route", 1)],
+        unique=True, name="rollup_key",
+    )
+
+
+class LatencyRollupJob:
+    """Recomputes the buckets from the stored watermark on; a lease keeps workers from doing it at the same time."""
+
+    def __init__(self, interval: float = LATENCY_ROLLUP_INTERVAL, lag: float = LATENCY_ROLLUP_LAG):
+        self.interval = interval
+        self.lag = lag
+        self.owner = new_owner()
+        self._task = None
+        self._indexes_ready = False
+        self.runs = 0
+        self.folded = 0
+        self.errors = 0
+        self.last_run = None
+
+    def run_once(self, now: datetime = None) -> int:
+        """Recompute one window of rollups from raw logs; returns the number of log entries read.
+
+        The window starts at the minute holding the watermark, so the partial
+        bucket left by the previous run is recomputed whole. Rerunning a window
+        (a crash before the watermark moved, a run that outlived its lease)
+        rewrites the same values instead of adding to them.
+        """
+        from app.database.mongodb_connection import get_logs_collection, get_latency_rollups_collection
+
+        if not self._indexes_ready:
+            ensure_rollup_indexes()
+            self._indexes_ready = True
+
+        now = now or datetime.now()
+        lease = acquire_lease(_STATE_ID, self.owner, max(self.interval * 2, 60), now)
+        if lease is None:
+            return 0
+        try:
+            since = lease.get("watermark")
+            if since is None:
+                oldest = get_logs_collection().find_one({}, {"timestamp": 1}, sort=[("timestamp", 1)])
+                if oldest is None:
+                    return 0
+                since = oldest["timestamp"]
+            start = _bucket_start(since, "minute")
+            until = min(now - timedelta(seconds=self.lag), start + timedelta(hours=LATENCY_ROLLUP_MAX_WINDOW_HOURS))
+            if until <= start:
+                return 0
+
+            cursor = get_logs_collection().find(
+                {"timestamp": {"$gte": start, "$lt": until}},
+                {"_id": 0, "timestamp": 1, "method": 1, "path": 1, "route": 1, "status_code": 1, "process_time": 1},
+            ).batch_size(5000)
+            folded = 0
+
+            def counted(entries):
+                nonlocal folded
+                for entry in entries:
+                    folded += 1
+                    yield entry
+
+            rollups = get_latency_rollups_collection()
+            minutes = fold_logs(counted(cursor))
+            if minutes:
+                rollups.bulk_write(_set_rollups("minute", minutes), ordered=False)
+            hours = {_bucket_start(bucket, "hour") for bucket, _, _ in minutes}
+            if hours:
+                rollups.bulk_write(_set_rollups("hour", _hour_rollups(rollups, sorted(hours))), ordered=False)
+            # a rewind since the lease was taken (late logs) bumped seq; leave the watermark where it put it
+            set_watermark(_STATE_ID, until, seq=lease.get("seq"))
+            self.folded += folded
+            return folded
+        finally:
+            release_lease(_STATE_ID, self.owner)
+            self.runs += 1
+            self.last_run = now
+
+    async def _loop(self):
+        while True:
+            if not mongo_breaker.is_open:
+                try:
+                    # keep folding while a backlog remains, then wait for the next interval
+                    while await asyncio.to_thread(self.run_once):
+                        if await asyncio.to_thread(self._caught_up):
+                            break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    if is_mongo_unavailable(e):
+                        mongo_breaker.record_failure()
+                    logger.warning(f"Latency rollup failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def _caught_up(self) -> bool:
+        watermark = get_state(_STATE_ID).get("watermark")
+        return watermark is None or watermark >= datetime.now() - timedelta(seconds=self.lag + self.interval)
+
+    def start(self):
+        if LATENCY_ROLLUP_ENABLED and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": LATENCY_ROLLUP_ENABLED,
+            "running": self._task is not None,
+            "runs": self.runs,
+            "folded": self.folded,
+            "errors": self.errors,
+            "last_run": self.last_run,
+        }
+
+
+rollup_job = LatencyRollupJob()
+
+
+def query_latency(since: datetime, until: datetime, resolution: str, route: str = None,
+                  method: str = None, series: bool = False) -> list:
+    """Per-route latency summary for [since, until) read only from the rollups."""
+    from app.database.mongodb_connection import get_latency_rollups_collection
+
+    filters = {"resolution": resolution, "bucket": {"$gte": _bucket_start(since, resolution), "$lt": until}}
+    if route:
+        filters["route"] = route
+    if method:
+        filters["method"] = method.upper()
+
+    routes = {}
+    for doc in get_latency_rollups_collection().find(filters, {"_id": 0}).sort("bucket", 1):
+        key = (doc["method"], doc["route"])
+        r = routes.get(key)
+        if r is None:
+            r = routes[key] = {"method": doc["method"], "route": doc["route"], "count": 0, "errors": 0,
+                               "sum_ms": 0.0, "max_ms": 0.0, "hist": {}, "series": []}
+        r["count"] += doc.get("count", 0)
+        r["errors"] += doc.get("errors", 0)
+        r["sum_ms"] += doc.get("sum_ms", 0.0)
+        r["max_ms"] = max(r["max_ms"], doc.get("max_ms", 0.0))
+        merge_histograms(r["hist"], doc.get("hist", {}))
+        if series:
+            r["series"].append(_summary(doc, {"bucket": doc["bucket"]}))
+
+    result = []
+    for r in routes.values():
+        summary = _summary(r, {"method": r["method"], "route": r["route"]})
+        if series:
+            summary["series"] = r["series"]
+        result.append(summary)
+    result.sort(key=lambda s: s["p95_ms"] or 0, reverse=True)
+    return result
+
+
+def _summary(r: dict, head: dict) -> dict:
+    count = r.get("count", 0)
+    hist = r.get("hist", {})
+    head.update({
+        "count": count,
+        "errors": r.get("errors", 0),
+        "error_rate": round(r.get("errors", 0) / count, 4) if count else 0.0,
+        "avg_ms": round(r.get("sum_ms", 0.0) / count, 3) if count else None,
+        "max_ms": round(r.get("max_ms", 0.0), 3),
+        "p50_ms": quantile_ms(hist, 0.50),
+        "p95_ms": quantile_ms(hist, 0.95),
+        "p99_ms": quantile_ms(hist, 0.99),
+    })
+    return head
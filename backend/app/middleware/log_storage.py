@@ -0,0 +1,266 @@
+"""
+Storage layout, retention and archival for request logs
+ensure_log_storage() creates the `logs` collection (time-series by default)
+with TTL retention plus its timestamp/path indexes; the archiver exports each
+hour that passes the retention boundary to gzipped NDJSON before it is deleted.
+Time-series collections do not enforce a unique _id, so writers that may send
+an entry twice (spool replay) check unwritten() first
+"""
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from app.database.mongo_health import mongo_breaker, is_mongo_unavailable
+from app.database.job_lease import new_owner, acquire_lease, release_lease, set_watermark
+import asyncio
+import gzip
+import logging
+import os
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "timeseries" (MongoDB 5.0+), "capped" (size-bounded, no TTL) or "regular"
+LOG_STORAGE = os.getenv("LOG_STORAGE", "timeseries").lower()
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "30"))
+LOG_CAPPED_SIZE_MB = int(os.getenv("LOG_CAPPED_SIZE_MB", "1024"))
+# export expired hours here as logs-YYYYMMDD-HH.ndjson.gz; empty disables archival
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "")
+LOG_ARCHIVE_INTERVAL = float(os.getenv("LOG_ARCHIVE_INTERVAL", "3600"))
+# when archiving, the TTL is pushed back by this much so the archiver always runs first
+LOG_ARCHIVE_GRACE_HOURS = float(os.getenv("LOG_ARCHIVE_GRACE_HOURS", "24"))
+
+_LOGS = "logs"
+_ARCHIVE_JOB = "log_archive"
+
+
+def ttl_seconds():
+    """Age at which MongoDB deletes log entries, or None to keep them forever."""
+    if LOG_RETENTION_DAYS <= 0:
+        return None
+    ttl = LOG_RETENTION_DAYS * 86400
+    if LOG_ARCHIVE_DIR:
+        ttl += LOG_ARCHIVE_GRACE_HOURS * 3600
+    return int(ttl)
+
+
+def _try(description: str, step):
+    # storage tweaks are best effort: unsupported options only warn, an unreachable server still raises
+    from pymongo.errors import OperationFailure
+
+    try:
+        return step()
+    except OperationFailure as e:
+        logger.warning(f"Log storage: could not {description}: {str(e)}")
+
+
+def _create_logs(db, ttl):
+    if LOG_STORAGE == "capped":
+        return db.create_collection(_LOGS, capped=True, size=LOG_CAPPED_SIZE_MB * 1024 * 1024)
+    if LOG_STORAGE == "timeseries":
+        options = {"timeseries": {"timeField": "timestamp", "metaField": "route", "granularity": "seconds"}}
+        if ttl:
+            options["expireAfterSeconds"] = ttl
+        created = _try("create a time-series collection, falling back to a regular one",
+                       lambda: db.create_collection(_LOGS, **options))
+        if created is not None:
+            return created
+    return db.create_collection(_LOGS)
+
+
+def _ensure_ttl_index(logs, ttl):
+    existing = logs.index_information().get("timestamp_1")
+    if existing is None:
+        if ttl:
+            logs.create_index("timestamp", expireAfterSeconds=ttl)
+        else:
+            logs.create_index("timestamp")
+        return
+    if existing.get("expireAfterSeconds") == ttl:
+        return
+    if ttl and "expireAfterSeconds" in existing:
+        logs.database.command("collMod", _LOGS, index={"keyPattern": {"timestamp": 1}, "expireAfterSeconds": ttl})
+        return
+    # adding or removing a TTL needs a rebuild of the index
+    logs.drop_index("timestamp_1")
+    _ensure_ttl_index(logs, ttl)
+
+
+def ensure_log_storage() -> str:
+    """Create or adjust the logs collection and its indexes; returns the storage kind in effect."""
+    from pymongo.errors import CollectionInvalid
+    from app.database.mongodb_connection import get_mongodb
+
+    db = get_mongodb()
+    ttl = ttl_seconds()
+    try:
+        _create_logs(db, ttl)
+    except CollectionInvalid:
+        pass  # already exists
+
+    options = db[_LOGS].options()
+    logs = db[_LOGS]
+    if "timeseries" in options:
+        kind = "timeseries"
+        if options.get("expireAfterSeconds") != ttl:
+            _try("update the time-series expiry", lambda: db.command(
+                "collMod", _LOGS, expireAfterSeconds=ttl if ttl else "off"))
+        _try("create the timestamp index", lambda: logs.create_index("timestamp"))
+    elif options.get("capped"):
+        kind = "capped"
+        _try("create the timestamp index", lambda: logs.create_index("timestamp"))
+    else:
+        kind = "regular"
+        _try("set up the TTL index", lambda: _ensure_ttl_index(logs, ttl))
+    _try("create the path index", lambda: logs.create_index([("path", 1), ("timestamp", 1)]))
+
+    if kind != LOG_STORAGE:
+        logger.warning(
+            f"Log storage: `{_LOGS}` is a {kind} collection but LOG_STORAGE={LOG_STORAGE}; "
+            f"rename or drop it to let the app recreate it"
+        )
+    return kind
+
+
+def unwritten(entries: list) -> list:
+    """The entries whose _id is not in `logs` yet.
+
+    Inserting a time-series row a second time succeeds silently, so a duplicate
+    key error cannot be relied on. The timestamp bounds let MongoDB prune the
+    lookup to the buckets these entries would be in.
+    """
+    from app.database.mongodb_connection import get_logs_collection
+
+    ids = [e["_id"] for e in entries if "_id" in e]
+    if not ids:
+        return list(entries)
+    query = {"_id": {"$in": ids}}
+    stamps = [e["timestamp"] for e in entries if isinstance(e.get("timestamp"), datetime)]
+    if len(stamps) == len(entries):
+        query["timestamp"] = {"$gte": min(stamps), "$lte": max(stamps)}
+    present = {d["_id"] for d in get_logs_collection().find(query, {"_id": 1})}
+    return [e for e in entries if e.get("_id") not in present]
+
+
+class LogArchiver:
+    """Exports whole hours older than the retention period, oldest first, then deletes them."""
+
+    def __init__(self, interval: float = LOG_ARCHIVE_INTERVAL):
+        self.interval = interval
+        self.owner = new_owner()
+        self._task = None
+        self.runs = 0
+        self.archived = 0
+        self.files = 0
+        self.errors = 0
+        self.last_run = None
+
+    def run_once(self, now: datetime = None) -> int:
+        """Archive every complete expired hour not yet exported; returns the number of entries archived."""
+        from app.database.mongodb_connection import get_logs_collection
+
+        if not LOG_ARCHIVE_DIR or LOG_RETENTION_DAYS <= 0:
+            return 0
+        now = now or datetime.now()
+        lease = acquire_lease(_ARCHIVE_JOB, self.owner, max(self.interval * 2, 600), now)
+        if lease is None:
+            return 0
+        archived = 0
+        try:
+            logs = get_logs_collection()
+            cutoff = (now - timedelta(days=LOG_RETENTION_DAYS)).replace(minute=0, second=0, microsecond=0)
+            hour = lease.get("watermark")
+            if hour is None:
+                oldest = logs.find_one({"timestamp": {"$lt": cutoff}}, {"timestamp": 1}, sort=[("timestamp", 1)])
+                if oldest is None:
+                    return 0
+                hour = oldest["timestamp"].replace(minute=0, second=0, microsecond=0)
+            while hour < cutoff:
+                end = hour + timedelta(hours=1)
+                archived += self._archive_hour(logs, hour, end)
+                # the watermark only moves once the hour is safely on disk
+                set_watermark(_ARCHIVE_JOB, end)
+                hour = end
+            return archived
+        finally:
+            release_lease(_ARCHIVE_JOB, self.owner)
+            self.archived += archived
+            self.runs += 1
+            self.last_run = now
+
+    def _archive_hour(self, logs, start: datetime, end: datetime) -> int:
+        from bson import json_util
+        from pymongo.errors import OperationFailure
+
+        window = {"timestamp": {"$gte": start, "$lt": end}}
+        cursor = logs.find(window, {"_id": 0}).sort("timestamp", 1).batch_size(5000)
+        os.makedirs(LOG_ARCHIVE_DIR, exist_ok=True)
+        path = self._archive_path(start)
+        partial = path + ".partial"
+        count = 0
+        with open(partial, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                for entry in cursor:
+                    gz.write((json_util.dumps(entry) + "\n").encode("utf-8"))
+                    count += 1
+            raw.flush()
+            os.fsync(raw.fileno())
+        if not count:
+            os.remove(partial)
+            return 0
+        os.replace(partial, path)
+        self.files += 1
+        try:
+            logs.delete_many(window)
+        except OperationFailure:
+            # time-series collections before MongoDB 7.0 cannot delete by time; the TTL removes it after the grace period
+            pass
+        return count
+
+    @staticmethod
+    def _archive_path(start: datetime) -> str:
+        base = os.path.join(LOG_ARCHIVE_DIR, f"logs-{start:%Y%m%d-%H}")
+        path, n = base + ".ndjson.gz", 1
+        # late entries for an already exported hour go to a numbered sibling instead of overwriting it
+        while os.path.exists(path):
+            path, n = f"{base}.{n}.ndjson.gz", n + 1
+        return path
+
+    async def _loop(self):
+        while True:
+            if not mongo_breaker.is_open:
+                try:
+                    await asyncio.to_thread(self.run_once)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    if is_mongo_unavailable(e):
+                        mongo_breaker.record_failure()
+                    logger.warning(f"Log archival failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if LOG_ARCHIVE_DIR and LOG_RETENTION_DAYS > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "storage": LOG_STORAGE,
+            "retention_days": LOG_RETENTION_DAYS,
+            "ttl_seconds": ttl_seconds(),
+            "archive_dir": LOG_ARCHIVE_DIR or None,
+            "running": self._task is not None,
+            "runs": self.runs,
+            "archived": self.archived,
+            "files": self.files,
+            "errors": self.errors,
+            "last_run": self.last_run,
+        }
+
+
+log_archiver = LogArchiver()
@@ -0,0 +1,281 @@
+"""
+Background writer for request logs
+The logging middleware only enqueues; a single task drains the queue into
+MongoDB with insert_many, in batches triggered by size or time
+"""
+from dotenv import load_dotenv
+from app.database.mongo_health import mongo_breaker, is_mongo_unavailable
+import asyncio
+import logging
+import os
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+# "drop": reject new entries only when the queue is full
+# "sample": once the queue is 75% full keep only every LOG_OVERFLOW_SAMPLE_EVERY-th entry
+LOG_OVERFLOW_POLICY = os.getenv("LOG_OVERFLOW_POLICY", "drop").lower()
+LOG_OVERFLOW_SAMPLE_EVERY = int(os.getenv("LOG_OVERFLOW_SAMPLE_EVERY", "10"))
+# while the Mongo breaker is open batches are appended here (NDJSON) and replayed on recovery;
+# leave empty to skip logging during an outage
+LOG_SPOOL_DIR = os.getenv("LOG_SPOOL_DIR", "")
+LOG_SPOOL_FILE = "request_logs.spool.ndjson"
+
+
+class MongoLogWriter:
+    def __init__(self, maxsize: int = LOG_QUEUE_SIZE, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._task = None
+        # batch being collected and write in flight, so stop() can finish them after cancelling
+        self._batch = []
+        self._inflight = None
+        self._seen_over_watermark = 0
+        self._storage_ready = False
+        self.enqueued = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.written = 0
+        self.failed = 0
+        self.skipped = 0
+        self.spooled = 0
+        self.replayed = 0
+
+    def enqueue(self, entry: dict) -> bool:
+        """Queue an entry without blocking; returns False if it was dropped or sampled out."""
+        if LOG_OVERFLOW_POLICY == "sample" and self._queue.qsize() >= self.maxsize * 0.75:
+            self._seen_over_watermark += 1
+            if self._seen_over_watermark % max(LOG_OVERFLOW_SAMPLE_EVERY, 1) != 0:
+                self.sampled_out += 1
+                return False
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the writer and flush everything still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight is not None:
+            await self._inflight
+            self._inflight = None
+        batch, self._batch = self._batch, []
+        await self._write(batch)
+        while not self._queue.empty():
+            await self._write(self._drain(self.batch_size))
+
+    async def _run(self):
+        while True:
+            await self._collect_batch()
+            batch, self._batch = self._batch, []
+            # shielded so cancelling the writer never abandons a half-sent batch
+            self._inflight = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    async def _collect_batch(self):
+        # wait for the first entry, then keep collecting until the batch is full or the interval ends
+        batch = self._batch
+        batch.append(await self._queue.get())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            batch.extend(self._drain(self.batch_size - len(batch)))
+            remaining = deadline - loop.time()
+            if len(batch) >= self.batch_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+    def _drain(self, limit: int) -> list:
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return items
+
+    async def _write(self, batch: list):
+        if not batch:
+            return
+        if mongo_breaker.is_open:
+            await self._spool(batch)
+            return
+        try:
+            from app.database.mongodb_connection import get_logs_collection
+            if not self._storage_ready:
+                # before the first insert, or MongoDB would create `logs` as a plain collection
+                from app.middleware.log_storage import ensure_log_storage
+                await asyncio.to_thread(ensure_log_storage)
+                self._storage_ready = True
+            # pymongo is blocking; keep it off the event loop
+            await asyncio.to_thread(self._insert, get_logs_collection(), batch)
+            await asyncio.to_thread(self._refold, batch)
+        except Exception as e:
+            if is_mongo_unavailable(e):
+                mongo_breaker.record_failure()
+                # how much of the batch got in is unknown; insert_many gave every entry its _id,
+                # so the replay skips the ones that did
+                await self._spool(batch)
+            else:
+                self.failed += len(batch)
+            logger.warning(f"Failed to write {len(batch)} request logs to MongoDB: {str(e)}")
+            return
+        mongo_breaker.record_success()
+        if LOG_SPOOL_DIR:
+            try:
+                await asyncio.to_thread(self._replay_spool)
+            except Exception as e:
+                logger.warning(f"Failed to replay spooled request logs: {str(e)}")
+
+    def _insert(self, logs, batch: list):
+        from pymongo.errors import BulkWriteError
+
+        try:
+            logs.insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except BulkWriteError as e:
+            # everything but the rejected entries is in; spooling the batch would store those twice
+            errors = e.details.get("writeErrors", [])
+            self.written += e.details.get("nInserted", 0)
+            self.failed += len(errors)
+            logger.warning(f"MongoDB rejected {len(errors)} request logs: {errors[0].get('errmsg') if errors else ''}")
+
+    async def _spool(self, batch: list):
+        if not LOG_SPOOL_DIR:
+            self.skipped += len(batch)
+            return
+        try:
+            await asyncio.to_thread(self._append_spool, batch)
+            self.spooled += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.warning(f"Failed to spool {len(batch)} request logs: {str(e)}")
+
+    def _append_spool(self, batch: list):
+        from bson import ObjectId, json_util
+
+        os.makedirs(LOG_SPOOL_DIR, exist_ok=True)
+        with open(os.path.join(LOG_SPOOL_DIR, LOG_SPOOL_FILE), "a", encoding="utf-8") as f:
+            for entry in batch:
+                # a stable _id (insert_many may already have assigned one) lets replays skip rows that made it in
+                entry.setdefault("_id", ObjectId())
+                f.write(json_util.dumps(entry) + "\n")
+
+    def _replay_spool(self):
+        """Move spooled entries into MongoDB once it is reachable again.
+
+        Progress is checkpointed after every inserted chunk, so an interrupted
+        replay resumes after the chunks that already made it in rather than
+        writing them a second time.
+        """
+        path = os.path.join(LOG_SPOOL_DIR, LOG_SPOOL_FILE)
+        replaying = path + ".replaying"
+        offset_path = replaying + ".offset"
+        # a leftover .replaying file means an earlier replay was interrupted; finish it first
+        if not os.path.exists(replaying):
+            if not os.path.exists(path):
+                return
+            if os.path.exists(offset_path):
+                os.remove(offset_path)
+            os.replace(path, replaying)
+        offset = 0
+        if os.path.exists(offset_path):
+            with open(offset_path, encoding="utf-8") as f:
+                offset = int(f.read().strip() or 0)
+        from bson import json_util
+
+        # binary mode so tell() gives the byte offset to resume from
+        with open(replaying, "rb") as f:
+            f.seek(offset)
+            chunk = []
+            for line in f:
+                if line.strip():
+                    chunk.append(json_util.loads(line))
+                if len(chunk) >= self.batch_size:
+                    self._replay_chunk(chunk)
+                    chunk = []
+                    self._save_offset(offset_path, f.tell())
+            if chunk:
+                self._replay_chunk(chunk)
+        os.remove(replaying)
+        if os.path.exists(offset_path):
+            os.remove(offset_path)
+
+    def _replay_chunk(self, chunk: list):
+        from pymongo.errors import BulkWriteError
+        from app.database.mongodb_connection import get_logs_collection
+        from app.middleware.log_storage import unwritten
+
+        # rows an earlier, partly failed insert or replay already wrote; time-series storage would
+        # accept them again rather than report a duplicate key
+        fresh = unwritten(chunk)
+        if fresh:
+            try:
+                result = get_logs_collection().insert_many(fresh, ordered=False)
+                self.replayed += len(result.inserted_ids)
+            except BulkWriteError as e:
+                # regular storage: another worker replayed the same rows in the meantime
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+                self.replayed += e.details.get("nInserted", 0)
+        self._refold(chunk)
+
+    @staticmethod
+    def _refold(entries: list):
+        # entries older than the rollup watermark would otherwise never reach the latency rollups
+        from app.middleware.latency_rollup import refold_late_logs
+
+        try:
+            refold_late_logs(entries)
+        except Exception as e:
+            logger.warning(f"Failed to rewind the latency rollup for late logs: {str(e)}")
+
+    @staticmethod
+    def _save_offset(offset_path: str, offset: int):
+        tmp = offset_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+        os.replace(tmp, offset_path)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_size": self.maxsize,
+            "overflow_policy": LOG_OVERFLOW_POLICY,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "running": self._task is not None,
+        }
+
+
+log_writer = MongoLogWriter()
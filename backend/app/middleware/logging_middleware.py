@@ -6,6 +6,7 @@ from fastapi import Request
 from datetime import datetime
 import time
 import logging
+from app.middleware.log_writer import log_writer
 
 logger = logging.getLogger(__name__)
 
@@ -36,22 +37,23 @@ async def logging_middleware(request: Request, call_next):
         
         # Optional: Log to MongoDB
         try:
-            from app.database.mongodb_connection import logs_collection
-            
+            # route template (e.g. /api/Task/get/{id}) so latency rollups group by endpoint, not by URL
+            route = request.scope.get("route")
             log_entry = {
                 "timestamp": datetime.now(),
                 "method": request.method,
                 "path": request.url.path,
+                "route": getattr(route, "path", None),
                 "query_params": str(request.query_params),
                 "status_code": response.status_code,
                 "process_time": process_time,
                 "client_host": request.client.host if request.client else None
             }
             
-            # Insert log asynchronously (non-blocking)
-            logs_collection.insert_one(log_entry)
+            # Queue for the background batch writer; never waits on MongoDB
+            log_writer.enqueue(log_entry)
         except Exception as e:
-            logger.warning(f"Failed to log to MongoDB: {str(e)}")
+            logger.warning(f"Failed to queue request log: {str(e)}")
         
         return response
         
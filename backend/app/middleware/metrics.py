@@ -0,0 +1,164 @@
+"""
+Prometheus metrics for the API
+Per-route request counts and latency, in-flight requests, threadpool usage,
+SQL statement timings and pool usage (SQLAlchemy events) and MongoDB command
+timings (pymongo command monitoring). With PROMETHEUS_MULTIPROC_DIR set every
+worker writes to shared files and /metrics aggregates them
+"""
+from fastapi import Request
+from dotenv import load_dotenv
+import os
+import time
+
+# prometheus_client picks its value storage at import time, so the env file must be loaded first
+load_dotenv()
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route"],
+                         buckets=LATENCY_BUCKETS)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being served", multiprocess_mode="livesum")
+THREADPOOL_IN_USE = Gauge("threadpool_threads_in_use", "Worker threads busy with sync endpoints and run_in_threadpool",
+                          multiprocess_mode="livesum")
+THREADPOOL_LIMIT = Gauge("threadpool_threads_limit", "Worker thread limit", multiprocess_mode="livesum")
+
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "SQL statement execution time", ["engine", "operation"],
+                             buckets=QUERY_BUCKETS)
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "SQL statements that raised", ["engine"])
+DB_POOL_IN_USE = Gauge("db_pool_connections_in_use", "Connections checked out of the pool", ["engine"],
+                       multiprocess_mode="livesum")
+DB_POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ["engine"],
+                         buckets=QUERY_BUCKETS)
+
+MONGO_LATENCY = Histogram("mongo_command_duration_seconds", "MongoDB command round-trip time", ["command"],
+                          buckets=QUERY_BUCKETS)
+MONGO_FAILURES = Counter("mongo_command_failures_total", "MongoDB commands that failed", ["command"])
+
+# label lookups take a lock; cache the bound children so a request only pays for observe/inc
+_http_children = {}
+_UNMATCHED = "<unmatched>"
+
+
+def _http_child(method: str, route: str, status: int):
+    key = (method, route, status)
+    children = _http_children.get(key)
+    if children is None:
+        children = _http_children[key] = (
+            HTTP_REQUESTS.labels(method, route, str(status)),
+            HTTP_LATENCY.labels(method, route),
+        )
+    return children
+
+
+def _threadpool_usage():
+    from anyio.to_thread import current_default_thread_limiter
+
+    limiter = current_default_thread_limiter()
+    THREADPOOL_IN_USE.set(limiter.borrowed_tokens)
+    THREADPOOL_LIMIT.set(limiter.total_tokens)
+
+
+async def metrics_middleware(request: Request, call_next):
+    """
+    Records count, latency and in-flight gauge for every request
+    """
+    if not METRICS_ENABLED:
+        return await call_next(request)
+    start = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        # the route template keeps label cardinality bounded; unmatched paths share one series
+        route = getattr(request.scope.get("route"), "path", _UNMATCHED)
+        counter, histogram = _http_child(request.method, route, status)
+        counter.inc()
+        histogram.observe(time.perf_counter() - start)
+        _threadpool_usage()
+
+
+def instrument_engine(engine, name: str):
+    """Time every statement and track pool usage for a sync Engine (use async_engine.sync_engine for async)."""
+    from sqlalchemy import event
+
+    errors = DB_QUERY_ERRORS.labels(name)
+    in_use = DB_POOL_IN_USE.labels(name)
+    operations = {}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip()[:6].upper()
+        child = operations.get(operation)
+        if child is None:
+            child = operations[operation] = DB_QUERY_LATENCY.labels(name, operation)
+        start = getattr(context, "_metrics_start", None)
+        if start is not None:
+            child.observe(time.perf_counter() - start)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        errors.inc()
+
+    @event.listens_for(engine.pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        in_use.inc()
+
+    @event.listens_for(engine.pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        in_use.dec()
+
+    metrics = getattr(engine.pool, "metrics", None)
+    if metrics is not None:
+        wait = DB_POOL_WAIT.labels(name)
+        metrics.observers.append(lambda seconds, failed: wait.observe(seconds))
+
+
+def mongo_command_listener():
+    """pymongo CommandListener feeding the Mongo histograms; built lazily so pymongo is imported on first use."""
+    from pymongo import monitoring
+
+    class _MongoCommandMetrics(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            MONGO_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+        def failed(self, event):
+            MONGO_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+            MONGO_FAILURES.labels(event.command_name).inc()
+
+    return _MongoCommandMetrics()
+
+
+def render_metrics():
+    """Exposition text and content type; aggregates all workers' files in multiprocess mode."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead():
+    # drop this worker's live gauges from the shared files when it exits
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,211 @@
+"""
+On-demand profiling
+A request carrying a valid `X-Profile` token (issued by an admin endpoint and
+HMAC-signed with SECRET_KEY) runs under cProfile and its stats are saved to
+PROFILE_DIR for download. sample_process() samples every thread's stack for a
+few seconds and returns speedscope or collapsed-stack (flamegraph.pl) output
+"""
+from fastapi import Request
+from dotenv import load_dotenv
+import asyncio
+import cProfile
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_HEADER = "X-Profile"
+
+_SIGNING_KEY = (os.getenv("SECRET_KEY") or "").encode("utf-8")
+# cProfile hooks the interpreter globally (sys.monitoring on 3.12+); only one profile can run at a time
+_profile_lock = threading.Lock()
+_sample_lock = threading.Lock()
+
+
+def issue_profile_token(ttl_seconds: int) -> str:
+    """`<expiry>.<hmac>` token that enables profiling for requests sent before the expiry."""
+    expires = int(time.time()) + ttl_seconds
+    signature = hmac.new(_SIGNING_KEY, f"profile:{expires}".encode("utf-8"), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def verify_profile_token(token: str) -> bool:
+    try:
+        expires, signature = token.split(".", 1)
+        expires_at = int(expires)
+    except ValueError:
+        return False
+    if expires_at < time.time() or not _SIGNING_KEY:
+        return False
+    expected = hmac.new(_SIGNING_KEY, f"profile:{expires_at}".encode("utf-8"), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def profile_path(profile_id: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.pstats")
+
+
+def _prune_profiles():
+    files = sorted(
+        (os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith(".pstats")),
+        key=os.path.getmtime,
+    )
+    for path in files[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else []:
+        os.remove(path)
+        meta = path[:-len(".pstats")] + ".json"
+        if os.path.exists(meta):
+            os.remove(meta)
+
+
+def _save_profile(profiler: cProfile.Profile, profile_id: str, request: Request, elapsed: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(profile_path(profile_id))
+    meta = {"id": profile_id, "method": request.method, "path": request.url.path,
+            "query": str(request.query_params), "elapsed_ms": round(elapsed * 1000, 3), "created": time.time()}
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    _prune_profiles()
+
+
+async def profiling_middleware(request: Request, call_next):
+    """
+    Profiles the request with cProfile when it carries a valid X-Profile token
+    """
+    token = request.headers.get(PROFILE_HEADER)
+    if not token or not PROFILING_ENABLED:
+        return await call_next(request)
+    if not verify_profile_token(token):
+        logger.warning(f"Ignoring invalid {PROFILE_HEADER} token on {request.method} {request.url.path}")
+        return await call_next(request)
+    if not _profile_lock.acquire(blocking=False):
+        response = await call_next(request)
+        response.headers["X-Profile-Status"] = "busy"
+        return response
+
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    profiler = cProfile.Profile()
+    try:
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler (e.g. a debugger) already owns the interpreter hook
+            response = await call_next(request)
+            response.headers["X-Profile-Status"] = "busy"
+            return response
+        start = time.perf_counter()
+        # coroutines interleave on the event loop, so other requests served meanwhile also appear in the profile
+        try:
+            response = await call_next(request)
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+        await asyncio.to_thread(_save_profile, profiler, profile_id, request, elapsed)
+    finally:
+        _profile_lock.release()
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+def list_profiles() -> list:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith(".json"):
+            with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                profiles.append(json.load(f))
+    return sorted(profiles, key=lambda p: p["created"], reverse=True)
+
+
+def profile_summary(profile_id: str, sort: str = "cumulative", limit: int = 50) -> str:
+    """Text report of the top functions, as printed by pstats."""
+    out = io.StringIO()
+    stats = pstats.Stats(profile_path(profile_id), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_process(seconds: float, interval: float) -> dict:
+    """Sample every thread's stack each `interval` seconds; returns {thread name: {stack tuple: count}}."""
+    if not _sample_lock.acquire(blocking=False):
+        raise RuntimeError("A sampling session is already running")
+    try:
+        me = threading.get_ident()
+        names = {}
+        samples = {}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    thread = next((t for t in threading.enumerate() if t.ident == ident), None)
+                    names[ident] = f"{thread.name if thread else 'thread'}-{ident}"
+                per_thread = samples.setdefault(names[ident], {})
+                key = tuple(reversed(stack))
+                per_thread[key] = per_thread.get(key, 0) + 1
+            time.sleep(interval)
+        return samples
+    finally:
+        _sample_lock.release()
+
+
+def to_collapsed(samples: dict) -> str:
+    """Brendan Gregg's folded format: `thread;outer;...;inner count` per line."""
+    lines = []
+    for thread, stacks in samples.items():
+        for stack, count in stacks.items():
+            lines.append(";".join((thread,) + stack) + f" {count}")
+    return "\n".join(lines) + "\n"
+
+
+def to_speedscope(samples: dict, interval: float) -> dict:
+    """speedscope.app file with one sampled profile per thread."""
+    frames, index = [], {}
+    profiles = []
+    for thread, stacks in samples.items():
+        profile_samples, weights = [], []
+        for stack, count in stacks.items():
+            ids = []
+            for name in stack:
+                if name not in index:
+                    index[name] = len(frames)
+                    frames.append({"name": name})
+                ids.append(index[name])
+            profile_samples.append(ids)
+            weights.append(count * interval)
+        profiles.append({
+            "type": "sampled", "name": thread, "unit": "seconds",
+            "startValue": 0, "endValue": sum(weights),
+            "samples": profile_samples, "weights": weights,
+        })
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": profiles,
+        "name": "process sample",
+        "exporter": "ust-task-api",
+    }
@@ -0,0 +1,214 @@
+"""
+Per-request timing breakdown exposed as a Server-Timing header
+SQLAlchemy engine events and pymongo command monitoring add to the current
+request's RequestTiming (held in a ContextVar, so it follows the request into
+the threadpool and SQLAlchemy's async greenlets); auth and serialization are
+timed around the dependency and the endpoint
+"""
+from fastapi import Request
+from fastapi.routing import APIRoute
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from typing import Optional
+import asyncio
+import functools
+import logging
+import os
+import re
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+# warn when one request runs the same SQL statement shape more than this many times (0 = off)
+SQL_REPEAT_WARN_THRESHOLD = int(os.getenv("SQL_REPEAT_WARN_THRESHOLD", "0"))
+
+# expanded IN lists and multi-row VALUES differ only in placeholder count; fold every run, even of one
+_PLACEHOLDER_RUN = re.compile(r"(?:%s|\?|:\w+)(?:\s*,\s*(?:%s|\?|:\w+))*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def sql_shape(statement: str) -> str:
+    """Statement with placeholder lists folded and whitespace collapsed, for grouping."""
+    return _WHITESPACE.sub(" ", _PLACEHOLDER_RUN.sub("?", statement)).strip()
+
+
+class RequestTiming:
+    __slots__ = ("start", "phases", "sql_count", "sql_ms", "mongo_count", "mongo_ms", "endpoint_done", "shapes")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.mongo_count = 0
+        self.mongo_ms = 0.0
+        self.endpoint_done = None
+        self.shapes = {} if SQL_REPEAT_WARN_THRESHOLD > 0 else None
+
+    def add_phase(self, name: str, ms: float):
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+
+    def add_sql(self, statement: str, ms: float):
+        self.sql_count += 1
+        self.sql_ms += ms
+        if self.shapes is not None:
+            shape = sql_shape(statement)
+            self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def add_mongo(self, ms: float):
+        self.mongo_count += 1
+        self.mongo_ms += ms
+
+    def header(self) -> str:
+        total_ms = (time.perf_counter() - self.start) * 1000
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.phases.items()]
+        parts.append(f'sql;desc="{self.sql_count} queries";dur={self.sql_ms:.1f}')
+        parts.append(f'mongo;desc="{self.mongo_count} ops";dur={self.mongo_ms:.1f}')
+        parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+    def repeated_shapes(self) -> list:
+        if not self.shapes:
+            return []
+        return [(shape, n) for shape, n in self.shapes.items() if n > SQL_REPEAT_WARN_THRESHOLD]
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+# ASGI scope of the request being served, so DB hooks can tell which route issued a query
+_current_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+
+def current_timing() -> Optional[RequestTiming]:
+    return _current.get()
+
+
+def current_route() -> Optional[str]:
+    """`METHOD /route/template` of the request being served, if any."""
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+    route = getattr(scope.get("route"), "path", None) or scope.get("path")
+    return f"{scope.get('method')} {route}"
+
+
+@contextmanager
+def timed_phase(name: str):
+    """Add the block's wall time to the current request's `name` phase."""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add_phase(name, (time.perf_counter() - start) * 1000)
+
+
+async def server_timing_middleware(request: Request, call_next):
+    """
+    Collects the timing breakdown for the request and sets the Server-Timing header
+    """
+    scope_token = _current_scope.set(request.scope)
+    if not SERVER_TIMING_ENABLED:
+        try:
+            return await call_next(request)
+        finally:
+            _current_scope.reset(scope_token)
+    timing = RequestTiming()
+    token = _current.set(timing)
+    try:
+        response = await call_next(request)
+    finally:
+        _current.reset(token)
+        _current_scope.reset(scope_token)
+    response.headers["Server-Timing"] = timing.header()
+    # browsers only show cross-origin Server-Timing to origins the CORS layer already let in
+    origin = response.headers.get("access-control-allow-origin")
+    if origin:
+        response.headers["Timing-Allow-Origin"] = origin
+    for shape, n in timing.repeated_shapes():
+        logger.warning(f"Possible N+1: {request.method} {request.url.path} ran {n}x: {shape[:300]}")
+    return response
+
+
+def track_engine(engine):
+    """Count and time statements on a sync Engine (use async_engine.sync_engine for async) per request."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            context._timing_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        timing = _current.get()
+        start = getattr(context, "_timing_start", None)
+        if timing is not None and start is not None:
+            timing.add_sql(statement, (time.perf_counter() - start) * 1000)
+
+
+def mongo_timing_listener():
+    """pymongo CommandListener adding each command to the current request; built lazily like the metrics one."""
+    from pymongo import monitoring
+
+    class _MongoRequestTiming(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            timing = _current.get()
+            if timing is not None:
+                timing.add_mongo(event.duration_micros / 1000)
+
+        def failed(self, event):
+            self.succeeded(event)
+
+    return _MongoRequestTiming()
+
+
+def _mark_endpoint_done(endpoint):
+    # the wrapper keeps the signature (functools.wraps) and sync/async kind, so FastAPI treats it like the original
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                timing = _current.get()
+                if timing is not None:
+                    timing.endpoint_done = time.perf_counter()
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                timing = _current.get()
+                if timing is not None:
+                    timing.endpoint_done = time.perf_counter()
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """Route class that reports the time between the endpoint returning and the response being built."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _mark_endpoint_done(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request):
+            response = await handler(request)
+            timing = _current.get()
+            if timing is not None and timing.endpoint_done is not None:
+                timing.add_phase("serialize", (time.perf_counter() - timing.endpoint_done) * 1000)
+            return response
+
+        return timed_handler
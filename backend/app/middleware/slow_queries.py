@@ -0,0 +1,304 @@
+"""
+Slow query log
+SQL statements (engine events) and MongoDB commands on watched collections
+(command monitoring) slower than SLOW_QUERY_MS are handed to a background
+thread, which redacts parameters, captures an EXPLAIN plan once per statement
+shape and stores the record in the `slow_queries` collection
+"""
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from app.database.mongo_health import mongo_breaker, is_mongo_unavailable
+from app.middleware.request_timing import current_route, sql_shape
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the slow query log
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+# a shape is re-explained at most this often
+SLOW_QUERY_EXPLAIN_TTL = float(os.getenv("SLOW_QUERY_EXPLAIN_TTL", "600"))
+SLOW_QUERY_RETENTION_DAYS = float(os.getenv("SLOW_QUERY_RETENTION_DAYS", "7"))
+SLOW_MONGO_COLLECTIONS = {c.strip() for c in os.getenv("SLOW_MONGO_COLLECTIONS", "remarks").split(",") if c.strip()}
+
+_QUEUE_SIZE = 1000
+_EXPLAIN_PREFIX = {"mysql": "EXPLAIN FORMAT=JSON ", "sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN (FORMAT JSON) "}
+_SQL_EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "INSERT", "REPLACE")
+_MONGO_EXPLAINABLE = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+_MONGO_SHAPE_FIELDS = ("filter", "query", "pipeline", "updates", "deletes", "sort", "projection")
+# driver-added fields that `explain` rejects or that only identify the session
+_MONGO_SESSION_FIELDS = {"lsid", "txnNumber", "$clusterTime", "$db", "$readPreference", "autocommit", "startTransaction"}
+
+
+def redact(value):
+    """Replace parameter values with their type, keeping LIKE wildcards so '%x%' scans stay visible."""
+    if isinstance(value, dict):
+        return {k: redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return f"{'%' if value.startswith('%') else ''}<str:{len(value)}>{'%' if value.endswith('%') and len(value) > 1 else ''}"
+    if value is None or isinstance(value, bool):
+        return value
+    return f"<{type(value).__name__}>"
+
+
+def command_collection(command_name: str, command: dict):
+    """Collection a command runs against, or None (explain carries a document, endSessions a list)."""
+    # getMore's own value is the cursor id; the collection is named separately
+    name = command.get("collection") if command_name == "getMore" else command.get(command_name)
+    return name if isinstance(name, str) else None
+
+
+def mongo_shape(command_name: str, command: dict) -> str:
+    """Command name, collection and query keys with values replaced by '?'."""
+    def skeleton(value):
+        if isinstance(value, dict):
+            return {k: skeleton(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [skeleton(v) for v in value[:1]]
+        return "?"
+
+    body = {k: skeleton(v) for k, v in command.items() if k in _MONGO_SHAPE_FIELDS}
+    return f"{command_name} {command_collection(command_name, command)} {body}"
+
+
+def _shape_id(kind: str, shape: str) -> str:
+    return hashlib.sha1(f"{kind}:{shape}".encode("utf-8")).hexdigest()
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS):
+        self.threshold_ms = threshold_ms
+        self._queue = queue.Queue(maxsize=_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._explained = {}
+        self._indexes_ready = False
+        self.recorded = 0
+        self.dropped = 0
+        self.explained = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def _submit(self, item: dict):
+        # called from request paths: never block, never raise
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="slow-query-log", daemon=True)
+                    self._thread.start()
+
+    def watch_engine(self, engine, name: str):
+        """Record statements on a sync Engine (use async_engine.sync_engine for async) over the threshold."""
+        from sqlalchemy import event
+
+        if not self.enabled:
+            return
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            context._slow_start = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            start = getattr(context, "_slow_start", None)
+            if start is None:
+                return
+            ms = (time.perf_counter() - start) * 1000
+            if ms < self.threshold_ms or statement.lstrip()[:7].upper() == "EXPLAIN":
+                return
+            self._submit({
+                "kind": "sql", "engine": name, "statement": statement, "parameters": parameters,
+                "executemany": executemany, "duration_ms": ms, "route": current_route(),
+            })
+
+    def mongo_listener(self):
+        """pymongo CommandListener for the watched collections; built lazily like the metrics one."""
+        from pymongo import monitoring
+
+        log = self
+        pending = {}
+
+        class _SlowMongoCommands(monitoring.CommandListener):
+            def started(self, event):
+                # only the started event carries the command document; keep it for watched collections
+                if command_collection(event.command_name, event.command) in SLOW_MONGO_COLLECTIONS:
+                    pending[event.request_id] = (dict(event.command), event.database_name, current_route())
+
+            def succeeded(self, event):
+                started = pending.pop(event.request_id, None)
+                ms = event.duration_micros / 1000
+                if started is None or ms < log.threshold_ms:
+                    return
+                command, database, route = started
+                log._submit({
+                    "kind": "mongo", "command_name": event.command_name, "command": command,
+                    "database": database, "duration_ms": ms, "route": route,
+                })
+
+            def failed(self, event):
+                pending.pop(event.request_id, None)
+
+        return _SlowMongoCommands()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._store(item)
+            except Exception as e:
+                self.errors += 1
+                if is_mongo_unavailable(e):
+                    mongo_breaker.record_failure()
+                logger.warning(f"Failed to record slow query: {str(e)}")
+
+    def _store(self, item: dict):
+        from app.database.mongodb_connection import get_slow_queries_collection, get_slow_query_plans_collection
+
+        if item["kind"] == "sql":
+            shape = sql_shape(item["statement"])
+            parameters = redact(item["parameters"])
+        else:
+            shape = mongo_shape(item["command_name"], item["command"])
+            parameters = redact({k: v for k, v in item["command"].items() if k not in _MONGO_SESSION_FIELDS})
+        shape_id = _shape_id(item["kind"], shape)
+        now = datetime.now()
+        plan = self._explain(item, shape_id)
+
+        if mongo_breaker.is_open:
+            return
+        if not self._indexes_ready:
+            self._ensure_indexes()
+        get_slow_queries_collection().insert_one({
+            "timestamp": now,
+            "kind": item["kind"],
+            "shape_id": shape_id,
+            "shape": shape[:4000],
+            "parameters": parameters,
+            "duration_ms": round(item["duration_ms"], 3),
+            "route": item["route"],
+        })
+        if plan is not None:
+            get_slow_query_plans_collection().replace_one(
+                {"_id": shape_id},
+                {"_id": shape_id, "kind": item["kind"], "shape": shape[:4000], "plan": plan, "captured_at": now},
+                upsert=True,
+            )
+        self.recorded += 1
+
+    def _explain(self, item: dict, shape_id: str):
+        if not SLOW_QUERY_EXPLAIN:
+            return None
+        last = self._explained.get(shape_id)
+        if last is not None and time.monotonic() - last < SLOW_QUERY_EXPLAIN_TTL:
+            return None
+        self._explained[shape_id] = time.monotonic()
+        try:
+            plan = self._explain_sql(item) if item["kind"] == "sql" else self._explain_mongo(item)
+        except Exception as e:
+            logger.warning(f"EXPLAIN failed for slow {item['kind']} query: {str(e)}")
+            return None
+        if plan is not None:
+            self.explained += 1
+        return plan
+
+    def _explain_sql(self, item: dict):
+        statement = item["statement"]
+        if item["executemany"] or statement.lstrip()[:7].upper().split(" ")[0] not in _SQL_EXPLAINABLE:
+            return None
+        # explain on the sync engine so the async pool used by requests is left alone
+        from app.database.mysql_connection import engine
+
+        prefix = _EXPLAIN_PREFIX.get(engine.dialect.name)
+        if prefix is None:
+            return None
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(prefix + statement, item["parameters"]).fetchall()
+        if engine.dialect.name == "mysql" and rows:
+            return json.loads(rows[0][0])
+        return [list(row) for row in rows]
+
+    def _explain_mongo(self, item: dict):
+        from app.database.mongodb_connection import get_client
+
+        if item["command_name"] not in _MONGO_EXPLAINABLE:
+            return None
+        command = {k: v for k, v in item["command"].items() if k not in _MONGO_SESSION_FIELDS}
+        result = get_client()[item["database"]].command({"explain": command, "verbosity": "queryPlanner"})
+        # aggregate explains nest the planner under stages; keep whichever form the server returned
+        return result.get("queryPlanner") or result.get("stages")
+
+    def _ensure_indexes(self):
+        from app.database.mongodb_connection import get_slow_queries_collection
+
+        slow = get_slow_queries_collection()
+        if SLOW_QUERY_RETENTION_DAYS > 0:
+            slow.create_index("timestamp", expireAfterSeconds=int(SLOW_QUERY_RETENTION_DAYS * 86400))
+        slow.create_index([("shape_id", 1), ("timestamp", 1)])
+        self._indexes_ready = True
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "queue_depth": self._queue.qsize(),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "explained": self.explained,
+            "explained_shapes": len(self._explained),
+            "errors": self.errors,
+        }
+
+
+slow_query_log = SlowQueryLog()
+
+
+def top_offenders(minutes: int, kind: str = None, limit: int = 20) -> list:
+    """Statement shapes ordered by total time spent in slow executions over the window."""
+    from app.database.mongodb_connection import get_slow_queries_collection, get_slow_query_plans_collection
+
+    match = {"timestamp": {"$gte": datetime.now() - timedelta(minutes=minutes)}}
+    if kind:
+        match["kind"] = kind
+    offenders = list(get_slow_queries_collection().aggregate([
+        {"$match": match},
+        {"$sort": {"timestamp": 1}},
+        {"$group": {
+            "_id": "$shape_id",
+            "kind": {"$last": "$kind"},
+            "shape": {"$last": "$shape"},
+            "count": {"$sum": 1},
+            "total_ms": {"$sum": "$duration_ms"},
+            "max_ms": {"$max": "$duration_ms"},
+            "routes": {"$addToSet": "$route"},
+            "last_seen": {"$last": "$timestamp"},
+            "last_parameters": {"$last": "$parameters"},
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": limit},
+    ]))
+    plans = {p["_id"]: p for p in get_slow_query_plans_collection().find({"_id": {"$in": [o["_id"] for o in offenders]}})}
+    for o in offenders:
+        o["shape_id"] = o.pop("_id")
+        o["total_ms"] = round(o["total_ms"], 3)
+        o["avg_ms"] = round(o["total_ms"] / o["count"], 3)
+        plan = plans.get(o["shape_id"])
+        o["plan"] = plan["plan"] if plan else None
+        o["plan_captured_at"] = plan["captured_at"] if plan else None
+    return offenders
@@ -0,0 +1,199 @@
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime, timedelta
+from typing import Optional
+import gc
+import os
+from app.core.security import require_admin
+from app.core.principal_cache import principal_cache
+from app.core.revocation import token_state
+from app.core import memory_diagnostics
+from app.middleware.log_writer import log_writer
+from app.core.notification_hub import notification_hub
+from app.core.remark_sync import remark_sync
+from app.middleware.latency_rollup import rollup_job, query_latency
+from app.middleware.log_storage import log_archiver
+from app.middleware.slow_queries import slow_query_log, top_offenders
+from app.middleware import profiling
+from app.database.mongo_health import mongo_breaker, require_mongo
+from app.database.mysql_connection import engine, async_engine
+from app.middleware.request_timing import TimedRoute
+
+admin_router = APIRouter(prefix="/admin", tags=["Admin"], route_class=TimedRoute, dependencies=[Depends(require_admin)])
+
+
+@admin_router.get("/pool")
+async def pool_stats():
+    """Live connection pool stats for the API (async) and script (sync) engines."""
+    pools = {"async": async_engine.pool, "sync": engine.pool}
+    return {name: pool.metrics.snapshot(pool) for name, pool in pools.items()}
+
+
+@admin_router.get("/principal-cache")
+async def principal_cache_stats():
+    """Hit/miss counters and size of the per-process principal cache."""
+    return principal_cache.stats()
+
+
+@admin_router.get("/token-state")
+async def token_state_stats():
+    """Size and freshness of the JWT revocation/version table."""
+    return token_state.stats()
+
+
+@admin_router.get("/log-writer")
+async def log_writer_stats():
+    """Queue depth and written/dropped counters of the request log writer."""
+    return log_writer.stats()
+
+
+@admin_router.get("/notification-hub")
+async def notification_hub_stats():
+    """Open notification streams on this worker, the pub/sub backend, overflow count and queued remark retargets."""
+    return {**notification_hub.stats(), "remark_sync": remark_sync.stats()}
+
+
+@admin_router.get("/log-storage")
+async def log_storage_stats():
+    """Retention settings and archival progress for the request logs."""
+    return log_archiver.stats()
+
+
+@admin_router.get("/mongo")
+async def mongo_health():
+    """Circuit breaker state for MongoDB."""
+    return mongo_breaker.stats()
+
+
+
+@admin_router.get("/latency", dependencies=[Depends(require_mongo)])
+async def latency(
+    minutes: int = Query(60, ge=1, le=60 * 24 * 90, description="Look-back window"),
+    resolution: Optional[str] = Query(None, pattern="^(minute|hour)$", description="Defaults to minute for windows up to 6h"),
+    route: Optional[str] = Query(None, description="Route template, e.g. /api/Task/get/{id}"),
+    method: Optional[str] = None,
+    series: bool = Query(False, description="Include per-bucket figures for each route"),
+):
+    """Per-route count, error rate and p50/p95/p99 from the pre-aggregated rollups, slowest p95 first."""
+    until = datetime.now()
+    since = until - timedelta(minutes=minutes)
+    resolution = resolution or ("minute" if minutes <= 360 else "hour")
+    routes = await run_in_threadpool(query_latency, since, until, resolution, route, method, series)
+    return {"since": since, "until": until, "resolution": resolution, "rollup": rollup_job.stats(), "routes": routes}
+
+
+@admin_router.post("/latency/rollup", dependencies=[Depends(require_mongo)])
+async def run_latency_rollup():
+    """Fold pending raw logs into the rollups now instead of waiting for the next interval."""
+    folded = await run_in_threadpool(rollup_job.run_once)
+    return {"folded": folded, "rollup": rollup_job.stats()}
+
+
+@admin_router.get("/slow-queries", dependencies=[Depends(require_mongo)])
+async def slow_queries(
+    minutes: int = Query(60 * 24, ge=1, le=60 * 24 * 30, description="Look-back window"),
+    kind: Optional[str] = Query(None, pattern="^(sql|mongo)$"),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """Slow statement shapes ranked by total time, with redacted parameters and the latest EXPLAIN plan."""
+    offenders = await run_in_threadpool(top_offenders, minutes, kind, limit)
+    return {"log": slow_query_log.stats(), "offenders": offenders}
+
+
+@admin_router.post("/profile/token")
+async def profile_token(ttl: int = Query(300, ge=10, le=3600, description="Seconds the token stays valid")):
+    """Signed token; send it as the X-Profile header to have a request profiled with cProfile."""
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    return {"header": profiling.PROFILE_HEADER, "token": profiling.issue_profile_token(ttl), "ttl_seconds": ttl}
+
+
+@admin_router.get("/profiles")
+async def profiles():
+    """Saved request profiles, newest first."""
+    return await run_in_threadpool(profiling.list_profiles)
+
+
+@admin_router.get("/profiles/{profile_id}")
+async def profile_download(
+    profile_id: str = Path(..., pattern=r"^[\w-]+$"),
+    format: str = Query("pstats", pattern="^(pstats|text)$"),
+    sort: str = Query("cumulative", pattern="^(cumulative|tottime|ncalls)$"),
+):
+    """The raw .pstats file (snakeviz, `python -m pstats`) or a text summary of the top functions."""
+    path = profiling.profile_path(profile_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        return PlainTextResponse(await run_in_threadpool(profiling.profile_summary, profile_id, sort))
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.pstats")
+
+
+@admin_router.post("/profiler/sample")
+async def profiler_sample(
+    seconds: float = Query(10, gt=0, le=120),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    format: str = Query("speedscope", pattern="^(speedscope|collapsed)$"),
+):
+    """Sample every thread of this worker for `seconds`; speedscope JSON or collapsed stacks for flamegraph.pl."""
+    try:
+        samples = await run_in_threadpool(profiling.sample_process, seconds, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "collapsed":
+        return PlainTextResponse(profiling.to_collapsed(samples))
+    return profiling.to_speedscope(samples, interval_ms / 1000)
+
+
+@admin_router.get("/memory")
+async def memory():
+    """RSS, GC generation counts, in-process cache sizes and tracemalloc state for this worker."""
+    return await run_in_threadpool(memory_diagnostics.memory_report)
+
+
+@admin_router.post("/memory/gc")
+async def memory_gc():
+    """Run a full collection; returns the number of unreachable objects found."""
+    collected = await run_in_threadpool(gc.collect)
+    return {"collected": collected, "gc": memory_diagnostics.gc_status()}
+
+
+@admin_router.post("/memory/tracemalloc/start")
+async def tracemalloc_start(frames: int = Query(1, ge=1, le=50, description="Traceback depth per allocation")):
+    return memory_diagnostics.start_tracing(frames)
+
+
+@admin_router.post("/memory/tracemalloc/stop")
+async def tracemalloc_stop():
+    return memory_diagnostics.stop_tracing()
+
+
+@admin_router.post("/memory/snapshots")
+async def memory_snapshot(name: str = Query(..., pattern=r"^[\w.-]{1,64}$")):
+    """Take a named tracemalloc snapshot (replaces one with the same name)."""
+    try:
+        return await run_in_threadpool(memory_diagnostics.take_snapshot, name)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@admin_router.get("/memory/snapshots")
+async def memory_snapshots():
+    return memory_diagnostics.snapshot_names()
+
+
+@admin_router.get("/memory/diff")
+async def memory_diff(
+    base: str,
+    target: Optional[str] = Query(None, description="Defaults to a fresh snapshot"),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    limit: int = Query(25, ge=1, le=500),
+):
+    """Top allocation growth between two snapshots, grouped by line, file or traceback."""
+    try:
+        return await run_in_threadpool(memory_diagnostics.diff_snapshots, base, target, group_by, limit)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown snapshot {e}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
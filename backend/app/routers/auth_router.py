@@ -1,20 +1,34 @@
 from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.dependencies import get_db
 from app.models.models import LoginRequest, Token
 from app.core.security import authenticate_user, create_access_token, get_current_user
+from app.core.revocation import JWT_EMBED_CLAIMS
+from app.crud.users_crud import get_token_version
+from app.middleware.request_timing import TimedRoute
 from datetime import timedelta
 
-auth_router = APIRouter(prefix="/auth", tags=["auth"])
+auth_router = APIRouter(prefix="/auth", tags=["auth"], route_class=TimedRoute)
 
 @auth_router.post("/login")
-def login(credentials: LoginRequest):
-	user = authenticate_user(credentials.e_id, credentials.password)
+async def login(credentials: LoginRequest, session: AsyncSession = Depends(get_db)):
+	user = await authenticate_user(session, credentials.e_id, credentials.password)
 	if not user:
 		raise HTTPException(status_code=401, detail="Invalid e_id or password")
 	access_token_expires = timedelta(minutes=30)
-	token = create_access_token(subject=str(user.e_id), expires_delta=access_token_expires)
 	
 	# Convert roles enum list to string values
 	roles_list = [role.value for role in user.roles] if user.roles else ["Developer"]
+
+	claims = None
+	if JWT_EMBED_CLAIMS:
+		# signed roles/status let get_current_user skip the users table while the version is current
+		claims = {
+			"roles": [role.value for role in user.roles],
+			"status": user.status.value,
+			"ver": await get_token_version(session, user.e_id),
+		}
+	token = create_access_token(subject=str(user.e_id), expires_delta=access_token_expires, claims=claims)
 	
 	return {
 		"access_token": token,
@@ -27,5 +41,5 @@ def login(credentials: LoginRequest):
 	}
 
 @auth_router.get("/me")
-def me(current_user=Depends(get_current_user)):
+async def me(current_user=Depends(get_current_user)):
 	return current_user
\ No newline at end of file
@@ -1,14 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.dependencies import get_db
 from app.crud.employee_crud import get_all_employees, add_emplyee, get_by_employee_id, update_employee, delete_employee
 from app.models.models import EmployeeReqRes
+from app.middleware.request_timing import TimedRoute
 from typing import List
 
-employee_router = APIRouter(prefix="/Employee", tags=["Employee"])
+employee_router = APIRouter(prefix="/Employee", tags=["Employee"], route_class=TimedRoute)
 
 @employee_router.get("/getall", response_model=List[EmployeeReqRes])
-def get_all(mgr_id: int | None = None, designation: str | None = None):
+async def get_all(mgr_id: int | None = None, designation: str | None = None, session: AsyncSession = Depends(get_db)):
     try:
-        employees = get_all_employees(mgr_id=mgr_id, designation=designation)
+        employees = await get_all_employees(session, mgr_id=mgr_id, designation=designation)
         if employees is None or (isinstance(employees, list) and len(employees) == 0):
             # return empty list instead of 404 so callers can safely iterate
             return []
@@ -19,9 +22,9 @@ def get_all(mgr_id: int | None = None, designation: str | None = None):
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 @employee_router.post("/create")
-def add_new_employee(new_emp: EmployeeReqRes):
+async def add_new_employee(new_emp: EmployeeReqRes, session: AsyncSession = Depends(get_db)):
     try:
-        new_employee = add_emplyee(new_emp)
+        new_employee = await add_emplyee(session, new_emp)
         return {"detail": "Employee Added Successfully", "employee": new_employee}
     except HTTPException as e:
         raise e  # Re-raise the specific HTTPException
@@ -29,9 +32,9 @@ def add_new_employee(new_emp: EmployeeReqRes):
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 @employee_router.get("/get", response_model=EmployeeReqRes)
-def get_by_id(id: int):
+async def get_by_id(id: int, session: AsyncSession = Depends(get_db)):
     try:
-        emp = get_by_employee_id(id)
+        emp = await get_by_employee_id(session, id)
         return emp
     except HTTPException as e:
         raise e  # Re-raise the specific HTTPException
@@ -39,9 +42,9 @@ def get_by_id(id: int):
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 @employee_router.put("/update")
-def update_employee_data(id: int, new_data: dict):
+async def update_employee_data(id: int, new_data: dict, session: AsyncSession = Depends(get_db)):
     try:
-        updated_emp = update_employee(id, new_data)
+        updated_emp = await update_employee(session, id, new_data)
         return {"detail": "Employee Updated Successfully", "employee": updated_emp}
     except HTTPException as e:
         raise e  # Re-raise the specific HTTPException
@@ -49,9 +52,9 @@ def update_employee_data(id: int, new_data: dict):
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 @employee_router.delete("/delete")
-def delete_employee_by_id(id: int):
+async def delete_employee_by_id(id: int, session: AsyncSession = Depends(get_db)):
     try:
-        delete_response = delete_employee(id)
+        delete_response = await delete_employee(session, id)
         return delete_response  # Returns {"detail": "Employee Deleted Successfully"}
     except HTTPException as e:
         raise e  # Re-raise the specific HTTPException
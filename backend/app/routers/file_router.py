@@ -1,22 +1,139 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from bson import ObjectId
-from app.database.mongodb_connection import fs
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from app.utils.file_upload import open_file
+from app.utils.blob_store import open_blob
+from app.database.mongodb_connection import get_remarks_collection
 from app.core.security import get_current_user
+from app.database.mongo_health import require_mongo
+from app.middleware.request_timing import TimedRoute
 
-file_router = APIRouter(prefix="/file", tags=["Files"])
+file_router = APIRouter(prefix="/file", tags=["Files"], route_class=TimedRoute, dependencies=[Depends(require_mongo)])
 
+# GridFS files are never modified in place, so a client may keep a copy for good
+CACHE_CONTROL = "private, max-age=31536000, immutable"
 
-@file_router.get("/{file_id}")
-def get_file(file_id: str, user=Depends(get_current_user)):
+
+def _etag(grid_out) -> str:
+    # stored content hash when the upload recorded one; otherwise the file id, which never changes meaning
+    sha256 = (grid_out.metadata or {}).get("sha256")
+    return f'"{sha256 or grid_out._id}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+def _parse_http_date(value: str):
     try:
-        oid = ObjectId(file_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid file id")
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _media_type(grid_out) -> str:
+    # GridOut.content_type is deprecated; files stored before the blob store only have the top-level field
+    media_type = (grid_out.metadata or {}).get("content_type") or grid_out._file.get("contentType")
+    return media_type or "application/octet-stream"
 
+
+def _byte_range(header: str, length: int):
+    """(start, end) inclusive for a single `bytes=` range, None to ignore the header, or False if unsatisfiable."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # multipart ranges are not worth the complexity; a full 200 is a valid answer
+        return None
+    first, _, last = spec.strip().partition("-")
     try:
-        grid_out = fs.get(oid)
-    except Exception:
-        raise HTTPException(status_code=404, detail="File not found")
+        if first == "":
+            suffix = int(last)
+            if suffix <= 0:
+                return False
+            start, end = max(length - suffix, 0), length - 1
+        else:
+            start = int(first)
+            end = int(last) if last else length - 1
+    except ValueError:
+        return None
+    if start >= length or end < start:
+        return False
+    return start, min(end, length - 1)
+
 
-    return StreamingResponse(grid_out, media_type=grid_out.content_type)
\ No newline at end of file
+def _stream(grid_out, start: int, length: int):
+    # seek() goes straight to the chunk holding `start`; read one GridFS chunk at a time from there
+    grid_out.seek(start)
+    remaining = length
+    while remaining > 0:
+        data = grid_out.read(min(grid_out.chunk_size, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+def file_response(grid_out, request: Request):
+    """Response for a GridFS file honouring If-None-Match/If-Modified-Since, Range and If-Range."""
+    etag = _etag(grid_out)
+    # HTTP dates have whole-second precision
+    modified = grid_out.upload_date.replace(tzinfo=timezone.utc, microsecond=0)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(modified, usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    else:
+        since = _parse_http_date(request.headers.get("if-modified-since"))
+        if since is not None and modified <= since:
+            return Response(status_code=304, headers=headers)
+
+    length = grid_out.length
+    media_type = _media_type(grid_out)
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header:
+        # If-Range: only honour the range when the client's copy is still this file
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range.strip() == etag or (
+            not if_range.strip().startswith(('"', "W/")) and _parse_http_date(if_range) == modified
+        ):
+            byte_range = _byte_range(range_header, length)
+
+    if byte_range is False:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{length}"})
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(_stream(grid_out, start, end - start + 1), status_code=206, media_type=media_type, headers=headers)
+
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(_stream(grid_out, 0, length), media_type=media_type, headers=headers)
+
+
+@file_router.get("/{file_id}")
+def get_file(file_id: str, request: Request, user=Depends(get_current_user)):
+    """Download a remark file by its file id."""
+    if not ObjectId.is_valid(file_id):
+        raise HTTPException(status_code=400, detail="Invalid file id")
+    remark = get_remarks_collection().find_one({"file_id": file_id}, {"blob_id": 1, "file_name": 1})
+    try:
+        if remark and remark.get("blob_id"):
+            grid_out = open_blob(remark["blob_id"])
+        else:
+            # remarks from before the blob store point at a GridFS file of their own
+            grid_out = open_file(file_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="File not found")
+    return file_response(grid_out, request)
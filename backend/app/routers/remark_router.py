@@ -1,39 +1,69 @@
 from fastapi import APIRouter, HTTPException,Depends,UploadFile, File, Form# from app.crud.remark_crud import add_remark, get_remarks_for_task, delete_remark
-from app.models.models import RemarkReqRes
-from typing import List, Optional
-from app.core.security import get_current_user
+from typing import Optional
+from app.core.security import get_current_user, get_stream_user
 # from app.crud.remark_crud import add_remark, get_remarks_by_task, delete_remark_by_id, update_remark
 
 from fastapi import APIRouter, HTTPException
-from fastapi import APIRouter, UploadFile, File, Header, Form
-from app.crud.remarks_crud import add_remark, get_remarks_by_task, delete_remark_by_id
+from fastapi import APIRouter, UploadFile, File, Header, Form, Query, Response
+from app.crud.remarks_crud import add_remark, delete_remark_by_id, page_remarks_by_task, DEFAULT_REMARK_PAGE, MAX_REMARK_PAGE
 from app.crud.remarks_crud import update_remark
-from app.database.mongodb_connection import remarks_collection
+from app.crud.remarks_crud import get_notifications as list_notifications
+from app.crud.notification_crud import unread_count, mark_read, mark_all_read, read_state, is_read
+from app.crud.remarks_crud import replay_notifications
+from app.core.notification_hub import notification_hub, remark_event, RESET, NOTIFY_HEARTBEAT_SECONDS, NOTIFY_REPLAY_LIMIT
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+import asyncio
+from app.database.mongodb_connection import get_remarks_collection
 from bson import ObjectId
 from app.utils.mongo_serializer import serialize_mongo
-from app.database.mysql_connection import get_connection
+from app.core.dependencies import get_db
+from app.database.mongo_health import require_mongo, is_mongo_unavailable
 from app.schemas.schemas import TaskSchema
+from fastapi.concurrency import run_in_threadpool
+from app.middleware.request_timing import TimedRoute
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-remark_router = APIRouter(prefix="/Remark", tags=["Remark"])
+# every remark route needs MongoDB; answer 503 at once while it is known to be down
+remark_router = APIRouter(prefix="/Remark", tags=["Remark"], route_class=TimedRoute, dependencies=[Depends(require_mongo)])
  
-@remark_router.get("/getbytask", response_model=List[RemarkReqRes])
-def list_for_task(task_id: int, role: str, user=Depends(get_current_user)):
-    remarks = get_remarks_by_task(task_id)
-    if not remarks:
-        raise HTTPException(status_code=404, detail="No remarks found for task")
-    return remarks
+@remark_router.get("/getbytask", response_class=StreamingResponse)
+def list_for_task(
+    task_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_REMARK_PAGE, ge=1, le=MAX_REMARK_PAGE),
+    fields: Optional[str] = None,
+    user=Depends(get_current_user),
+):
+    """
+    Keyset-paginated remarks of a task, oldest first: a JSON array streamed from
+    the Mongo cursor, with the token for the next page in the X-Next-Cursor header.
+    `fields` is a comma-separated projection over _id, task_id, comment, created_by,
+    e_id, role, file_id, file_name, created_at and updated_at; by default each
+    remark has _id, task_id, comment, created_by and created_at. If the listing
+    fails part way, the array ends with {"error": ..., "truncated": true}.
+    """
+    chunks, next_cursor = page_remarks_by_task(task_id, cursor=cursor, limit=limit, fields=fields)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return StreamingResponse(chunks, media_type="application/json", headers=headers)
 
 
 
 @remark_router.post("/create")
-def create_remark(
+async def create_remark(
     task_id: int = Form(...),
     comment: str = Form(...),
     file: Optional[UploadFile] = File(None),
     role: str = Form(...),
+    sha256: Optional[str] = Form(None),
+    file_name: Optional[str] = Form(None),
     user=Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
 ):
-    r = add_remark(task_id=task_id, comment=comment, e_id=getattr(user, "e_id", None), file=file, role=role, user=user)
+    # sha256 (+ file_name) instead of file links content this user stored before
+    r = await add_remark(session, task_id=task_id, comment=comment, e_id=getattr(user, "e_id", None), file=file, role=role, user=user,
+                         sha256=sha256, file_name=file_name)
     return {"detail": "Remark Added Successfully", "remark": r}
 
 
@@ -76,55 +106,137 @@ def update_remark_api(
 
 
 @remark_router.get("/notifications")
-def get_notifications(user=Depends(get_current_user)):
+async def get_notifications(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    user=Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
+):
     """Return recent remarks for tasks where the current user is reviewer or assigned_by.
 
-    Excludes remarks created by the current user.
+    Excludes remarks created by the current user. Newest first; pass the
+    X-Next-Cursor header of one page as `cursor` to fetch the next.
     """
     try:
-        # find tasks where user is reviewer or assigned_by
-        session = get_connection()
-        # Only notify users who assigned the task
-        tasks = session.query(TaskSchema).filter(
-            TaskSchema.assigned_by == getattr(user, "e_id", None)
-        ).all()
-        task_ids = [t.t_id for t in tasks]
-        if not task_ids:
-            return []
-
-        docs = list(remarks_collection.find({"task_id": {"$in": task_ids}, "created_by": {"$ne": getattr(user, "e_id", None)}}).sort("created_at", -1).limit(50))
-
-        # fetch tasks to attach title into notification payload
-        tasks_map = {t.t_id: t.title for t in tasks}
+        uid = getattr(user, "e_id", None)
+        docs, next_cursor = await run_in_threadpool(list_notifications, uid, cursor, limit)
+        watermark, read = await run_in_threadpool(read_state, uid)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+
+        # fetch titles only for the tasks on this page
+        task_ids = {d.get("task_id") for d in docs}
+        tasks_map = {}
+        if task_ids:
+            tasks_map = dict((await session.execute(
+                select(TaskSchema.t_id, TaskSchema.title).where(TaskSchema.t_id.in_(task_ids))
+            )).all())
         out = []
         for d in docs:
             s = serialize_mongo(d)
             # include task title for display
             s["task_title"] = tasks_map.get(s.get("task_id"), None)
+            s["read"] = is_read(d, uid, watermark, read)
             out.append(s)
         return out
+    except HTTPException:
+        raise
     except Exception as e:
+        if is_mongo_unavailable(e):
+            raise  # error handler turns this into a 503 and trips the breaker
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
+
+
+def _sse(event_id: Optional[str], data: str, event: str = None) -> str:
+    return (f"event: {event}\n" if event else "") + (f"id: {event_id}\n" if event_id else "") + f"data: {data}\n\n"
+
+
+@remark_router.get("/notifications/stream")
+async def stream_notifications(
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    user=Depends(get_stream_user),
+):
+    """Server-sent events carrying each new remark addressed to the current user.
+
+    Send the id of the last event seen as Last-Event-ID to resume after a
+    reconnect. A `reset` event means events were lost (slow reader or a long
+    gap): refetch /notifications, then reconnect without Last-Event-ID.
+    EventSource cannot send the Bearer header, so read the stream with fetch.
+    """
+    uid = getattr(user, "e_id", None)
+    # subscribe before replaying so nothing published in between is missed
+    subscriber = notification_hub.subscribe(uid)
+    try:
+        backlog = []
+        if last_event_id:
+            backlog = await run_in_threadpool(replay_notifications, uid, last_event_id, NOTIFY_REPLAY_LIMIT)
+    except BaseException:
+        notification_hub.unsubscribe(subscriber)
+        raise
+
+    async def events():
         try:
-            session.close()
-        except Exception:
-            pass
+            yield "retry: 3000\n\n"
+            if backlog is None:
+                yield _sse(None, "{}", "reset")
+                return
+            replayed = set()
+            for doc in backlog:
+                event_id, data = remark_event(doc)
+                replayed.add(event_id)
+                yield _sse(event_id, data)
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), NOTIFY_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # keeps proxies from closing an idle stream and lets us notice disconnects
+                    yield ": ping\n\n"
+                    continue
+                if event is RESET:
+                    yield _sse(None, "{}", "reset")
+                    return
+                event_id, data = event
+                if event_id in replayed:
+                    continue
+                yield _sse(event_id, data)
+        finally:
+            notification_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@remark_router.get("/notifications/unread_count")
+def get_unread_count(user=Depends(get_current_user)):
+    """Number of unread notifications for the badge; a single primary-key lookup."""
+    return {"unread": unread_count(getattr(user, "e_id", None))}
 
 
 @remark_router.post("/notifications/markread")
 def mark_notification_read(remark_id: str = Form(...), user=Depends(get_current_user)):
-    """Mark a remark as read by adding current user's e_id to read_by array."""
-    try:
-        uid = getattr(user, "e_id", None)
-        if not uid:
-            raise HTTPException(status_code=400, detail="User id missing")
-        remarks_collection.update_one({"_id": ObjectId(remark_id)}, {"$addToSet": {"read_by": uid}})
-        return {"detail": "Marked read"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    """Mark a remark as read in the current user's read state."""
+    uid = getattr(user, "e_id", None)
+    if not uid:
+        raise HTTPException(status_code=400, detail="User id missing")
+    mark_read(uid, remark_id)
+    return {"detail": "Marked read"}
+
+
+@remark_router.post("/notifications/markallread")
+def mark_all_notifications_read(user=Depends(get_current_user)):
+    """Mark every current notification read with one write."""
+    uid = getattr(user, "e_id", None)
+    if not uid:
+        raise HTTPException(status_code=400, detail="User id missing")
+    mark_all_read(uid)
+    return {"detail": "Marked all read"}
 
-# @remark_router.get("/getbytask", response_model=List[RemarkReqRes])
+# @remark_router.get("/getbytask", response_class=StreamingResponse)
 # def list_for_task(task_id: int):
 #     try:
 #         remarks = get_remarks_for_task(task_id)
@@ -1,21 +1,53 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Query, Response
 import os
+from datetime import datetime
+from app.crud.task_crud import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from app.crud.task_crud import add_task, get_all_tasks, get_task_by_id,get_task_by_status,patch_status,update_task, delete_task
-from app.crud.attachment_crud import add_attachment, get_attachments
-from app.crud.attachment_crud import delete_attachment_by_id, delete_attachments_by_task_and_creator
+from app.crud.attachment_crud import get_attachments
+from app.crud.attachment_crud import delete_attachment_by_id, replace_attachments
+from app.crud.remarks_crud import can_link_blob
+from app.utils.attachment_io import run_io, write_temp, publish, discard, safe_filename
+from app.utils.blob_store import store_upload, add_ref, release_blob, is_blob_id
 from app.core.security import get_current_user
-from app.models.models import TaskReqRes, UserRole
-from typing import List
+from app.core.dependencies import get_db
+from app.models.models import TaskReqRes, TaskStatus, TaskPriority, UserRole
+from app.middleware.request_timing import TimedRoute
+from app.database.mongo_health import mongo_breaker, require_mongo, is_mongo_unavailable
+from typing import List, Literal, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 
-task_router = APIRouter(prefix="/Task", tags=["Task"])
+task_router = APIRouter(prefix="/Task", tags=["Task"], route_class=TimedRoute)
 
 
 @task_router.get("/getall", response_model=List[TaskReqRes])
-def get_all(role: UserRole,user=Depends(get_current_user)):
+async def get_all(
+    role: UserRole,
+    response: Response,
+    status: Optional[TaskStatus] = None,
+    priority: Optional[TaskPriority] = None,
+    assigned_to: Optional[int] = None,
+    reviewer: Optional[int] = None,
+    due_from: Optional[datetime] = None,
+    due_to: Optional[datetime] = None,
+    sort: Literal["t_id", "updated_at"] = "t_id",
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user=Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
+):
+    """
+    Keyset-paginated task listing. The body is the page of tasks; when more rows exist
+    the opaque token for the next page is returned in the X-Next-Cursor header.
+    """
     try:
-        tasks = get_all_tasks(role,user)
-        if not tasks:
-            raise HTTPException(status_code=404, detail="No tasks found")
+        tasks, next_cursor = await get_all_tasks(
+            session, role, user,
+            status=status, priority=priority, assigned_to=assigned_to, reviewer=reviewer,
+            due_from=due_from, due_to=due_to, cursor=cursor, limit=limit, sort=sort,
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        # an empty page is a valid result, not a missing resource
         return tasks
     except HTTPException as e:
         raise e
@@ -23,23 +55,28 @@ def get_all(role: UserRole,user=Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 @task_router.get("/getbystatus",response_model=List[TaskReqRes])
-def get_by_status(status,role,user=Depends(get_current_user)):
+async def get_by_status(status: str,role,user=Depends(get_current_user),session: AsyncSession = Depends(get_db)):
     try:
         # allow Admin to assume other roles
         if role not in user.roles and "Admin" not in user.roles:
             raise HTTPException(status_code=409,detail="The user doesnt have the mentioned role")
-        return get_task_by_status(status,role,user)
+        # any casing of a status is accepted; an unknown one matches no task, as it always has
+        try:
+            status = TaskStatus(status.strip().lower())
+        except ValueError:
+            return []
+        return await get_task_by_status(session, status,role,user)
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 @task_router.post("/create")
-def add_new_task(role: UserRole,new_task: TaskReqRes,user=Depends(get_current_user)):
+async def add_new_task(role: UserRole,new_task: TaskReqRes,user=Depends(get_current_user),session: AsyncSession = Depends(get_db)):
     try:
         if role != "Manager" and role != "Admin":
             raise HTTPException(status_code=409,detail="The user doesnt have the mentioned role")
-        t = add_task(new_task,role,user)
+        t = await add_task(session, new_task,role,user)
         return {"detail": "Task Added Successfully", "task": t}
     except HTTPException as e:
         raise e
@@ -48,9 +85,9 @@ def add_new_task(role: UserRole,new_task: TaskReqRes,user=Depends(get_current_us
 
 
 @task_router.get("/get", response_model=TaskReqRes)
-def get_by_id(id: int,user=Depends(get_current_user)):
+async def get_by_id(id: int,user=Depends(get_current_user),session: AsyncSession = Depends(get_db)):
     try:
-        t = get_task_by_id(id,user)
+        t = await get_task_by_id(session, id)
         return t
     except HTTPException as e:
         raise e
@@ -59,14 +96,14 @@ def get_by_id(id: int,user=Depends(get_current_user)):
 
 
 @task_router.put("/update")
-def update_task_data(id: int, new_data: dict,role,user=Depends(get_current_user)):
+async def update_task_data(id: int, new_data: dict,role,user=Depends(get_current_user),session: AsyncSession = Depends(get_db)):
     try:
         # allow Admin to assume other roles
         if role not in user.roles and "Admin" not in user.roles:
             raise HTTPException(status_code=409, detail="The user doesnt have the mentioned role")
 
         # allow Admins and Managers to update tasks (Admin may not act as reviewer)
-        updated = update_task(id, new_data, role, user)
+        updated = await update_task(session, id, new_data, role, user)
         return {"detail": "Task Updated Successfully", "task": updated}
     except HTTPException as e:
         raise e
@@ -74,12 +111,12 @@ def update_task_data(id: int, new_data: dict,role,user=Depends(get_current_user)
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 @task_router.patch("/patch")
-def patch_stat(id,status,role,user=Depends(get_current_user)):
+async def patch_stat(id,status,role,user=Depends(get_current_user),session: AsyncSession = Depends(get_db)):
     try:
         # allow Admin to assume other roles
         if role not in user.roles and "Admin" not in user.roles:
             raise HTTPException(status_code=409,detail="The user doesnt have the mentioned role")
-        patched=patch_status(id,status,role,user)
+        patched=await patch_status(session, id,status,role,user)
         return {"detail":"Patched the task"}
     except HTTPException as e:
         raise e
@@ -88,12 +125,12 @@ def patch_stat(id,status,role,user=Depends(get_current_user)):
 
 
 @task_router.delete("/delete")
-def delete_task_by_id(id: int,role,user=Depends(get_current_user)):
+async def delete_task_by_id(id: int,role,user=Depends(get_current_user),session: AsyncSession = Depends(get_db)):
     try:
         # delete allowed only when acting as Admin (or if user actually has Admin role)
         if role.upper()!="ADMIN" and "Admin" not in user.roles:
             raise HTTPException(status_code=409,detail="Only the Admin can delete the task")
-        resp = delete_task(role,user,id)
+        resp = await delete_task(session, role,user,id)
         return resp
     except HTTPException as e:
         raise e
@@ -102,16 +139,23 @@ def delete_task_by_id(id: int,role,user=Depends(get_current_user)):
 
 
 @task_router.post("/attach")
-def attach_file(
+async def attach_file(
     id: int,
     role: str = Form(...),
     remark: str = Form(""),
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    sha256: Optional[str] = Form(None),
+    filename: Optional[str] = Form(None),
     user=Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
 ):
     """
     Attach a file to a task. Expects multipart/form-data with file and remark.
     Form fields: role (string), remark (optional), file (UploadFile). Query param id (task id) required.
+    Content the user can already see (on a task or remark) can be attached without uploading it:
+    send sha256 (hex) and filename instead of file; 404 means upload the file.
+    Files go to the GridFS blob store; while MongoDB is down they are written to
+    uploads/<task_id>/ instead and are not deduplicated.
     """
     try:
         # role validation
@@ -119,33 +163,56 @@ def attach_file(
         if role and role not in user.roles and "Admin" not in user.roles:
             raise HTTPException(status_code=409, detail="The user doesnt have the mentioned role")
 
-        # remove previous attachments by this user for this task (replacement behaviour)
+        if file is not None:
+            name = safe_filename(file.filename)
+            if mongo_breaker.is_open:
+                att = await _attach_to_disk(session, int(id), name, file, remark, user)
+                return {"detail": "Attachment saved", "attachment": att}
+            # hashed from the spool, then streamed into GridFS unless the content is already stored
+            blob_id = await run_io(store_upload, file)
+        else:
+            require_mongo()
+            if not sha256 or not is_blob_id(sha256.lower()):
+                raise HTTPException(status_code=400, detail="Send a file, or the sha256 of one already stored")
+            name = safe_filename(filename)
+            blob_id = sha256.lower()
+            # knowing a hash is not access to the content: only content the user can already read
+            # can be linked, and "not visible" answers the same as "not stored"
+            if not await can_link_blob(session, user, blob_id) or not await run_io(add_ref, blob_id):
+                raise HTTPException(status_code=404, detail="Unknown content; upload the file")
+
+        # earlier attachments by this user are replaced in the same commit (replacement behaviour)
         try:
-            delete_attachments_by_task_and_creator(int(id), getattr(user, "e_id", None))
-        except Exception:
-            # don't block upload if cleanup fails
-            pass
-
-        # save file to uploads/<task_id>/filename
-        uploads_dir = os.path.join(os.getcwd(), "uploads")
-        task_dir = os.path.join(uploads_dir, str(id))
-        os.makedirs(task_dir, exist_ok=True)
-        dest_path = os.path.join(task_dir, file.filename)
-        with open(dest_path, "wb") as out_file:
-            content = file.file.read()
-            out_file.write(content)
-
-        # record attachment in DB
-        att = add_attachment(int(id), file.filename, dest_path, remark, user)
+            att = await replace_attachments(session, int(id), name, blob_id, remark, user)
+        except BaseException:
+            await run_io(release_blob, blob_id)
+            raise
         return {"detail": "Attachment saved", "attachment": att}
     except HTTPException as e:
         raise e
     except Exception as e:
+        if is_mongo_unavailable(e):
+            raise  # error handler turns this into a 503 and trips the breaker
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 
+async def _attach_to_disk(session: AsyncSession, task_id: int, name: str, file: UploadFile, remark: str, user):
+    """Degraded mode: stream the upload to uploads/<task_id>/<name> and record a row without a blob."""
+    task_dir = os.path.join(os.getcwd(), "uploads", str(task_id))
+    dest_path = os.path.join(task_dir, name)
+    temp_path, size, sha256 = await run_io(write_temp, file, task_dir)
+    try:
+        att = await replace_attachments(session, task_id, name, None, remark, user, filepath=dest_path)
+    except BaseException:
+        await run_io(discard, temp_path)
+        raise
+    await run_io(publish, temp_path, dest_path)
+    att.update({"size": size, "sha256": sha256})
+    return att
+
+
 @task_router.get("/attachments")
-def list_attachments(id: int, role, user=Depends(get_current_user)):
+async def list_attachments(id: int, role, user=Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     try:
         # permission: managers/admins can view, developers can view only their assigned tasks
         if role == "Manager" and "Manager" not in user.roles:
@@ -153,7 +220,7 @@ def list_attachments(id: int, role, user=Depends(get_current_user)):
         if role == "Developer" and "Developer" not in user.roles:
             raise HTTPException(status_code=403, detail="Not Authorized")
 
-        attachments = get_attachments(int(id))
+        attachments = await get_attachments(session, int(id))
         return attachments
     except HTTPException as e:
         raise e
@@ -163,14 +230,14 @@ def list_attachments(id: int, role, user=Depends(get_current_user)):
 
 
 @task_router.delete("/attachment")
-def delete_attachment(id: int, role: str, user=Depends(get_current_user)):
+async def delete_attachment(id: int, role: str, user=Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """Delete an attachment by its DB id. Requires role and current user (permission enforced in CRUD)."""
     try:
         # role validation: allow Admin/Manager/Developer checks via existing security
         if role and role not in user.roles and "Admin" not in user.roles:
             raise HTTPException(status_code=409, detail="The user doesnt have the mentioned role")
 
-        resp = delete_attachment_by_id(int(id), user=user)
+        resp = await delete_attachment_by_id(session, int(id), user=user)
         return resp
     except HTTPException as e:
         raise e
@@ -1,15 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.dependencies import get_db
 from app.crud.users_crud import add_user, get_all_users, get_user_by_id, update_user, delete_user
 from app.models.models import UserReqRes
+from app.middleware.request_timing import TimedRoute
 from typing import List
 
-users_router = APIRouter(prefix="/Users", tags=["Users"])
+users_router = APIRouter(prefix="/Users", tags=["Users"], route_class=TimedRoute)
 
 
 @users_router.get("/getall", response_model=List[UserReqRes])
-def get_all():
+async def get_all(session: AsyncSession = Depends(get_db)):
     try:
-        users = get_all_users()
+        users = await get_all_users(session)
         if not users:
             raise HTTPException(status_code=404, detail="No users found")
         return users
@@ -20,9 +23,9 @@ def get_all():
 
 
 @users_router.post("/create")
-def add_new_user(new_user: UserReqRes):
+async def add_new_user(new_user: UserReqRes, session: AsyncSession = Depends(get_db)):
     try:
-        u = add_user(new_user)
+        u = await add_user(session, new_user)
         return {"detail": "User Added Successfully", "user": u}
     except HTTPException as e:
         raise e
@@ -31,9 +34,9 @@ def add_new_user(new_user: UserReqRes):
 
 
 @users_router.get("/get", response_model=UserReqRes)
-def get_by_id(id: int):
+async def get_by_id(id: int, session: AsyncSession = Depends(get_db)):
     try:
-        u = get_user_by_id(id)
+        u = await get_user_by_id(session, id)
         return u
     except HTTPException as e:
         raise e
@@ -42,9 +45,9 @@ def get_by_id(id: int):
 
 
 @users_router.put("/update")
-def update_user_data(id: int, new_data: dict):
+async def update_user_data(id: int, new_data: dict, session: AsyncSession = Depends(get_db)):
     try:
-        updated = update_user(id, new_data)
+        updated = await update_user(session, id, new_data)
         return {"detail": "User Updated Successfully", "user": updated}
     except HTTPException as e:
         raise e
@@ -53,9 +56,9 @@ def update_user_data(id: int, new_data: dict):
 
 
 @users_router.delete("/delete")
-def delete_user_by_id(id: int):
+async def delete_user_by_id(id: int, session: AsyncSession = Depends(get_db)):
     try:
-        resp = delete_user(id)
+        resp = await delete_user(session, id)
         return resp
     except HTTPException as e:
         raise e
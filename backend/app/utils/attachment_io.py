@@ -0,0 +1,97 @@
+"""
+Disk writes for attachments
+Uploads are copied in fixed-size chunks to a temp file next to their final
+path, hashed as they go, fsynced and only then renamed into place. All of it
+runs on a small dedicated executor so large uploads cannot take over the
+threadpool that serves sync endpoints
+"""
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from dotenv import load_dotenv
+from app.utils.file_upload import UPLOAD_CHUNK_SIZE, UPLOAD_MAX_BYTES, upload_too_large
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import uuid
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_IO_WORKERS = int(os.getenv("ATTACHMENT_IO_WORKERS", "4"))
+
+io_executor = ThreadPoolExecutor(max_workers=ATTACHMENT_IO_WORKERS, thread_name_prefix="attachment-io")
+
+
+async def run_io(fn, *args):
+    """Run blocking file I/O on the attachment executor."""
+    return await asyncio.get_running_loop().run_in_executor(io_executor, functools.partial(fn, *args))
+
+
+def safe_filename(filename: str) -> str:
+    # a client-supplied name must not carry a directory part
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid file name")
+    return name
+
+
+def write_temp(file, directory: str):
+    """Stream the upload into a temp file in `directory`; returns (temp path, size, sha256 hex).
+
+    The temp file is fsynced before returning. Over UPLOAD_MAX_BYTES it is
+    removed and a 413 raised.
+    """
+    if UPLOAD_MAX_BYTES and (getattr(file, "size", None) or 0) > UPLOAD_MAX_BYTES:
+        raise upload_too_large()
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    file.file.seek(0)
+    try:
+        with open(temp_path, "wb") as out:
+            while True:
+                chunk = file.file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if UPLOAD_MAX_BYTES and size > UPLOAD_MAX_BYTES:
+                    raise upload_too_large()
+                digest.update(chunk)
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+    except BaseException:
+        discard(temp_path)
+        raise
+    return temp_path, size, digest.hexdigest()
+
+
+def _fsync_dir(directory: str):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # not supported on this platform (e.g. Windows)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def publish(temp_path: str, dest_path: str):
+    """Atomically move the temp file to `dest_path`."""
+    os.replace(temp_path, dest_path)
+    # the rename is only durable once the directory entry is
+    _fsync_dir(os.path.dirname(dest_path))
+
+
+def discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to remove {path}: {str(e)}")
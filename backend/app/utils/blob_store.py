@@ -0,0 +1,174 @@
+"""
+Content-addressed attachment store in GridFS
+Task attachments and remark files are kept once per distinct content. The
+`blobs` table maps each SHA-256 to the GridFS file holding it and counts the
+attachment rows and remarks referencing it; the file is removed with the last
+reference. Everything here blocks: call it through attachment_io.run_io
+"""
+from bson import ObjectId
+from fastapi import HTTPException
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from app.database.mysql_connection import get_connection
+from app.database.mongodb_connection import get_fs
+from app.schemas.schemas import BlobSchema
+from app.utils.file_upload import UPLOAD_CHUNK_SIZE, UPLOAD_MAX_BYTES, upload_too_large
+import hashlib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_BLOB_ID = re.compile(r"^[0-9a-f]{64}$")
+# attempts to either reference or create a blob while another request releases or stores it
+_CLAIM_ATTEMPTS = 5
+
+
+def is_blob_id(value) -> bool:
+    return isinstance(value, str) and bool(_BLOB_ID.match(value))
+
+
+def _read_chunks(file):
+    """Yield the upload spool in UPLOAD_CHUNK_SIZE pieces, enforcing UPLOAD_MAX_BYTES as it goes."""
+    if UPLOAD_MAX_BYTES and (getattr(file, "size", None) or 0) > UPLOAD_MAX_BYTES:
+        raise upload_too_large()
+    file.file.seek(0)
+    size = 0
+    while True:
+        chunk = file.file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return
+        size += len(chunk)
+        if UPLOAD_MAX_BYTES and size > UPLOAD_MAX_BYTES:
+            raise upload_too_large()
+        yield chunk
+
+
+def hash_upload(file):
+    """(sha256 hex, size) of an UploadFile, read from its local spool one chunk at a time."""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in _read_chunks(file):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _store(file, blob_id: str) -> ObjectId:
+    # stream into a GridFS file of its own; it only becomes the blob once a `blobs` row points at it
+    grid_in = get_fs().new_file(
+        filename=file.filename,
+        content_type=file.content_type,
+        chunk_size=UPLOAD_CHUNK_SIZE,
+        metadata={"sha256": blob_id, "content_type": file.content_type},
+    )
+    digest = hashlib.sha256()
+    try:
+        for chunk in _read_chunks(file):
+            digest.update(chunk)
+            grid_in.write(chunk)
+        if digest.hexdigest() != blob_id:
+            raise HTTPException(status_code=409, detail="Upload changed while it was being stored")
+        grid_in.close()
+    except BaseException:
+        grid_in.abort()
+        raise
+    return grid_in._id
+
+
+def _delete_grid_file(file_id):
+    try:
+        get_fs().delete(ObjectId(file_id))
+    except Exception as e:
+        logger.warning(f"Failed to delete GridFS file {file_id}: {str(e)}")
+
+
+def store_upload(file) -> str:
+    """Store an UploadFile and return its blob id, holding one new reference to it.
+
+    The spool is hashed first (413 over UPLOAD_MAX_BYTES); content that is
+    already stored only gains a reference and is not written again. New content
+    is streamed into GridFS chunk by chunk with metadata.sha256 set.
+    """
+    blob_id, size = hash_upload(file)
+    for _ in range(_CLAIM_ATTEMPTS):
+        if _claim_existing(blob_id, file):
+            return blob_id
+        if _create(blob_id, size, file):
+            return blob_id
+    raise HTTPException(status_code=503, detail="Attachment store is busy, try again")
+
+
+def _claim_existing(blob_id: str, file=None) -> bool:
+    with get_connection() as session:
+        claimed = session.execute(
+            update(BlobSchema).where(BlobSchema.blob_id == blob_id, BlobSchema.refs > 0).values(refs=BlobSchema.refs + 1)
+        ).rowcount
+        gen = session.execute(select(BlobSchema.gen).where(BlobSchema.blob_id == blob_id)).scalar() if claimed else None
+        session.commit()
+    if not claimed:
+        return False
+    if file is not None and not get_fs().exists(ObjectId(gen)):
+        # the file went missing (manual cleanup, a commit that failed after it landed); this upload
+        # has the same content, so it becomes the blob's file
+        new_id = _store(file, blob_id)
+        with get_connection() as session:
+            repaired = session.execute(
+                update(BlobSchema).where(BlobSchema.blob_id == blob_id, BlobSchema.gen == gen).values(gen=str(new_id))
+            ).rowcount
+            session.commit()
+        if not repaired:
+            _delete_grid_file(new_id)
+    return True
+
+
+def _create(blob_id: str, size: int, file) -> bool:
+    file_id = _store(file, blob_id)
+    with get_connection() as session:
+        session.add(BlobSchema(blob_id=blob_id, gen=str(file_id), size=size, refs=1, created_at=datetime.now()))
+        try:
+            session.commit()
+            return True
+        except BaseException as e:
+            # whatever went wrong, no committed row points at the file: it must not outlive this call
+            session.rollback()
+            _delete_grid_file(file_id)
+            if isinstance(e, IntegrityError):
+                # stored concurrently; reference theirs on the next attempt
+                return False
+            raise
+
+
+def add_ref(blob_id: str) -> bool:
+    """Take one more reference to a stored blob; False when no live blob has that id."""
+    return _claim_existing(blob_id)
+
+
+def release_blob(blob_id: str):
+    """Drop one reference; the GridFS file goes with the last one."""
+    file_id = None
+    with get_connection() as session:
+        session.execute(update(BlobSchema).where(BlobSchema.blob_id == blob_id).values(refs=BlobSchema.refs - 1))
+        row = session.execute(select(BlobSchema.gen, BlobSchema.refs).where(BlobSchema.blob_id == blob_id)).first()
+        if row is not None and row.refs <= 0:
+            # a concurrent add_ref only succeeds while refs > 0, so whoever deletes the row owns the file
+            if session.execute(delete(BlobSchema).where(BlobSchema.blob_id == blob_id, BlobSchema.refs <= 0)).rowcount:
+                file_id = row.gen
+        session.commit()
+    if file_id:
+        _delete_grid_file(file_id)
+
+
+def open_blob(blob_id: str):
+    """GridOut of a stored blob; raises KeyError when it is not stored."""
+    from gridfs.errors import NoFile
+
+    with get_connection() as session:
+        gen = session.execute(select(BlobSchema.gen).where(BlobSchema.blob_id == blob_id, BlobSchema.refs > 0)).scalar()
+    if gen is None:
+        raise KeyError(blob_id)
+    try:
+        return get_fs().get(ObjectId(gen))
+    except NoFile:
+        raise KeyError(blob_id)
@@ -1,26 +1,42 @@
-from gridfs import GridFS
-from app.database.mongodb_connection import mongodb
-
+"""
+Upload limits and GridFS access for remark files stored before the blob store
+New uploads go to app.utils.blob_store; remarks written earlier keep a GridFS
+ObjectId in file_id and are still served and deleted from here
+"""
 from bson import ObjectId
-from app.database.mongodb_connection import fs
+from fastapi import HTTPException
+from dotenv import load_dotenv
+from app.database.mongodb_connection import get_fs
+import logging
+import os
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
 
-fs = GridFS(mongodb)
+# read size from the upload spool
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(255 * 1024)))
+# 0 disables the limit
+UPLOAD_MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "50")) * 1024 * 1024)
 
 
-def save_file(file):
-    content = file.file.read()
-    file_id = fs.put(
-        content,
-        filename=file.filename,
-        content_type=file.content_type
-    )
-    return str(file_id)
+def upload_too_large():
+    return HTTPException(status_code=413, detail=f"File exceeds the {UPLOAD_MAX_BYTES // (1024 * 1024)} MB upload limit")
 
 
+def open_file(file_id: str):
+    """GridOut for a GridFS ObjectId string; raises KeyError when missing."""
+    from gridfs.errors import NoFile
+
+    try:
+        return get_fs().get(ObjectId(file_id))
+    except NoFile:
+        raise KeyError(file_id)
 
 
 def delete_file(file_id: str):
     try:
-        fs.delete(ObjectId(file_id))
-    except Exception:
-        pass  # safe delete (file may already be gone)
+        get_fs().delete(ObjectId(file_id))
+    except Exception as e:
+        # safe delete (file may already be gone)
+        logger.warning(f"Failed to delete file {file_id}: {str(e)}")
@@ -0,0 +1,21 @@
+import base64
+import json
+from fastapi import HTTPException
+
+
+def encode_cursor(data: dict) -> str:
+    """Encode keyset position into an opaque, url-safe cursor token."""
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> dict:
+    """Decode a cursor produced by encode_cursor. Raises 400 on malformed tokens."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(data, dict):
+            raise ValueError("cursor payload must be an object")
+        return data
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
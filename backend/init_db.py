@@ -1,22 +1,24 @@
 """
 Database initialization script
-Run this script to create all database tables
+Run this script to create all database tables (same as `python migrate.py`)
 """
 
-from app.database.mysql_connection import engine, Base
-from app.models.models import EmployeeReqRes, UserReqRes, TaskReqRes
+from app.database.mysql_connection import engine
+from app.database.migrations import upgrade
 
 def init_database():
     """Create all database tables"""
     print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
+    applied = upgrade(engine)
     print("✅ Database tables created successfully!")
-    print("\nTables created:")
+    if applied:
+        print(f"\nMigrations applied: {', '.join(applied)}")
+    print("\nTables:")
     print("  - employees")
     print("  - users")
     print("  - tasks")
+    print("  - attachments")
     print("\nYou can now start the server with: python -m uvicorn main:app --reload")
 
 if __name__ == "__main__":
     init_database()
-
@@ -1,14 +1,38 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response, Request, Depends, HTTPException
+from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from app.routers.employee_router import employee_router
 from app.routers.user_router import users_router
 from app.routers.task_router import task_router
 from app.routers.remark_router import remark_router
 from app.routers.auth_router import auth_router
+from app.routers.admin_router import admin_router
+from app.routers.file_router import file_router, file_response
+from app.utils.blob_store import open_blob
+from app.database.mongo_health import require_mongo
+from app.crud.attachment_crud import find_attachment
+from app.core.dependencies import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.middleware.error_handler import error_handler_middleware
 from app.middleware.logging_middleware import logging_middleware
+from app.middleware.log_writer import log_writer
+from app.middleware.latency_rollup import rollup_job
+from app.middleware.log_storage import log_archiver
+from app.middleware.metrics import metrics_middleware, instrument_engine, render_metrics, mark_worker_dead
+from app.middleware.request_timing import server_timing_middleware, track_engine
+from app.middleware.slow_queries import slow_query_log
+from app.middleware.profiling import profiling_middleware
+from app.database.mysql_connection import engine, async_engine
+from app.schemas.schemas import check_indexes
+from app.crud.remarks_crud import ensure_remark_indexes, backfill_notify_to
+from app.core.principal_cache import start_invalidation_channel, stop_invalidation_channel
+from app.core.notification_hub import notification_hub
+from app.core.remark_sync import remark_sync
+from app.utils.attachment_io import io_executor, run_io
+from app.core.revocation import start_token_state_refresh, stop_token_state_refresh
 from dotenv import load_dotenv
+import asyncio
+import logging
 import os
 
 load_dotenv()
@@ -35,11 +59,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Range", "Accept-Ranges"],
 )
 
 # Add custom middleware
 app.middleware("http")(error_handler_middleware)
 app.middleware("http")(logging_middleware)
+app.middleware("http")(metrics_middleware)
+app.middleware("http")(server_timing_middleware)
+app.middleware("http")(profiling_middleware)
+
+# SQL statement timings and pool usage for /metrics, per-request counts for Server-Timing, slow query log
+instrument_engine(async_engine.sync_engine, "async")
+instrument_engine(engine, "sync")
+track_engine(async_engine.sync_engine)
+slow_query_log.watch_engine(async_engine.sync_engine, "async")
+slow_query_log.watch_engine(engine, "sync")
 
 # Include routers with API prefix
 app.include_router(auth_router, prefix="/api", tags=["Authentication"])
@@ -47,11 +82,103 @@ app.include_router(employee_router, prefix="/api", tags=["Employees"])
 app.include_router(users_router, prefix="/api", tags=["Users"])
 app.include_router(task_router, prefix="/api", tags=["Tasks"])
 app.include_router(remark_router, prefix="/api", tags=["Remarks"])
+app.include_router(admin_router, prefix="/api", tags=["Admin"])
+app.include_router(file_router, prefix="/api", tags=["Files"])
+
+def _verify_schema():
+    # warn if the hot-path indexes were never created (run migrate.py to add them)
+    try:
+        check_indexes()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Schema index check failed: {str(e)}")
+
+@app.on_event("startup")
+async def verify_schema():
+    # run the check in the background so a slow database does not delay serving
+    asyncio.get_running_loop().run_in_executor(None, _verify_schema)
+
+def _prepare_remarks():
+    # index notifications read, then fill notify_to on remarks written before it existed
+    try:
+        ensure_remark_indexes()
+        filled = backfill_notify_to()
+        if filled:
+            logging.getLogger(__name__).info(f"Backfilled notify_to on {filled} remarks")
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Remark index setup failed: {str(e)}")
+
+@app.on_event("startup")
+async def prepare_remarks():
+    asyncio.get_running_loop().run_in_executor(None, _prepare_remarks)
+
+@app.on_event("startup")
+async def start_log_writer():
+    log_writer.start()
+
+@app.on_event("shutdown")
+async def flush_log_writer():
+    # flush queued request logs before the worker exits
+    await log_writer.stop()
+
+@app.on_event("startup")
+async def start_latency_rollup():
+    rollup_job.start()
+    log_archiver.start()
+
+@app.on_event("shutdown")
+async def stop_latency_rollup():
+    rollup_job.stop()
+    log_archiver.stop()
+
+@app.on_event("shutdown")
+async def finish_attachment_writes():
+    # let in-flight attachment uploads finish instead of leaving partial files behind
+    await asyncio.get_running_loop().run_in_executor(None, io_executor.shutdown)
+
+@app.on_event("shutdown")
+async def release_metrics():
+    mark_worker_dead()
+
+@app.on_event("startup")
+async def start_notification_hub():
+    # choosing the backend asks MongoDB whether it is a replica set; do not hold up serving
+    asyncio.get_running_loop().run_in_executor(None, notification_hub.start)
+
+@app.on_event("shutdown")
+async def stop_notification_hub():
+    notification_hub.stop()
+    await remark_sync.stop()
+
+@app.on_event("startup")
+async def start_cache_invalidation():
+    start_invalidation_channel()
+    start_token_state_refresh()
+
+@app.on_event("shutdown")
+async def stop_cache_invalidation():
+    stop_invalidation_channel()
+    stop_token_state_refresh()
 
 # Serve uploaded files
 uploads_dir = os.path.join(os.getcwd(), "uploads")
 os.makedirs(uploads_dir, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
+
+@app.get("/uploads/{task_id}/{filename}", include_in_schema=False)
+async def task_upload(task_id: int, filename: str, request: Request, session: AsyncSession = Depends(get_db)):
+    # attachments now live in the blob store; keep the /uploads/<task_id>/<filename> links working
+    att = await find_attachment(session, task_id, filename)
+    if att is not None and att.blob_id:
+        require_mongo()
+        try:
+            grid_out = await run_io(open_blob, att.blob_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="File not found")
+        return file_response(grid_out, request)
+    # rows written to disk before the blob store, or while MongoDB was down
+    path = os.path.join(uploads_dir, str(task_id), os.path.basename(filename))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(path)
 
 @app.get("/", tags=["Root"])
 async def root():
@@ -61,6 +188,11 @@ async def root():
         "docs": "/docs"
     }
 
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health", tags=["Health"])
 async def health_check():
     return {"status": "healthy", "service": "UST Employee Management API"}
\ No newline at end of file
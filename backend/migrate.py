@@ -0,0 +1,34 @@
+"""
+Schema migration command
+Run this script to bring the database schema up to date:
+
+    python migrate.py            apply pending migrations
+    python migrate.py --status   list applied and pending migrations
+"""
+
+import sys
+from app.database.mysql_connection import engine
+from app.database.migrations import MIGRATIONS, applied_versions, upgrade
+
+
+def show_status():
+    done = applied_versions(engine)
+    for version, description, _ in MIGRATIONS:
+        mark = "applied" if version in done else "pending"
+        print(f"  {version}  [{mark}]  {description}")
+
+
+def run_migrations():
+    print("Applying migrations...")
+    applied = upgrade(engine)
+    if applied:
+        print(f"✅ Applied: {', '.join(applied)}")
+    else:
+        print("✅ Schema already up to date")
+
+
+if __name__ == "__main__":
+    if "--status" in sys.argv[1:]:
+        show_status()
+    else:
+        run_migrations()
@@ -0,0 +1,125 @@
+"""
+Shared fixtures: a throwaway SQLite database stands in for MySQL and mongomock
+for MongoDB. The environment is set before anything under app/ is imported
+"""
+import os
+import tempfile
+
+_DB_DIR = tempfile.mkdtemp(prefix="ust-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/test.db"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{_DB_DIR}/test.db"
+# nothing listens here: code that slips past the mongomock fixture fails fast instead of hanging
+os.environ["MONGO_URI"] = "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=50&connectTimeoutMS=50"
+os.environ["PRINCIPAL_CACHE_CHANNEL"] = ""
+os.environ["JWT_EMBED_CLAIMS"] = "false"
+
+from datetime import datetime
+import functools
+import mongomock
+import mongomock.gridfs
+import pytest
+
+mongomock.gridfs.enable_gridfs_integration()
+
+# pymongo newer than the pinned 4.6 passes `sort` to bulk update builders; mongomock 4.3 predates it
+_add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+
+def _add_update_without_sort(self, *args, sort=None, **kwargs):
+    return _add_update(self, *args, **kwargs)
+
+
+mongomock.collection.BulkOperationBuilder.add_update = _add_update_without_sort
+# mongomock only makes regular collections, which report no creation options
+mongomock.collection.Collection.options = lambda self: {}
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    """Fresh tables for one test; yields a sync session for setting up rows."""
+    from app.database.mysql_connection import Base, engine, SessionLocal
+    import app.schemas.schemas  # noqa: F401  registers the tables on Base
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """An empty mongomock database behind get_client(); yields the app's Mongo database."""
+    import app.database.mongodb_connection as mc
+    from app.database.mongo_health import mongo_breaker
+
+    client = mongomock.MongoClient()
+    # cached like the real one, which memory diagnostics report on
+    monkeypatch.setattr(mc, "get_client", functools.lru_cache(maxsize=1)(lambda: client))
+    mc.get_fs.cache_clear()
+    mongo_breaker.record_success()
+    yield mc.get_mongodb()
+    mc.get_fs.cache_clear()
+    mongo_breaker.record_success()
+
+
+@pytest.fixture
+def client(db, mongo):
+    from fastapi.testclient import TestClient
+    from app.core.principal_cache import principal_cache
+    from main import app
+
+    # no lifespan: startup would launch the background jobs, which tests drive directly
+    principal_cache.clear()
+    yield TestClient(app)
+    principal_cache.clear()
+
+
+@pytest.fixture
+def make_user(db):
+    from app.schemas.schemas import EmployeeSchema, UserSchema
+
+    def make(e_id: int, roles=("Manager",), password: str = "secret1", status: str = "active"):
+        db.add(EmployeeSchema(e_id=e_id, name="Test User", email=f"user{e_id}@ust.com", designation="Engineer", mgr_id=0))
+        db.add(UserSchema(e_id=e_id, password=password, roles=list(roles), status=status))
+        db.commit()
+        return e_id
+
+    return make
+
+
+@pytest.fixture
+def make_task(db):
+    from app.schemas.schemas import TaskSchema, TaskStatus, TaskPriority
+
+    def make(t_id: int, assigned_by: int = 1, assigned_to: int = None, reviewer: int = None,
+             status=TaskStatus.TO_DO, priority=TaskPriority.LOW, updated_at: datetime = None,
+             expected_closure: datetime = datetime(2026, 1, 1)):
+        task = TaskSchema(
+            t_id=t_id, title=f"task {t_id}", description=f"description {t_id}",
+            assigned_by=assigned_by, assigned_to=assigned_to, reviewer=reviewer, created_by=assigned_by,
+            status=status, priority=priority, updated_at=updated_at, expected_closure=expected_closure,
+        )
+        db.add(task)
+        db.commit()
+        return t_id
+
+    return make
+
+
+@pytest.fixture
+def login(client):
+    """Bearer headers for a user created with make_user."""
+    def headers(e_id: int, password: str = "secret1") -> dict:
+        r = client.post("/api/auth/login", json={"e_id": e_id, "password": password})
+        assert r.status_code == 200, r.text
+        return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    return headers
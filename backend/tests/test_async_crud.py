@@ -0,0 +1,61 @@
+import inspect
+import pytest
+from fastapi import HTTPException
+from app.crud import employee_crud, users_crud, task_crud, attachment_crud
+from app.database.mysql_connection import get_async_connection
+from app.models.models import EmployeeReqRes, UserReqRes
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("module", [employee_crud, users_crud, task_crud, attachment_crud])
+def test_public_crud_functions_are_coroutines(module):
+    # a sync function here would block the event loop on MySQL
+    for name, fn in inspect.getmembers(module, inspect.isfunction):
+        if fn.__module__ == module.__name__ and not name.startswith("_"):
+            assert inspect.iscoroutinefunction(fn), name
+
+
+async def test_employee_round_trip(db):
+    async with get_async_connection() as session:
+        emp = await employee_crud.add_emplyee(session, EmployeeReqRes(
+            name="Asha Rao", email="asha@ust.com", designation="Developer", mgr_id=0))
+        assert emp.e_id is not None
+        await employee_crud.update_employee(session, emp.e_id, {"designation": "Lead"})
+    async with get_async_connection() as session:
+        assert (await employee_crud.get_by_employee_id(session, emp.e_id)).designation == "Lead"
+        assert [e.e_id for e in await employee_crud.get_all_employees(session, designation="lead")] == [emp.e_id]
+        await employee_crud.delete_employee(session, emp.e_id)
+        with pytest.raises(HTTPException) as err:
+            await employee_crud.get_by_employee_id(session, emp.e_id)
+        assert err.value.status_code == 404
+
+
+async def test_employee_referenced_by_a_task_is_kept(db, make_user, make_task):
+    make_user(1)
+    make_task(1, assigned_by=1)
+    async with get_async_connection() as session:
+        with pytest.raises(HTTPException) as err:
+            await employee_crud.delete_employee(session, 1)
+    assert err.value.status_code == 400
+
+
+async def test_user_round_trip(db):
+    from app.schemas.schemas import EmployeeSchema
+
+    db.add(EmployeeSchema(e_id=5, name="Mira Das", email="mira@ust.com", designation="Developer", mgr_id=0))
+    db.commit()
+    async with get_async_connection() as session:
+        await users_crud.add_user(session, UserReqRes(e_id=5, password="secret1", roles=["Developer"], status="active"))
+    async with get_async_connection() as session:
+        await users_crud.update_user(session, 5, {"roles": ["Developer", "Manager"]})
+        user = await users_crud.get_user_by_id(session, 5)
+    assert [r.value for r in user.roles] == ["Developer", "Manager"]
+
+
+def test_routes_use_the_async_session(client):
+    r = client.post("/api/Employee/create", json={
+        "name": "Ravi Kumar", "email": "ravi@ust.com", "designation": "Developer", "mgr_id": 0})
+    assert r.status_code == 200, r.text
+    r = client.get("/api/Employee/getall")
+    assert [e["name"] for e in r.json()] == ["Ravi Kumar"]
@@ -0,0 +1,153 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import pytest
+from fastapi import HTTPException, UploadFile
+import app.utils.attachment_io as aio
+from app.utils.attachment_io import write_temp, publish, discard, safe_filename, run_io
+
+
+class ReadRecorder(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+def _upload(data: bytes, size=None) -> UploadFile:
+    return UploadFile(file=ReadRecorder(data), filename="a.bin", size=size)
+
+
+def test_write_temp_streams_hashes_and_fsyncs(tmp_path, monkeypatch):
+    monkeypatch.setattr(aio, "UPLOAD_CHUNK_SIZE", 100)
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd) or real_fsync(fd))
+    data = os.urandom(250)
+    upload = _upload(data)
+
+    temp_path, size, sha256 = write_temp(upload, str(tmp_path / "t"))
+
+    assert size == 250 and sha256 == hashlib.sha256(data).hexdigest()
+    assert all(n == 100 for n in upload.file.reads)
+    assert synced
+    with open(temp_path, "rb") as f:
+        assert f.read() == data
+    assert os.path.basename(temp_path).startswith(".upload-")
+
+
+def test_write_temp_removes_the_partial_file_over_the_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(aio, "UPLOAD_CHUNK_SIZE", 100)
+    monkeypatch.setattr(aio, "UPLOAD_MAX_BYTES", 150)
+    with pytest.raises(HTTPException) as exc:
+        write_temp(_upload(b"x" * 300), str(tmp_path))
+    assert exc.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+def test_write_temp_rejects_a_declared_size_before_reading(tmp_path, monkeypatch):
+    monkeypatch.setattr(aio, "UPLOAD_MAX_BYTES", 150)
+    upload = _upload(b"x" * 300, size=300)
+    with pytest.raises(HTTPException) as exc:
+        write_temp(upload, str(tmp_path / "t"))
+    assert exc.value.status_code == 413
+    assert upload.file.reads == []
+    assert not (tmp_path / "t").exists()
+
+
+def test_publish_replaces_the_destination_and_discard_tolerates_missing(tmp_path):
+    dest = tmp_path / "report.txt"
+    dest.write_bytes(b"old")
+    temp_path, _, _ = write_temp(_upload(b"new"), str(tmp_path))
+    publish(temp_path, str(dest))
+    assert dest.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["report.txt"]
+    discard(temp_path)  # already gone
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("report.pdf", "report.pdf"),
+    ("../../etc/passwd", "passwd"),
+    ("..\\..\\boot.ini", "boot.ini"),
+    ("/abs/path/x.txt", "x.txt"),
+])
+def test_safe_filename_drops_directories(name, expected):
+    assert safe_filename(name) == expected
+
+
+@pytest.mark.parametrize("name", ["", None, ".", "..", "dir/", "a/.."])
+def test_safe_filename_rejects_names_without_a_file(name):
+    with pytest.raises(HTTPException) as exc:
+        safe_filename(name)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_run_io_uses_the_attachment_executor():
+    name = await run_io(lambda: threading.current_thread().name)
+    assert name.startswith("attachment-io")
+
+
+@pytest.fixture
+def disk_mode(client, make_user, make_task, login, tmp_path, monkeypatch):
+    """MongoDB marked down and uploads/ under tmp_path; yields the auth headers for user 1."""
+    import main
+    from app.database.mongo_health import mongo_breaker
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "uploads_dir", str(tmp_path / "uploads"))
+    make_user(1)
+    make_task(1)
+    headers = login(1)
+    monkeypatch.setattr(mongo_breaker, "_opened_at", time.monotonic())
+    return headers
+
+
+def _attach(client, headers, name: str, data: bytes):
+    return client.post("/api/Task/attach", params={"id": 1}, data={"role": "Manager", "remark": "r"},
+                       files={"file": (name, data, "text/plain")}, headers=headers)
+
+
+def test_attach_falls_back_to_disk_while_mongo_is_down(client, disk_mode, tmp_path):
+    r = _attach(client, disk_mode, "../notes.txt", b"offline copy")
+    assert r.status_code == 200, r.text
+    att = r.json()["attachment"]
+    task_dir = tmp_path / "uploads" / "1"
+    assert att["filename"] == "notes.txt" and att["blob_id"] is None
+    assert att["size"] == 12 and att["sha256"] == hashlib.sha256(b"offline copy").hexdigest()
+    assert os.listdir(task_dir) == ["notes.txt"]
+    assert (task_dir / "notes.txt").read_bytes() == b"offline copy"
+    assert client.get("/uploads/1/notes.txt").content == b"offline copy"
+
+
+def test_disk_replacement_removes_the_old_file_after_commit(client, disk_mode, tmp_path):
+    assert _attach(client, disk_mode, "first.txt", b"one").status_code == 200
+    assert _attach(client, disk_mode, "second.txt", b"two").status_code == 200
+    assert os.listdir(tmp_path / "uploads" / "1") == ["second.txt"]
+    rows = client.get("/api/Task/attachments", params={"id": 1, "role": "Manager"}, headers=disk_mode).json()
+    assert [a["filename"] for a in rows] == ["second.txt"]
+
+
+def test_failed_commit_keeps_the_old_file_and_drops_the_temp(client, disk_mode, tmp_path, monkeypatch):
+    import app.routers.task_router as task_router
+
+    assert _attach(client, disk_mode, "first.txt", b"one").status_code == 200
+
+    async def failing(*args, **kwargs):
+        raise HTTPException(status_code=500, detail="Database error: boom")
+
+    monkeypatch.setattr(task_router, "replace_attachments", failing)
+    assert _attach(client, disk_mode, "second.txt", b"two").status_code == 500
+    assert os.listdir(tmp_path / "uploads" / "1") == ["first.txt"]
+
+
+def test_disk_upload_over_the_limit_is_413_and_leaves_nothing(client, disk_mode, tmp_path, monkeypatch):
+    monkeypatch.setattr(aio, "UPLOAD_MAX_BYTES", 4)
+    assert _attach(client, disk_mode, "big.txt", b"too large").status_code == 413
+    task_dir = tmp_path / "uploads" / "1"
+    assert not task_dir.exists() or os.listdir(task_dir) == []
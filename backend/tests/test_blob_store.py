@@ -0,0 +1,164 @@
+import hashlib
+import io
+import pytest
+from bson import ObjectId
+from fastapi import UploadFile
+from sqlalchemy import inspect
+from sqlalchemy.exc import OperationalError
+import app.utils.blob_store as bs
+from app.schemas.schemas import AttachmentSchema, BlobSchema
+from app.utils.blob_store import store_upload, add_ref, release_blob, open_blob
+
+SPEC = b"the same spec attached everywhere"
+SPEC_ID = hashlib.sha256(SPEC).hexdigest()
+
+
+def _upload(data: bytes = SPEC) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename="spec.txt")
+
+
+def _refs(db, blob_id: str = SPEC_ID):
+    db.expire_all()
+    row = db.get(BlobSchema, blob_id)
+    return row.refs if row else None
+
+
+def _attach(client, headers, task_id: int, role: str = "Manager", data: bytes = None, **form):
+    files = {"file": ("spec.txt", data, "text/plain")} if data is not None else None
+    return client.post("/api/Task/attach", params={"id": task_id}, data={"role": role, **form},
+                       files=files, headers=headers)
+
+
+def test_same_content_is_stored_once_and_counted(mongo, db):
+    assert store_upload(_upload()) == SPEC_ID
+    assert store_upload(_upload()) == SPEC_ID
+    assert mongo["fs.files"].count_documents({}) == 1
+    assert _refs(db) == 2
+    assert open_blob(SPEC_ID).read() == SPEC
+
+
+def test_last_release_removes_the_gridfs_file(mongo, db):
+    store_upload(_upload())
+    assert add_ref(SPEC_ID)
+    release_blob(SPEC_ID)
+    assert _refs(db) == 1 and mongo["fs.files"].count_documents({}) == 1
+    release_blob(SPEC_ID)
+    assert _refs(db) is None
+    assert mongo["fs.files"].count_documents({}) == 0
+    assert mongo["fs.chunks"].count_documents({}) == 0
+    assert not add_ref(SPEC_ID)
+    with pytest.raises(KeyError):
+        open_blob(SPEC_ID)
+
+
+def test_failed_blob_commit_leaves_no_gridfs_file(mongo, db, monkeypatch):
+    def failing_session():
+        session = real_get_connection()
+
+        def commit():
+            raise OperationalError("INSERT INTO blobs", {}, Exception("connection lost"))
+
+        session.commit = commit
+        return session
+
+    real_get_connection = bs.get_connection
+    monkeypatch.setattr(bs, "get_connection", failing_session)
+    with pytest.raises(OperationalError):
+        bs._create(SPEC_ID, len(SPEC), _upload())
+    assert mongo["fs.files"].count_documents({}) == 0
+    assert mongo["fs.chunks"].count_documents({}) == 0
+
+
+def test_missing_gridfs_file_is_restored_by_the_next_upload(mongo, db):
+    store_upload(_upload())
+    gen = db.get(BlobSchema, SPEC_ID).gen
+    bs.get_fs().delete(ObjectId(gen))
+
+    assert store_upload(_upload()) == SPEC_ID
+    assert _refs(db) == 2
+    assert db.get(BlobSchema, SPEC_ID).gen != gen
+    assert open_blob(SPEC_ID).read() == SPEC
+    assert mongo["fs.files"].count_documents({}) == 1
+
+
+def test_attachments_index_their_blob(db):
+    from app.database.mysql_connection import engine
+
+    indexes = {i["name"]: i["column_names"] for i in inspect(engine).get_indexes("attachments")}
+    assert indexes["ix_attachments_blob_id"] == ["blob_id"]
+
+
+def test_task_attachments_share_a_blob_until_the_last_is_deleted(client, mongo, db, make_user, make_task, login):
+    make_user(1)
+    make_task(1)
+    make_task(2)
+    headers = login(1)
+    assert _attach(client, headers, 1, data=SPEC).status_code == 200
+    assert _attach(client, headers, 2, data=SPEC).status_code == 200
+    assert mongo["fs.files"].count_documents({}) == 1
+    assert _refs(db) == 2
+    assert client.get("/uploads/2/spec.txt").content == SPEC
+
+    ids = [a.id for a in db.query(AttachmentSchema).order_by(AttachmentSchema.id)]
+    assert client.delete("/api/Task/attachment", params={"id": ids[0], "role": "Manager"}, headers=headers).status_code == 200
+    assert _refs(db) == 1
+    assert client.delete("/api/Task/attachment", params={"id": ids[1], "role": "Manager"}, headers=headers).status_code == 200
+    assert _refs(db) is None
+    assert mongo["fs.files"].count_documents({}) == 0
+
+
+def test_replacing_an_attachment_releases_the_old_blob(client, mongo, db, make_user, make_task, login):
+    make_user(1)
+    make_task(1)
+    headers = login(1)
+    assert _attach(client, headers, 1, data=b"draft").status_code == 200
+    assert _attach(client, headers, 1, data=SPEC).status_code == 200
+    assert _refs(db, hashlib.sha256(b"draft").hexdigest()) is None
+    assert _refs(db) == 1
+    assert mongo["fs.files"].count_documents({}) == 1
+
+
+def test_link_by_hash_needs_content_the_user_can_see(client, mongo, db, make_user, make_task, login):
+    make_user(1)
+    make_user(2, roles=("Developer",))
+    make_task(1)
+    make_task(2, assigned_to=2)
+    manager, developer = login(1), login(2)
+    assert _attach(client, manager, 1, data=SPEC).status_code == 200
+
+    # the attachment is on a task the developer cannot see: same answer as unknown content
+    r = _attach(client, developer, 2, role="Developer", sha256=SPEC_ID, filename="copy.txt")
+    assert r.status_code == 404
+    assert _attach(client, developer, 2, role="Developer", sha256="0" * 64, filename="x.txt").status_code == 404
+    assert _attach(client, developer, 2, role="Developer", sha256="not-a-hash", filename="x.txt").status_code == 400
+    assert _refs(db) == 1
+
+    # once it is on a task assigned to them, linking it skips the upload
+    assert _attach(client, manager, 2, data=SPEC).status_code == 200
+    r = _attach(client, developer, 2, role="Developer", sha256=SPEC_ID.upper(), filename="../copy.txt")
+    assert r.status_code == 200, r.text
+    assert r.json()["attachment"]["blob_id"] == SPEC_ID
+    assert r.json()["attachment"]["filename"] == "copy.txt"
+    assert _refs(db) == 3
+    assert mongo["fs.files"].count_documents({}) == 1
+
+
+def test_remark_and_task_attachment_share_a_blob(client, mongo, db, make_user, make_task, login):
+    make_user(1)
+    make_task(1)
+    headers = login(1)
+    form = {"task_id": 1, "comment": "spec", "role": "Manager"}
+    r = client.post("/api/Remark/create", data=form, files={"file": ("spec.txt", SPEC, "text/plain")}, headers=headers)
+    assert r.status_code == 200, r.text
+    remark = r.json()["remark"]
+    assert remark["blob_id"] == SPEC_ID
+
+    # the remark makes the content visible to its author, so the task can link it by hash
+    assert _attach(client, headers, 1, sha256=SPEC_ID, filename="spec.txt").status_code == 200
+    assert _refs(db) == 2
+    assert mongo["fs.files"].count_documents({}) == 1
+
+    r = client.delete("/api/Remark/delete", params={"id": remark["_id"], "role": "Manager"}, headers=headers)
+    assert r.status_code == 200, r.text
+    assert _refs(db) == 1
+    assert client.get("/uploads/1/spec.txt").content == SPEC
@@ -0,0 +1,111 @@
+import hashlib
+import pytest
+from bson import ObjectId
+import app.utils.blob_store as bs
+
+DATA = bytes(range(256)) * 8
+
+
+@pytest.fixture
+def stored(client, make_user, make_task, login, monkeypatch):
+    """A 2 KiB remark attachment in 256-byte GridFS chunks; yields (url, headers)."""
+    monkeypatch.setattr(bs, "UPLOAD_CHUNK_SIZE", 256)
+    make_user(1)
+    make_task(1)
+    headers = login(1)
+    form = {"task_id": 1, "comment": "spec", "role": "Manager"}
+    r = client.post("/api/Remark/create", data=form, files={"file": ("spec.bin", DATA, "image/png")}, headers=headers)
+    assert r.status_code == 200, r.text
+    return f"/api/file/{r.json()['remark']['file_id']}", headers
+
+
+def test_full_download_carries_validators_and_cache_headers(client, stored):
+    url, headers = stored
+    r = client.get(url, headers=headers)
+    assert r.status_code == 200
+    assert r.content == DATA
+    assert r.headers["content-length"] == str(len(DATA))
+    assert r.headers["etag"] == f'"{hashlib.sha256(DATA).hexdigest()}"'
+    assert r.headers["cache-control"] == "private, max-age=31536000, immutable"
+    assert r.headers["accept-ranges"] == "bytes"
+    assert r.headers["content-type"] == "image/png"
+    assert "last-modified" in r.headers
+
+
+@pytest.mark.parametrize("spec, start, end", [
+    ("bytes=300-700", 300, 700),  # spans chunk boundaries
+    ("bytes=2000-", 2000, len(DATA) - 1),
+    ("bytes=-10", len(DATA) - 10, len(DATA) - 1),
+    ("bytes=100-99999", 100, len(DATA) - 1),
+])
+def test_range_returns_the_requested_bytes(client, stored, spec, start, end):
+    url, headers = stored
+    r = client.get(url, headers={**headers, "Range": spec})
+    assert r.status_code == 206
+    assert r.content == DATA[start:end + 1]
+    assert r.headers["content-range"] == f"bytes {start}-{end}/{len(DATA)}"
+    assert r.headers["content-length"] == str(end - start + 1)
+
+
+def test_unsatisfiable_range_is_416(client, stored):
+    url, headers = stored
+    r = client.get(url, headers={**headers, "Range": f"bytes={len(DATA)}-"})
+    assert r.status_code == 416
+    assert r.headers["content-range"] == f"bytes */{len(DATA)}"
+
+
+def test_multipart_range_falls_back_to_the_whole_file(client, stored):
+    url, headers = stored
+    r = client.get(url, headers={**headers, "Range": "bytes=0-1,5-6"})
+    assert r.status_code == 200
+    assert r.content == DATA
+
+
+def test_conditional_requests_answer_304(client, stored):
+    url, headers = stored
+    first = client.get(url, headers=headers)
+    etag, modified = first.headers["etag"], first.headers["last-modified"]
+
+    for conditional in ({"If-None-Match": etag}, {"If-None-Match": f'"other", W/{etag}'},
+                        {"If-Modified-Since": modified}):
+        r = client.get(url, headers={**headers, **conditional})
+        assert r.status_code == 304, conditional
+        assert r.content == b""
+        assert r.headers["etag"] == etag
+
+    # a non-matching If-None-Match wins over a matching date
+    r = client.get(url, headers={**headers, "If-None-Match": '"other"', "If-Modified-Since": modified})
+    assert r.status_code == 200
+
+
+def test_if_range_only_honours_the_range_for_the_same_file(client, stored):
+    url, headers = stored
+    first = client.get(url, headers=headers)
+    etag, modified = first.headers["etag"], first.headers["last-modified"]
+
+    assert client.get(url, headers={**headers, "Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+    assert client.get(url, headers={**headers, "Range": "bytes=0-9", "If-Range": modified}).status_code == 206
+    r = client.get(url, headers={**headers, "Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert r.status_code == 200
+    assert r.content == DATA
+
+
+def test_legacy_gridfs_file_uses_its_id_and_stored_content_type(client, mongo, make_user, login):
+    from app.database.mongodb_connection import get_fs
+
+    make_user(1)
+    headers = login(1)
+    file_id = get_fs().put(b"legacy", filename="old.txt", content_type="text/csv")
+    mongo["remarks"].insert_one({"task_id": 1, "comment": "old", "file_id": str(file_id), "file_name": "old.txt"})
+    r = client.get(f"/api/file/{file_id}", headers=headers)
+    assert r.status_code == 200
+    assert r.content == b"legacy"
+    assert r.headers["etag"] == f'"{file_id}"'
+    assert r.headers["content-type"].startswith("text/csv")
+
+
+def test_missing_and_invalid_ids(client, make_user, login):
+    make_user(1)
+    headers = login(1)
+    assert client.get(f"/api/file/{ObjectId()}", headers=headers).status_code == 404
+    assert client.get("/api/file/not-an-id", headers=headers).status_code == 400
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+import pytest
+from app.middleware import latency_rollup as lr
+from app.middleware.latency_rollup import (
+    LatencyRollupJob, bucket_index, bucket_upper_ms, fold_logs, quantile_ms, query_latency, refold_late_logs,
+)
+from app.database.job_lease import acquire_lease, get_state
+
+NOW = datetime(2026, 10, 1, 12, 30)
+T0 = datetime(2026, 10, 1, 12, 0)
+
+
+def _log(ts: datetime, ms: float, path: str = "/api/Task/get", status: int = 200) -> dict:
+    return {"timestamp": ts, "method": "GET", "path": path, "status_code": status, "process_time": ms / 1000}
+
+
+def _minute(mongo, bucket: datetime, route: str = "/api/Task/get") -> dict:
+    return mongo["latency_rollups"].find_one({"resolution": "minute", "bucket": bucket, "route": route})
+
+
+def test_histogram_quantiles_stay_within_a_bucket():
+    for ms in (0.5, 12.0, 250.0, 4000.0):
+        upper = bucket_upper_ms(bucket_index(ms))
+        assert ms <= upper < ms * lr.HIST_FACTOR + 1e-9
+    hist = {}
+    for ms in range(1, 101):
+        index = str(bucket_index(ms))
+        hist[index] = hist.get(index, 0) + 1
+    assert 95 <= quantile_ms(hist, 0.95) < 95 * lr.HIST_FACTOR
+    assert quantile_ms({}, 0.5) is None
+
+
+def test_fold_groups_by_minute_method_and_route():
+    rollups = fold_logs([
+        _log(T0, 10, path="/api/Task/17"),
+        _log(T0 + timedelta(seconds=30), 30, path="/api/Task/18", status=500),
+        _log(T0 + timedelta(minutes=1), 20, path="/api/Task/17"),
+        {"timestamp": T0, "path": "/api/Task/get"},  # no process_time: not a timed request
+    ])
+    first = rollups[(T0, "GET", "/api/Task/{id}")]
+    assert (first["count"], first["errors"], first["sum_ms"], first["max_ms"]) == (2, 1, 40.0, 30.0)
+    assert rollups[(T0 + timedelta(minutes=1), "GET", "/api/Task/{id}")]["count"] == 1
+    assert len(rollups) == 2
+
+
+def test_folding_a_range_again_gives_the_same_rollups(mongo):
+    mongo["logs"].insert_many([_log(T0 + timedelta(seconds=s), 10) for s in (1, 2, 3)])
+    job = LatencyRollupJob(interval=60, lag=10)
+    assert job.run_once(NOW) == 3
+    first = _minute(mongo, T0)
+    # a run that crashed before moving the watermark folds the same window again
+    mongo["job_state"].update_one({"_id": "latency"}, {"$set": {"watermark": T0}})
+    job.run_once(NOW)
+    again = _minute(mongo, T0)
+    assert again["count"] == first["count"] == 3
+    assert again["hist"] == first["hist"]
+    hour = mongo["latency_rollups"].find_one({"resolution": "hour", "bucket": T0})
+    assert hour["count"] == 3
+
+
+def test_late_logs_rewind_the_watermark(mongo, monkeypatch):
+    monkeypatch.setattr(lr, "datetime", type("FixedNow", (datetime,), {"now": classmethod(lambda cls: NOW)}))
+    mongo["logs"].insert_one(_log(T0 + timedelta(minutes=5), 10))
+    job = LatencyRollupJob(interval=60, lag=10)
+    job.run_once(NOW)
+    assert get_state("latency")["watermark"] > T0 + timedelta(minutes=5)
+
+    # a spooled entry from before the watermark arrives after the outage
+    late = _log(T0 + timedelta(minutes=1), 20)
+    mongo["logs"].insert_one(late)
+    refold_late_logs([late])
+    assert get_state("latency")["watermark"] == late["timestamp"]
+    job.run_once(NOW)
+    assert _minute(mongo, T0 + timedelta(minutes=1))["count"] == 1
+    assert mongo["latency_rollups"].find_one({"resolution": "hour", "bucket": T0})["count"] == 2
+
+
+def test_a_held_lease_skips_the_run(mongo):
+    mongo["logs"].insert_one(_log(T0, 10))
+    assert acquire_lease("latency", "other-worker", 600, NOW) is not None
+    assert LatencyRollupJob().run_once(NOW) == 0
+    assert mongo["latency_rollups"].count_documents({}) == 0
+
+
+def test_query_latency_reads_the_rollups(mongo):
+    mongo["logs"].insert_many([_log(T0, 10), _log(T0, 10), _log(T0, 10), _log(T0, 400, status=503)])
+    LatencyRollupJob(lag=10).run_once(NOW)
+    [route] = query_latency(T0, NOW, "minute")
+    assert route["route"] == "/api/Task/get"
+    assert route["count"] == 4 and route["errors"] == 1
+    assert route["p50_ms"] < 12 and route["p99_ms"] >= 400
+
+
+@pytest.mark.anyio
+async def test_loop_keeps_blocking_calls_off_the_event_loop(monkeypatch):
+    loop_thread = threading.current_thread()
+    threads = []
+    runs = iter([5, 5, 0])
+
+    job = LatencyRollupJob(interval=3600)
+    monkeypatch.setattr(job, "run_once", lambda: (threads.append(threading.current_thread()), next(runs))[1])
+    monkeypatch.setattr(job, "_caught_up", lambda: threads.append(threading.current_thread()) or False)
+    task = asyncio.get_running_loop().create_task(job._loop())
+    for _ in range(200):
+        if len(threads) >= 5:
+            break
+        await asyncio.sleep(0.01)
+    task.cancel()
+    # run, caught_up, run, caught_up, run (0: backlog done)
+    assert len(threads) == 5
+    assert loop_thread not in threads
@@ -0,0 +1,121 @@
+import gzip
+import os
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId, json_util
+from pymongo.errors import OperationFailure
+from app.middleware import log_storage as ls
+from app.middleware.log_storage import LogArchiver, ensure_log_storage, ttl_seconds, unwritten
+
+NOW = datetime(2026, 10, 10, 12, 30)
+
+
+@pytest.fixture
+def regular(monkeypatch):
+    monkeypatch.setattr(ls, "LOG_STORAGE", "regular")
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ls, "LOG_ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(ls, "LOG_RETENTION_DAYS", 1.0)
+    return tmp_path
+
+
+def _read_archive(path) -> list:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json_util.loads(line) for line in f]
+
+
+def test_ttl_covers_retention_and_the_archive_grace(monkeypatch):
+    monkeypatch.setattr(ls, "LOG_RETENTION_DAYS", 30.0)
+    monkeypatch.setattr(ls, "LOG_ARCHIVE_DIR", "")
+    assert ttl_seconds() == 30 * 86400
+    monkeypatch.setattr(ls, "LOG_ARCHIVE_DIR", "/var/archive")
+    assert ttl_seconds() == 30 * 86400 + int(ls.LOG_ARCHIVE_GRACE_HOURS * 3600)
+    monkeypatch.setattr(ls, "LOG_RETENTION_DAYS", 0.0)
+    assert ttl_seconds() is None
+
+
+def test_regular_storage_gets_ttl_and_path_indexes(mongo, regular):
+    assert ensure_log_storage() == "regular"
+    assert ensure_log_storage() == "regular"
+    indexes = mongo["logs"].index_information()
+    assert indexes["timestamp_1"]["expireAfterSeconds"] == ttl_seconds()
+    assert "path_1_timestamp_1" in indexes
+
+
+def test_changed_retention_rebuilds_the_ttl_index(mongo, regular, monkeypatch):
+    ensure_log_storage()
+    monkeypatch.setattr(ls, "LOG_RETENTION_DAYS", 0.0)
+    ensure_log_storage()
+    assert "expireAfterSeconds" not in mongo["logs"].index_information()["timestamp_1"]
+
+
+def test_falls_back_to_regular_when_time_series_is_unsupported(mongo, monkeypatch):
+    import app.database.mongodb_connection as mc
+
+    class NoTimeSeries:
+        """A pre-5.0 server: create_collection rejects time-series options."""
+
+        def __init__(self, db):
+            self._db = db
+
+        def create_collection(self, name, **options):
+            if "timeseries" in options:
+                raise OperationFailure("unrecognized option: timeseries")
+            return self._db.create_collection(name, **options)
+
+        def __getitem__(self, name):
+            return self._db[name]
+
+    monkeypatch.setattr(ls, "LOG_STORAGE", "timeseries")
+    monkeypatch.setattr(mc, "get_mongodb", lambda: NoTimeSeries(mongo))
+    assert ensure_log_storage() == "regular"
+    assert mongo["logs"].index_information()["timestamp_1"]["expireAfterSeconds"] == ttl_seconds()
+
+
+def test_unwritten_keeps_only_entries_missing_from_logs(mongo):
+    stored = {"_id": ObjectId(), "timestamp": NOW, "path": "/a"}
+    mongo["logs"].insert_one(dict(stored))
+    fresh = {"_id": ObjectId(), "timestamp": NOW + timedelta(seconds=1), "path": "/b"}
+    no_id = {"timestamp": NOW, "path": "/c"}
+    assert unwritten([stored, fresh]) == [fresh]
+    assert unwritten([no_id]) == [no_id]
+
+
+def test_archiver_exports_expired_hours_then_deletes_them(mongo, archive_dir):
+    old = NOW - timedelta(days=2)
+    mongo["logs"].insert_many([
+        {"timestamp": old.replace(minute=5), "path": "/a"},
+        {"timestamp": old.replace(minute=50), "path": "/b"},
+        {"timestamp": old.replace(minute=10) + timedelta(hours=1), "path": "/c"},
+        {"timestamp": NOW - timedelta(hours=1), "path": "/recent"},
+    ])
+    archiver = LogArchiver()
+    assert archiver.run_once(NOW) == 3
+    files = sorted(os.listdir(archive_dir))
+    assert files == [f"logs-{old:%Y%m%d-%H}.ndjson.gz", f"logs-{old + timedelta(hours=1):%Y%m%d-%H}.ndjson.gz"]
+    assert [e["path"] for e in _read_archive(archive_dir / files[0])] == ["/a", "/b"]
+    assert [d["path"] for d in mongo["logs"].find()] == ["/recent"]
+    assert archiver.run_once(NOW) == 0
+
+
+def test_late_entries_for_an_archived_hour_go_to_a_sibling_file(mongo, archive_dir):
+    old = (NOW - timedelta(days=2)).replace(minute=0)
+    mongo["logs"].insert_one({"timestamp": old, "path": "/a"})
+    archiver = LogArchiver()
+    archiver.run_once(NOW)
+    # a replayed spool brings an entry for the exported hour; the archiver is rewound to it
+    mongo["logs"].insert_one({"timestamp": old + timedelta(minutes=1), "path": "/late"})
+    mongo["job_state"].update_one({"_id": "log_archive"}, {"$set": {"watermark": old}})
+    assert archiver.run_once(NOW) == 1
+    sibling = archive_dir / f"logs-{old:%Y%m%d-%H}.1.ndjson.gz"
+    assert [e["path"] for e in _read_archive(sibling)] == ["/late"]
+
+
+def test_archiver_is_off_without_a_directory(mongo, monkeypatch):
+    monkeypatch.setattr(ls, "LOG_ARCHIVE_DIR", "")
+    mongo["logs"].insert_one({"timestamp": NOW - timedelta(days=400), "path": "/a"})
+    assert LogArchiver().run_once(NOW) == 0
+    assert mongo["logs"].count_documents({}) == 1
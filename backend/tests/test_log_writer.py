@@ -0,0 +1,151 @@
+import os
+from datetime import datetime
+import pytest
+from bson import ObjectId, json_util
+from pymongo.errors import AutoReconnect, BulkWriteError
+from app.middleware import log_writer as lw
+from app.middleware.log_writer import MongoLogWriter, LOG_SPOOL_FILE
+from app.database.mongo_health import mongo_breaker
+
+pytestmark = pytest.mark.anyio
+
+
+def _entry(i: int) -> dict:
+    return {"path": f"/api/{i}", "status_code": 200, "timestamp": datetime(2026, 10, 1, 12, 0, i)}
+
+
+@pytest.fixture
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(lw, "LOG_SPOOL_DIR", str(tmp_path))
+    return tmp_path / LOG_SPOOL_FILE
+
+
+@pytest.fixture
+def breaker_open(monkeypatch):
+    import time
+    monkeypatch.setattr(mongo_breaker, "_opened_at", time.monotonic())
+    yield
+    mongo_breaker.record_success()
+
+
+def _writer(**kwargs) -> MongoLogWriter:
+    writer = MongoLogWriter(**kwargs)
+    # mongomock cannot create time-series collections; storage setup has tests of its own
+    writer._storage_ready = True
+    return writer
+
+
+def _spooled(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json_util.loads(line) for line in f if line.strip()]
+
+
+async def test_full_queue_drops_new_entries():
+    writer = MongoLogWriter(maxsize=2)
+    assert writer.enqueue(_entry(1)) and writer.enqueue(_entry(2))
+    assert not writer.enqueue(_entry(3))
+    assert writer.stats()["dropped"] == 1
+    assert writer.stats()["queue_depth"] == 2
+
+
+async def test_sample_policy_keeps_every_nth_entry_over_the_watermark(monkeypatch):
+    monkeypatch.setattr(lw, "LOG_OVERFLOW_POLICY", "sample")
+    monkeypatch.setattr(lw, "LOG_OVERFLOW_SAMPLE_EVERY", 3)
+    writer = MongoLogWriter(maxsize=100)
+    kept = sum(writer.enqueue(_entry(i % 60)) for i in range(90))
+    # 75 fill the queue to the watermark; one in three of the remaining 15 get in
+    assert kept == 80
+    assert writer.sampled_out == 10
+
+
+async def test_stop_writes_everything_queued_in_batches(mongo):
+    writer = _writer(batch_size=2, flush_interval=0.01)
+    inserts = []
+    original = writer._insert
+    writer._insert = lambda logs, batch: (inserts.append(len(batch)), original(logs, batch))
+    writer.start()
+    for i in range(5):
+        writer.enqueue(_entry(i))
+    await writer.stop()
+    assert mongo["logs"].count_documents({}) == 5
+    assert writer.written == 5
+    assert max(inserts) <= 2
+
+
+async def test_outage_without_a_spool_skips_the_batch(mongo, breaker_open):
+    writer = MongoLogWriter()
+    await writer._write([_entry(1), _entry(2)])
+    assert writer.skipped == 2
+    assert mongo["logs"].count_documents({}) == 0
+
+
+async def test_spooled_batch_is_replayed_after_recovery(mongo, spool, breaker_open):
+    writer = _writer()
+    await writer._write([_entry(1), _entry(2)])
+    assert writer.spooled == 2
+    assert all("_id" in e for e in _spooled(spool))
+
+    mongo_breaker.record_success()
+    await writer._write([_entry(3)])
+    assert mongo["logs"].count_documents({}) == 3
+    assert writer.replayed == 2
+    assert not os.path.exists(spool)
+
+
+async def test_connection_error_spools_the_batch_and_counts_a_failure(mongo, spool, monkeypatch):
+    writer = _writer()
+
+    def unreachable(logs, batch):
+        raise AutoReconnect("connection reset")
+
+    monkeypatch.setattr(writer, "_insert", unreachable)
+    await writer._write([_entry(1), _entry(2)])
+    assert len(_spooled(spool)) == 2
+    assert mongo_breaker.stats()["consecutive_failures"] == 1
+
+
+async def test_rejected_entries_are_counted_not_spooled(spool):
+    class Rejecting:
+        def insert_many(self, batch, ordered):
+            raise BulkWriteError({"nInserted": 2, "writeErrors": [{"index": 2, "code": 121, "errmsg": "invalid"}]})
+
+    writer = MongoLogWriter()
+    writer._insert(Rejecting(), [_entry(1), _entry(2), _entry(3)])
+    assert (writer.written, writer.failed) == (2, 1)
+    assert not os.path.exists(spool)
+
+
+async def test_replay_skips_entries_already_written(mongo, spool):
+    entries = [{**_entry(i), "_id": ObjectId()} for i in range(4)]
+    # the first two made it in before the connection dropped
+    mongo["logs"].insert_many([dict(e) for e in entries[:2]])
+    writer = MongoLogWriter()
+    writer._append_spool(entries)
+    writer._replay_spool()
+    assert mongo["logs"].count_documents({}) == 4
+    assert writer.replayed == 2
+
+
+async def test_interrupted_replay_resumes_after_the_last_chunk(mongo, spool, monkeypatch):
+    writer = MongoLogWriter(batch_size=2)
+    writer._append_spool([_entry(i) for i in range(5)])
+    calls = []
+    original = writer._replay_chunk
+
+    def fail_second_chunk(chunk):
+        calls.append(len(chunk))
+        if len(calls) == 2:
+            raise AutoReconnect("connection reset")
+        original(chunk)
+
+    monkeypatch.setattr(writer, "_replay_chunk", fail_second_chunk)
+    with pytest.raises(AutoReconnect):
+        writer._replay_spool()
+    assert mongo["logs"].count_documents({}) == 2
+    replaying = str(spool) + ".replaying"
+    assert os.path.exists(replaying) and os.path.exists(replaying + ".offset")
+
+    monkeypatch.setattr(writer, "_replay_chunk", original)
+    writer._replay_spool()
+    assert mongo["logs"].count_documents({}) == 5
+    assert not os.path.exists(replaying)
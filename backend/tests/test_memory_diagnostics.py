@@ -0,0 +1,74 @@
+import tracemalloc
+import pytest
+from app.core import memory_diagnostics as md
+
+
+@pytest.fixture
+def tracing():
+    md.start_tracing(1)
+    yield
+    md.stop_tracing()
+
+
+def _allocate():
+    return [bytearray(1024) for _ in range(512)]
+
+
+def test_snapshot_needs_tracing():
+    md.stop_tracing()
+    with pytest.raises(RuntimeError):
+        md.take_snapshot("before")
+
+
+def test_diff_points_at_the_allocating_line(tracing):
+    md.take_snapshot("before")
+    kept = _allocate()
+    md.take_snapshot("after")
+    diff = md.diff_snapshots("before", "after", group_by="lineno", limit=5)
+    assert diff["total_diff_kb"] >= 512
+    top = diff["top"][0]
+    assert top["location"].startswith(__file__) and top["size_diff_kb"] >= 512
+    assert len(kept) == 512
+
+
+def test_traceback_grouping_uses_the_configured_depth():
+    md.start_tracing(4)
+    try:
+        assert tracemalloc.get_traceback_limit() == 4
+        md.take_snapshot("before")
+        kept = _allocate()
+        top = md.diff_snapshots("before", group_by="traceback", limit=1)["top"][0]
+        assert " <- " in top["location"]
+        assert kept
+    finally:
+        md.stop_tracing()
+
+
+def test_only_the_newest_snapshots_are_kept(tracing, monkeypatch):
+    monkeypatch.setattr(md, "MEMORY_MAX_SNAPSHOTS", 2)
+    for name in ("a", "b", "c"):
+        md.take_snapshot(name)
+    assert [s["name"] for s in md.snapshot_names()] == ["b", "c"]
+    with pytest.raises(KeyError):
+        md.diff_snapshots("a")
+
+
+def test_stopping_drops_every_snapshot(tracing):
+    md.take_snapshot("a")
+    assert md.stop_tracing() == {"tracing": False, "snapshots": []}
+
+
+def test_report_and_admin_routes(client, make_user, login):
+    make_user(1, roles=["Admin"])
+    admin = login(1)
+    report = client.get("/api/admin/memory", headers=admin).json()
+    assert report["rss_kb"] and report["peak_rss_kb"]
+    assert {"principal_cache", "log_writer_queue", "metrics_label_sets"} <= set(report["caches"])
+    assert client.post("/api/admin/memory/snapshots", params={"name": "x"}, headers=admin).status_code == 409
+    try:
+        assert client.post("/api/admin/memory/tracemalloc/start", headers=admin).json()["tracing"]
+        assert client.post("/api/admin/memory/snapshots", params={"name": "x"}, headers=admin).status_code == 200
+        assert client.get("/api/admin/memory/diff", params={"base": "x"}, headers=admin).status_code == 200
+        assert client.get("/api/admin/memory/diff", params={"base": "missing"}, headers=admin).status_code == 404
+    finally:
+        client.post("/api/admin/memory/tracemalloc/stop", headers=admin)
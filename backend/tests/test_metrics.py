@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+from prometheus_client import REGISTRY
+from app.middleware.metrics import mongo_command_listener
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def _route_total(name: str, route: str, **labels) -> float:
+    # newer FastAPI releases report an included route without the include_router prefix
+    return sum(
+        s.value for metric in REGISTRY.collect() for s in metric.samples
+        if s.name == name and s.labels.get("route", "").endswith(route)
+        and all(s.labels.get(k) == v for k, v in labels.items())
+    )
+
+
+def test_requests_are_counted_per_route_template(client, make_user, login):
+    make_user(1)
+    headers = login(1)
+    before = _route_total("http_requests_total", "/file/{file_id}", method="GET", status="400")
+    for file_id in ("first", "second"):
+        assert client.get(f"/api/file/{file_id}", headers=headers).status_code == 400
+    assert _route_total("http_requests_total", "/file/{file_id}", method="GET", status="400") == before + 2
+    assert _route_total("http_request_duration_seconds_count", "/file/{file_id}", method="GET") >= 2
+
+
+def test_unmatched_paths_share_one_series(client):
+    labels = {"method": "GET", "route": "<unmatched>", "status": "404"}
+    before = _sample("http_requests_total", **labels)
+    client.get("/no/such/path/1")
+    client.get("/no/such/path/2")
+    assert _sample("http_requests_total", **labels) == before + 2
+
+
+def test_sql_statements_and_pool_checkouts_are_timed(client, make_user, login):
+    make_user(1)
+    headers = login(1)
+    selects = _sample("db_query_duration_seconds_count", engine="async", operation="SELECT")
+    waits = _sample("db_pool_checkout_wait_seconds_count", engine="async")
+    assert client.get("/api/Employee/getall", headers=headers).status_code == 200
+    assert _sample("db_query_duration_seconds_count", engine="async", operation="SELECT") > selects
+    assert _sample("db_pool_checkout_wait_seconds_count", engine="async") > waits
+    assert _sample("db_pool_connections_in_use", engine="async") == 0
+
+
+def test_mongo_commands_are_timed_and_failures_counted():
+    listener = mongo_command_listener()
+    count = _sample("mongo_command_duration_seconds_count", command="find")
+    failures = _sample("mongo_command_failures_total", command="find")
+    listener.succeeded(SimpleNamespace(command_name="find", duration_micros=1500))
+    listener.failed(SimpleNamespace(command_name="find", duration_micros=900))
+    assert _sample("mongo_command_duration_seconds_count", command="find") == count + 2
+    assert _sample("mongo_command_failures_total", command="find") == failures + 1
+
+
+def test_metrics_endpoint_serves_the_exposition_format(client):
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert "# TYPE http_requests_total counter" in r.text
+    assert "threadpool_threads_limit" in r.text
+
@@ -0,0 +1,71 @@
+from datetime import datetime
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from app.database.migrations import MIGRATIONS, applied_versions, pending_migrations, upgrade, schema_migrations
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/migrations.db")
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_applies_every_migration_once(engine):
+    assert upgrade(engine) == [version for version, _, _ in MIGRATIONS]
+    assert applied_versions(engine) == {version for version, _, _ in MIGRATIONS}
+    assert pending_migrations(engine) == []
+    assert upgrade(engine) == []
+    tables = set(inspect(engine).get_table_names())
+    assert {"employees", "users", "tasks", "attachments", "blobs", "schema_migrations"} <= tables
+
+
+def test_upgrade_brings_an_older_schema_forward(engine):
+    from app.database.mysql_connection import Base
+    import app.schemas.schemas  # noqa: F401
+
+    # a database created before 0003: no token_version, no blob columns or blobs table
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_attachments_blob_id"))
+        conn.execute(text("ALTER TABLE attachments DROP COLUMN blob_id"))
+        conn.execute(text("ALTER TABLE users DROP COLUMN token_version"))
+        conn.execute(text("DROP TABLE blobs"))
+    applied_versions(engine)
+    with engine.begin() as conn:
+        for version in ("0001", "0002"):
+            conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.now()))
+
+    assert upgrade(engine) == ["0003", "0004", "0005", "0006"]
+    inspector = inspect(engine)
+    assert "token_version" in {c["name"] for c in inspector.get_columns("users")}
+    assert "blob_id" in {c["name"] for c in inspector.get_columns("attachments")}
+    assert "ix_attachments_blob_id" in {i["name"] for i in inspector.get_indexes("attachments")}
+    assert "blobs" in inspector.get_table_names()
+
+
+def test_failed_migration_is_not_recorded(engine, monkeypatch):
+    def broken(conn):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr("app.database.migrations.MIGRATIONS", MIGRATIONS + [("9999", "broken", broken)])
+    with pytest.raises(RuntimeError):
+        upgrade(engine)
+    assert "9999" not in applied_versions(engine)
+    assert "0006" in applied_versions(engine)
+
+
+def test_importing_the_app_runs_no_ddl(tmp_path):
+    db_file = tmp_path / "import.db"
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_file}", "ASYNC_DATABASE_URL": f"sqlite+aiosqlite:///{db_file}"}
+    subprocess.run([sys.executable, "-c", "import main"], cwd=BACKEND, env=env, check=True, timeout=60)
+    if db_file.exists():
+        engine = create_engine(f"sqlite:///{db_file}")
+        assert inspect(engine).get_table_names() == []
+        engine.dispose()
@@ -0,0 +1,76 @@
+import time
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import AutoReconnect, ServerSelectionTimeoutError
+from app.database.mongo_health import MongoCircuitBreaker, is_mongo_unavailable, mongo_breaker, require_mongo
+
+
+@pytest.fixture
+def breaker_open(monkeypatch):
+    monkeypatch.setattr(mongo_breaker, "_opened_at", time.monotonic())
+    yield
+    mongo_breaker.record_success()
+
+
+def test_opens_after_consecutive_failures_only():
+    breaker = MongoCircuitBreaker(failure_threshold=3, probe_interval=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open
+    assert breaker.stats()["times_opened"] == 1
+    breaker.record_success()
+    assert not breaker.is_open
+
+
+def test_probe_closes_the_breaker_on_recovery(mongo):
+    breaker = MongoCircuitBreaker(failure_threshold=1, probe_interval=0.01)
+    breaker.record_failure()
+    assert breaker.is_open
+    deadline = time.time() + 5
+    while breaker.is_open and time.time() < deadline:
+        time.sleep(0.01)
+    assert not breaker.is_open
+
+
+def test_only_connection_errors_count_as_unavailable():
+    assert is_mongo_unavailable(ServerSelectionTimeoutError("no servers"))
+    assert is_mongo_unavailable(AutoReconnect("reset"))
+    assert not is_mongo_unavailable(ValueError("bad id"))
+
+
+def test_require_mongo_fails_fast_while_open(breaker_open):
+    with pytest.raises(HTTPException) as exc:
+        require_mongo()
+    assert exc.value.status_code == 503
+    assert mongo_breaker.stats()["rejected"] >= 1
+
+
+def test_remark_routes_answer_503_and_sql_routes_keep_working(client, make_user, make_task, login, breaker_open):
+    make_user(1)
+    make_task(1)
+    headers = login(1)
+    r = client.get("/api/Remark/getbytask", params={"task_id": 1}, headers=headers)
+    assert r.status_code == 503
+    assert client.get("/api/Task/getall", params={"role": "Manager"}, headers=headers).status_code == 200
+    assert client.get("/api/admin/mongo", headers=headers).status_code == 403
+
+
+def test_unreachable_mongo_maps_to_503_and_counts_a_failure(client, make_user, login, monkeypatch):
+    import app.routers.remark_router as remark_router
+
+    def unreachable(*args, **kwargs):
+        raise ServerSelectionTimeoutError("no servers")
+
+    monkeypatch.setattr(remark_router, "page_remarks_by_task", unreachable)
+    make_user(1)
+    headers = login(1)
+    before = mongo_breaker.stats()["consecutive_failures"]
+    r = client.get("/api/Remark/getbytask", params={"task_id": 1}, headers=headers)
+    assert r.status_code == 503
+    assert r.json()["detail"] == "MongoDB is unavailable, try again later"
+    assert mongo_breaker.stats()["consecutive_failures"] == before + 1
@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from bson import ObjectId
+from fastapi.security import HTTPAuthorizationCredentials
+from app.core.notification_hub import NotificationHub, RESET, NOTIFY_QUEUE_SIZE
+from app.core.notification_hub import notification_hub
+from app.core.security import get_stream_user
+from app.database.mysql_connection import async_engine
+import app.routers.remark_router as remark_router
+
+pytestmark = pytest.mark.anyio
+
+T0 = datetime(2026, 10, 1, 9, 0)
+
+
+class FakeRequest:
+    """Stands in for the Request: disconnects once `connected` is cleared."""
+
+    def __init__(self):
+        self.connected = True
+
+    async def is_disconnected(self) -> bool:
+        await asyncio.sleep(0)
+        return not self.connected
+
+
+def _remark(minutes: int, notify_to=(2,)) -> dict:
+    return {"_id": ObjectId(), "task_id": 1, "comment": f"at {minutes}", "created_by": 1,
+            "notify_to": list(notify_to), "created_at": T0 + timedelta(minutes=minutes)}
+
+
+async def _open(last_event_id=None, e_id: int = 2):
+    request = FakeRequest()
+    response = await remark_router.stream_notifications(request, last_event_id, SimpleNamespace(e_id=e_id))
+    return request, response.body_iterator
+
+
+async def test_dispatch_reaches_only_the_recipients():
+    hub = NotificationHub()
+    two, three = hub.subscribe(2), hub.subscribe(3)
+    hub.dispatch(_remark(0, notify_to=(2,)))
+    await asyncio.sleep(0)
+    assert two.queue.qsize() == 1 and three.queue.qsize() == 0
+    hub.unsubscribe(two)
+    hub.unsubscribe(three)
+    assert hub.stats()["streams"] == 0
+
+
+async def test_a_slow_reader_gets_a_reset_instead_of_a_backlog():
+    hub = NotificationHub()
+    subscriber = hub.subscribe(2)
+    for m in range(NOTIFY_QUEUE_SIZE + 1):
+        hub.dispatch(_remark(m))
+    await asyncio.sleep(0)
+    assert subscriber.overflowed
+    assert subscriber.queue.qsize() == 1 and subscriber.queue.get_nowait() is RESET
+    hub.unsubscribe(subscriber)
+    assert hub.stats()["overflows"] == 1
+
+
+async def test_stream_replays_after_last_event_id_then_goes_live(mongo):
+    seen, missed, later = _remark(0), _remark(1), _remark(2)
+    mongo["remarks"].insert_many([dict(seen), dict(missed), dict(_remark(3, notify_to=(3,)))])
+    request, body = await _open(last_event_id=str(seen["_id"]))
+    assert await body.__anext__() == "retry: 3000\n\n"
+    assert (await body.__anext__()).startswith(f"id: {missed['_id']}\n")
+
+    notification_hub.dispatch(later)
+    assert (await body.__anext__()).startswith(f"id: {later['_id']}\n")
+    request.connected = False
+    with pytest.raises(StopAsyncIteration):
+        await body.__anext__()
+    assert notification_hub.stats()["streams"] == 0
+
+
+async def test_a_long_gap_asks_the_client_to_refetch(mongo, monkeypatch):
+    monkeypatch.setattr(remark_router, "NOTIFY_REPLAY_LIMIT", 1)
+    seen = _remark(0)
+    mongo["remarks"].insert_many([dict(seen), dict(_remark(1)), dict(_remark(2))])
+    _, body = await _open(last_event_id=str(seen["_id"]))
+    chunks = [chunk async for chunk in body]
+    assert chunks == ["retry: 3000\n\n", "event: reset\ndata: {}\n\n"]
+
+
+async def test_idle_stream_sends_heartbeats(mongo, monkeypatch):
+    monkeypatch.setattr(remark_router, "NOTIFY_HEARTBEAT_SECONDS", 0.01)
+    request, body = await _open()
+    await body.__anext__()
+    assert await body.__anext__() == ": ping\n\n"
+    request.connected = False
+    await body.aclose()
+
+
+async def test_stream_user_returns_its_connection_before_the_stream_starts(db, make_user):
+    from app.core.principal_cache import principal_cache
+    from app.core.security import create_access_token
+
+    make_user(2)
+    principal_cache.clear()
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_access_token("2"))
+    user = await get_stream_user(credentials)
+    assert user.e_id == 2
+    assert async_engine.pool.checkedout() == 0
+    principal_cache.clear()
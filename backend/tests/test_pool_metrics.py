@@ -0,0 +1,60 @@
+from sqlalchemy import text
+from app.database.mysql_connection import create_db_engine, DATABASE_URL
+from app.database.pool_metrics import PoolMetrics, MeteredQueuePool, CHECKOUT_BUCKETS_MS
+
+
+def test_record_buckets_checkout_latency():
+    metrics = PoolMetrics()
+    metrics.record(0.0005)
+    metrics.record(0.020)
+    metrics.record(10.0)
+    metrics.record(0.003, failed=True)
+    assert metrics.checkouts == 3
+    assert metrics.errors == 1
+    assert metrics.buckets[0] == 1
+    assert metrics.buckets[CHECKOUT_BUCKETS_MS.index(5)] == 1
+    assert metrics.buckets[CHECKOUT_BUCKETS_MS.index(25)] == 1
+    assert metrics.buckets[-1] == 1
+    assert metrics.max_wait == 10.0
+
+
+def test_observers_see_every_checkout():
+    metrics = PoolMetrics()
+    seen = []
+    metrics.observers.append(lambda seconds, failed: seen.append(failed))
+    metrics.record(0.001)
+    metrics.record(0.001, failed=True)
+    assert seen == [False, True]
+
+
+def test_factory_engine_counts_checkouts_across_dispose():
+    engine = create_db_engine(DATABASE_URL)
+    try:
+        assert isinstance(engine.pool, MeteredQueuePool)
+        metrics = engine.pool.metrics
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        engine.dispose()
+        # dispose() recreates the pool but the counters carry over
+        assert engine.pool.metrics is metrics
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        snapshot = metrics.snapshot(engine.pool)
+        assert snapshot["checkouts"] == 2
+        assert snapshot["checkout_errors"] == 0
+        assert sum(snapshot["checkout_latency_histogram"].values()) == 2
+        assert snapshot["checked_out"] == 0
+    finally:
+        engine.dispose()
+
+
+def test_pool_endpoint_is_admin_only(client, make_user, login):
+    make_user(1, roles=["Admin"])
+    make_user(2, roles=["Manager"])
+    assert client.get("/api/admin/pool", headers=login(2)).status_code == 403
+    r = client.get("/api/admin/pool", headers=login(1))
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert set(body) == {"async", "sync"}
+    assert body["async"]["checkouts"] >= 1
+    assert "checkout_latency_histogram" in body["sync"]
@@ -0,0 +1,143 @@
+import time
+import pytest
+from app.core import principal_cache as pc
+from app.core.principal_cache import PrincipalCache, MongoInvalidationChannel
+from app.database.mongo_health import mongo_breaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(pc.time, "monotonic", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    cache.put(1, "alice")
+    clock.now += 59
+    assert cache.get(1) == "alice"
+    clock.now += 2
+    assert cache.get(1) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PrincipalCache(maxsize=2, ttl=60)
+    cache.put(1, "a")
+    cache.put(2, "b")
+    cache.get(1)
+    cache.put(3, "c")
+    assert cache.get(2) is None
+    assert cache.get(1) == "a" and cache.get(3) == "c"
+    assert cache.evictions == 1
+
+
+def test_zero_ttl_disables_caching():
+    cache = PrincipalCache(maxsize=10, ttl=0)
+    cache.put(1, "a")
+    assert cache.get(1) is None
+
+
+def test_invalidate_only_queues_the_broadcast():
+    cache = PrincipalCache()
+    channel = MongoInvalidationChannel(cache)
+    cache.channel = channel
+    cache.put(1, "a")
+    # no Mongo fixture: a publish that touched Mongo here would fail
+    cache.invalidate(1)
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    assert channel.pending == 1
+    assert cache.stats()["pending_publishes"] == 1
+
+
+def test_invalidation_reaches_other_workers(mongo):
+    first, second = PrincipalCache(), PrincipalCache()
+    sender, receiver = MongoInvalidationChannel(first), MongoInvalidationChannel(second)
+    first.channel = sender
+    receiver._poll()  # the receiver starts from the current sequence
+    second.put(7, "stale")
+
+    first.invalidate(7)
+    sender._flush()
+    assert sender.pending == 0
+    receiver._poll()
+    assert second.get(7) is None
+    assert receiver._last_seq == 1
+
+
+def test_receiver_waits_at_a_gap(mongo, clock):
+    cache = PrincipalCache()
+    receiver = MongoInvalidationChannel(cache)
+    receiver._poll()
+    collection = receiver._collection()
+    # seq 1 was taken by a publisher that has not inserted yet
+    receiver._next_seq()
+    collection.insert_one({"_id": receiver._next_seq(), "e_id": 2})
+    receiver._poll()
+    assert receiver._last_seq == 0
+    collection.insert_one({"_id": 1, "e_id": 1})
+    receiver._poll()
+    assert receiver._last_seq == 2
+
+
+def test_gap_is_skipped_after_the_timeout(mongo, clock):
+    receiver = MongoInvalidationChannel(PrincipalCache())
+    receiver._poll()
+    receiver._next_seq()
+    receiver._collection().insert_one({"_id": receiver._next_seq(), "e_id": 2})
+    receiver._poll()
+    clock.now += pc.PRINCIPAL_CACHE_GAP_SECONDS
+    receiver._poll()
+    assert receiver._last_seq == 2
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_publishes_wait_for_the_breaker_to_close(mongo, monkeypatch):
+    cache = PrincipalCache()
+    channel = MongoInvalidationChannel(cache, poll_seconds=0.05)
+    cache.channel = channel
+    monkeypatch.setattr(mongo_breaker, "_opened_at", time.monotonic())
+    channel.start()
+    try:
+        cache.invalidate(3)
+        time.sleep(0.2)
+        assert channel.pending == 1
+        assert mongo["principal_invalidations"].count_documents({}) == 0
+
+        mongo_breaker.record_success()
+        channel._wake.set()
+        assert _wait_for(lambda: channel.pending == 0)
+        assert mongo["principal_invalidations"].find_one({"e_id": 3}) is not None
+    finally:
+        channel.stop()
+
+
+def test_role_change_drops_the_cached_principal(client, make_user, login):
+    from app.core.principal_cache import principal_cache
+
+    make_user(1, roles=["Admin"])
+    make_user(2, roles=["Developer"])
+    admin, developer = login(1), login(2)
+    assert client.get("/api/auth/me", headers=developer).status_code == 200
+    assert principal_cache.get(2) is not None
+    r = client.put("/api/Users/update", params={"id": 2}, json={"roles": ["Manager"]}, headers=admin)
+    assert r.status_code == 200, r.text
+    assert principal_cache.get(2) is None
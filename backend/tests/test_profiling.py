@@ -0,0 +1,95 @@
+import threading
+import time
+import pytest
+from app.middleware import profiling
+from app.middleware.profiling import issue_profile_token, sample_process, to_collapsed, to_speedscope, verify_profile_token
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_token_must_be_signed_and_unexpired(monkeypatch):
+    token = issue_profile_token(60)
+    assert verify_profile_token(token)
+    expires, signature = token.split(".")
+    assert not verify_profile_token(f"{int(expires) + 3600}.{signature}")
+    assert not verify_profile_token("garbage")
+    monkeypatch.setattr(profiling.time, "time", lambda: int(expires) + 1)
+    assert not verify_profile_token(token)
+
+
+def test_request_with_a_token_is_profiled_and_downloadable(client, make_user, login, profile_dir):
+    make_user(1, roles=["Admin"])
+    admin = login(1)
+    token = client.post("/api/admin/profile/token", params={"ttl": 60}, headers=admin).json()["token"]
+
+    r = client.get("/health", headers={"X-Profile": token})
+    profile_id = r.headers["X-Profile-Id"]
+    assert (profile_dir / f"{profile_id}.pstats").exists()
+
+    listed = client.get("/api/admin/profiles", headers=admin).json()
+    assert [(p["id"], p["path"]) for p in listed] == [(profile_id, "/health")]
+    text = client.get(f"/api/admin/profiles/{profile_id}", params={"format": "text"}, headers=admin)
+    assert "Ordered by: cumulative time" in text.text
+    raw = client.get(f"/api/admin/profiles/{profile_id}", headers=admin)
+    assert raw.headers["content-type"] == "application/octet-stream"
+
+
+def test_invalid_token_is_ignored(client, profile_dir):
+    r = client.get("/health", headers={"X-Profile": "1.forged"})
+    assert r.status_code == 200
+    assert "X-Profile-Id" not in r.headers
+    assert list(profile_dir.iterdir()) == []
+
+
+def test_only_one_request_is_profiled_at_a_time(client, profile_dir):
+    with profiling._profile_lock:
+        r = client.get("/health", headers={"X-Profile": issue_profile_token(60)})
+    assert r.headers["X-Profile-Status"] == "busy"
+    assert "X-Profile-Id" not in r.headers
+
+
+def test_old_profiles_are_pruned(client, profile_dir, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_KEEP", 2)
+    token = issue_profile_token(60)
+    ids = []
+    for _ in range(3):
+        ids.append(client.get("/health", headers={"X-Profile": token}).headers["X-Profile-Id"])
+        time.sleep(0.01)
+    kept = sorted(p.name for p in profile_dir.iterdir())
+    assert kept == sorted(f"{i}.{ext}" for i in ids[1:] for ext in ("json", "pstats"))
+
+
+def test_sampler_sees_other_threads_and_exports_both_formats():
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=busy_worker, name="busy")
+    thread.start()
+    try:
+        samples = sample_process(0.1, 0.01)
+    finally:
+        stop.set()
+        thread.join()
+    [name] = [n for n in samples if n.startswith("busy-")]
+    assert any(stack[-1].startswith("busy_worker") for stack in samples[name])
+
+    collapsed = to_collapsed(samples)
+    assert any(line.startswith(f"{name};") and "busy_worker" in line for line in collapsed.splitlines())
+    speedscope = to_speedscope(samples, 0.01)
+    profile = next(p for p in speedscope["profiles"] if p["name"] == name)
+    frames = speedscope["shared"]["frames"]
+    assert all(0 <= i < len(frames) for stack in profile["samples"] for i in stack)
+    assert len(profile["weights"]) == len(profile["samples"])
+
+
+def test_only_one_sampling_session_at_a_time():
+    with profiling._sample_lock:
+        with pytest.raises(RuntimeError):
+            sample_process(0.01, 0.01)
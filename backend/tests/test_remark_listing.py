@@ -0,0 +1,126 @@
+import json
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+import app.crud.remarks_crud as rc
+from app.crud.remarks_crud import page_remarks_by_task
+from app.database.mongo_health import mongo_breaker
+
+T0 = datetime(2026, 10, 1, 9, 0)
+
+
+def _seed(mongo, count: int, task_id: int = 1, same_time: bool = False) -> list:
+    docs = [
+        {"_id": ObjectId(), "task_id": task_id, "comment": f"c{i}", "created_by": 1, "e_id": 1, "role": "Manager",
+         "notify_to": [2], "created_at": T0 if same_time else T0 + timedelta(minutes=i)}
+        for i in range(count)
+    ]
+    mongo["remarks"].insert_many(docs)
+    return [str(d["_id"]) for d in sorted(docs, key=lambda d: (d["created_at"], d["_id"]))]
+
+
+def _get(client, headers, **params):
+    return client.get("/api/Remark/getbytask", params={"task_id": 1, **params}, headers=headers)
+
+
+def _all_pages(client, headers, limit: int) -> list:
+    ids, cursor = [], None
+    while True:
+        r = _get(client, headers, limit=limit, **({"cursor": cursor} if cursor else {}))
+        assert r.status_code == 200, r.text
+        ids += [d["_id"] for d in r.json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids
+
+
+def test_pages_cover_every_remark_once_in_order(client, mongo, make_user, login):
+    make_user(1)
+    expected = _seed(mongo, 5)
+    assert _all_pages(client, login(1), limit=2) == expected
+
+
+def test_keyset_breaks_created_at_ties_by_id(client, mongo, make_user, login):
+    make_user(1)
+    expected = _seed(mongo, 5, same_time=True)
+    assert _all_pages(client, login(1), limit=2) == expected
+
+
+def test_exact_last_page_has_no_next_cursor(client, mongo, make_user, login):
+    make_user(1)
+    _seed(mongo, 2)
+    r = _get(client, login(1), limit=2)
+    assert len(r.json()) == 2 and "X-Next-Cursor" not in r.headers
+
+
+def test_projection_defaults_and_custom_fields(client, mongo, make_user, login):
+    make_user(1)
+    _seed(mongo, 1)
+    headers = login(1)
+    [default] = _get(client, headers).json()
+    assert set(default) == {"_id", "task_id", "comment", "created_by", "created_at"}
+    [custom] = _get(client, headers, fields="comment,role").json()
+    assert custom == {"comment": "c0", "role": "Manager"}
+    assert _get(client, headers, fields="comment,notify_to").status_code == 400
+
+
+def test_bad_cursor_and_unknown_task(client, mongo, make_user, login):
+    make_user(1)
+    _seed(mongo, 1)
+    headers = login(1)
+    assert _get(client, headers, cursor="bogus").status_code == 400
+    assert client.get("/api/Remark/getbytask", params={"task_id": 9}, headers=headers).status_code == 404
+
+
+def test_listing_is_streamed_in_valid_json_batches(mongo, monkeypatch):
+    monkeypatch.setattr(rc, "REMARK_STREAM_BATCH", 2)
+    expected = _seed(mongo, 5)
+    chunks, next_cursor = page_remarks_by_task(1, limit=5)
+    pieces = list(chunks)
+    assert len(pieces) > 3
+    assert [d["_id"] for d in json.loads(b"".join(pieces))] == expected
+    assert next_cursor is None
+
+
+def test_failure_mid_stream_ends_with_a_truncated_record(mongo, monkeypatch):
+    monkeypatch.setattr(rc, "REMARK_STREAM_BATCH", 2)
+    _seed(mongo, 5)
+    real = rc.get_remarks_collection
+
+    class Dropping:
+        """Yields the first three remarks of the page, then loses the connection."""
+
+        def __init__(self, cursor):
+            self._docs = iter(list(cursor)[:3])
+
+        def sort(self, *args):
+            return self
+
+        limit = batch_size = sort
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            doc = next(self._docs, None)
+            if doc is None:
+                raise AutoReconnect("connection reset")
+            return doc
+
+        def close(self):
+            pass
+
+    class Collection:
+        def __getattr__(self, name):
+            return getattr(real(), name)
+
+        def find(self, query, projection):
+            cursor = real().find(query, projection)
+            return cursor if projection == {"created_at": 1} else Dropping(cursor.sort([("created_at", 1), ("_id", 1)]))
+
+    monkeypatch.setattr(rc, "get_remarks_collection", Collection)
+    chunks, _ = page_remarks_by_task(1, limit=5)
+    body = json.loads(b"".join(chunks))
+    assert [d["comment"] for d in body[:3]] == ["c0", "c1", "c2"]
+    assert body[-1] == {"error": "Remark listing was interrupted", "truncated": True}
+    assert mongo_breaker.stats()["consecutive_failures"] == 1
@@ -0,0 +1,114 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from pymongo.errors import AutoReconnect
+from app.core import remark_sync as rs
+from app.core.remark_sync import RemarkSync
+from app.crud.remarks_crud import backfill_notify_to, notify_targets
+from app.database.mongo_health import mongo_breaker
+
+
+def _remark(client, headers, task_id: int, comment: str):
+    r = client.post("/api/Remark/create", data={"task_id": task_id, "comment": comment, "role": "Manager"}, headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()["remark"]
+
+
+def _notified(client, headers) -> list:
+    r = client.get("/api/Remark/notifications", headers=headers)
+    assert r.status_code == 200, r.text
+    return [n["comment"] for n in r.json()]
+
+
+def test_targets_are_assigner_and_reviewer_without_the_author():
+    task = SimpleNamespace(assigned_by=1, reviewer=2)
+    assert notify_targets(task) == [1, 2]
+    assert notify_targets(task, exclude=1) == [2]
+    assert notify_targets(SimpleNamespace(assigned_by=1, reviewer=1)) == [1]
+    assert notify_targets(SimpleNamespace(assigned_by=1, reviewer=None)) == [1]
+
+
+def test_new_remark_notifies_everyone_but_its_author(client, make_user, make_task, login):
+    for e_id in (1, 2, 3):
+        make_user(e_id)
+    make_task(1, assigned_by=1, reviewer=2, assigned_to=3)
+    assert _remark(client, login(1), 1, "from the assigner")["notify_to"] == [2]
+    assert _notified(client, login(2)) == ["from the assigner"]
+    assert _notified(client, login(1)) == []
+    assert _notified(client, login(3)) == []
+
+
+def test_task_update_queues_a_retarget(client, make_user, make_task, login, monkeypatch):
+    from app.core.remark_sync import remark_sync
+
+    calls = []
+    monkeypatch.setattr(remark_sync, "retarget", lambda *args: calls.append(args))
+    make_user(1)
+    make_task(1, assigned_by=1, reviewer=2)
+    headers = login(1)
+    r = client.put("/api/Task/update", params={"id": 1, "role": "Manager"}, json={"reviewer": 4}, headers=headers)
+    assert r.status_code == 200, r.text
+    assert calls == [(1, [1, 4], {1, 2, 4})]
+    # an update that keeps the recipients does not touch Mongo
+    client.put("/api/Task/update", params={"id": 1, "role": "Manager"}, json={"title": "renamed"}, headers=headers)
+    assert len(calls) == 1
+
+
+def test_backfill_fills_old_remarks_from_the_task(mongo, make_task):
+    make_task(1, assigned_by=1, reviewer=2)
+    mongo["remarks"].insert_many([
+        {"task_id": 1, "created_by": 2},
+        {"task_id": 99, "created_by": 2},  # task deleted since
+        {"task_id": 1, "created_by": 3, "notify_to": [7]},
+    ])
+    assert backfill_notify_to() == 2
+    assert [d.get("notify_to") for d in mongo["remarks"].find().sort("_id", 1)] == [[1], [], [7]]
+    assert backfill_notify_to() == 0
+
+
+async def _settle(sync: RemarkSync, condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.anyio
+async def test_sync_waits_for_the_breaker_and_applies_the_latest_targets(monkeypatch):
+    applied = []
+    monkeypatch.setattr(rs, "_apply", lambda tasks, users: applied.append((dict(tasks), set(users))))
+    monkeypatch.setattr(mongo_breaker, "_opened_at", time.monotonic())
+    sync = RemarkSync(retry_seconds=0.02)
+    try:
+        sync.retarget(1, [2], {2, 3})
+        sync.retarget(1, [4], {4})
+        await asyncio.sleep(0.1)
+        assert applied == []
+        assert sync.stats()["pending_tasks"] == 1
+
+        mongo_breaker.record_success()
+        await _settle(sync, lambda: applied)
+        assert applied == [({1: [4]}, {2, 3, 4})]
+    finally:
+        await sync.stop()
+
+
+@pytest.mark.anyio
+async def test_sync_requeues_work_when_mongo_drops(monkeypatch):
+    attempts = []
+
+    def flaky(tasks, users):
+        attempts.append(dict(tasks))
+        if len(attempts) == 1:
+            raise AutoReconnect("reset")
+
+    monkeypatch.setattr(rs, "_apply", flaky)
+    sync = RemarkSync(retry_seconds=0.02)
+    try:
+        sync.forget_task(5, {1})
+        await _settle(sync, lambda: sync.applied)
+        assert attempts == [{5: []}, {5: []}]
+        assert sync.stats()["retries"] == 1
+    finally:
+        await sync.stop()
+        mongo_breaker.record_success()
@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy import select
+from app.core.dependencies import get_db
+from app.database.mysql_connection import async_engine
+from app.schemas.schemas import EmployeeSchema
+
+
+def test_auth_and_route_share_one_checkout(client, make_user, login):
+    from app.core.principal_cache import principal_cache
+
+    make_user(1)
+    headers = login(1)
+    # a principal-cache miss makes get_current_user load the user on the request session
+    principal_cache.clear()
+    metrics = async_engine.pool.metrics
+    before = metrics.checkouts
+    r = client.get("/api/Employee/getall", headers=headers)
+    assert r.status_code == 200, r.text
+    assert metrics.checkouts - before == 1
+
+
+
+@pytest.mark.anyio
+async def test_failed_request_rolls_back(db):
+    deps = get_db()
+    session = await deps.__anext__()
+    session.add(EmployeeSchema(e_id=7, name="Rolled Back", email="rb@ust.com", designation="Engineer", mgr_id=0))
+    await session.flush()
+    with pytest.raises(RuntimeError):
+        await deps.athrow(RuntimeError("route failed"))
+    db.expire_all()
+    assert db.execute(select(EmployeeSchema).where(EmployeeSchema.e_id == 7)).first() is None
+
+
+@pytest.mark.anyio
+async def test_session_is_closed_after_the_request(db):
+    deps = get_db()
+    session = await deps.__anext__()
+    await session.execute(select(EmployeeSchema))
+    assert session.in_transaction()
+    with pytest.raises(StopAsyncIteration):
+        await deps.__anext__()
+    assert not session.in_transaction()
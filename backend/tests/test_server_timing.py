@@ -0,0 +1,59 @@
+import logging
+import re
+from app.middleware import request_timing as rt
+from app.middleware.request_timing import RequestTiming, sql_shape
+
+
+def _phases(header: str) -> dict:
+    return {part.split(";")[0]: part for part in header.split(", ")}
+
+
+def test_placeholder_lists_fold_into_one_shape():
+    two = "SELECT * FROM tasks WHERE t_id IN (%s, %s)"
+    five = "SELECT *  FROM tasks\n WHERE t_id IN (%s,%s,%s,%s,%s)"
+    assert sql_shape(two) == sql_shape(five) == "SELECT * FROM tasks WHERE t_id IN (?)"
+    assert sql_shape("SELECT ? , ?") == sql_shape("SELECT %s") == "SELECT ?"
+
+
+def test_header_breaks_down_an_authenticated_request(client, make_user, make_task, login):
+    make_user(1)
+    make_task(1)
+    r = client.get("/api/Task/get", params={"id": 1}, headers=login(1))
+    phases = _phases(r.headers["Server-Timing"])
+    assert {"auth", "serialize", "sql", "mongo", "total"} <= set(phases)
+    sql_count = int(re.search(r'desc="(\d+) queries"', phases["sql"]).group(1))
+    assert sql_count >= 1
+    assert phases["mongo"].startswith('mongo;desc="0 ops"')
+
+
+def test_timing_is_shown_to_allowed_origins_only(client):
+    allowed = client.get("/health", headers={"Origin": "http://localhost:8080"})
+    assert allowed.headers["Timing-Allow-Origin"] == "http://localhost:8080"
+    other = client.get("/health", headers={"Origin": "http://evil.example"})
+    assert "Server-Timing" in other.headers
+    assert "Timing-Allow-Origin" not in other.headers
+
+
+def test_repeated_statement_shapes_are_reported(monkeypatch):
+    monkeypatch.setattr(rt, "SQL_REPEAT_WARN_THRESHOLD", 2)
+    timing = RequestTiming()
+    for n in (1, 2, 3):
+        timing.add_sql(f"SELECT * FROM remarks WHERE task_id IN ({', '.join(['%s'] * n)})", 1.0)
+    timing.add_sql("SELECT * FROM tasks WHERE t_id = %s", 1.0)
+    assert timing.repeated_shapes() == [("SELECT * FROM remarks WHERE task_id IN (?)", 3)]
+
+
+def test_n_plus_one_is_logged_per_request(client, make_user, monkeypatch, caplog):
+    make_user(1)
+    monkeypatch.setattr(rt, "SQL_REPEAT_WARN_THRESHOLD", 1)
+    import app.routers.employee_router as employee_router
+    from app.crud.employee_crud import get_by_employee_id
+
+    async def one_query_per_row(session, **filters):
+        # what an N+1 looks like from the database's side
+        return [await get_by_employee_id(session, 1) for _ in range(3)]
+
+    monkeypatch.setattr(employee_router, "get_all_employees", one_query_per_row)
+    with caplog.at_level(logging.WARNING, logger=rt.__name__):
+        assert client.get("/api/Employee/getall").status_code == 200
+    assert any("Possible N+1: GET /api/Employee/getall ran" in m for m in caplog.messages)
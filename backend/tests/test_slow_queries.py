@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import create_engine, text
+from app.middleware import slow_queries as sq
+from app.middleware.slow_queries import SlowQueryLog, command_collection, mongo_shape, redact, top_offenders
+from app.database.mongo_health import mongo_breaker
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    """A slow query log with a zero threshold whose submissions are kept instead of queued."""
+    log = SlowQueryLog(threshold_ms=1e-9)
+    items = []
+    monkeypatch.setattr(log, "_submit", items.append)
+    return log, items
+
+
+def _sql_item(statement: str, parameters=(), ms: float = 250.0) -> dict:
+    return {"kind": "sql", "engine": "sync", "statement": statement, "parameters": parameters,
+            "executemany": False, "duration_ms": ms, "route": "GET /api/Task/getall"}
+
+
+def test_redact_keeps_types_and_like_wildcards():
+    assert redact(("%smith%", "bob", 42, None, True)) == ["%<str:7>%", "<str:3>", "<int>", None, True]
+    assert redact({"$in": [1, 2]}) == {"$in": ["<int>", "<int>"]}
+
+
+def test_command_collection_handles_every_command_form():
+    assert command_collection("find", {"find": "remarks", "filter": {}}) == "remarks"
+    assert command_collection("getMore", {"getMore": 123, "collection": "remarks"}) == "remarks"
+    assert command_collection("explain", {"explain": {"find": "remarks"}}) is None
+    assert command_collection("endSessions", {"endSessions": [{"id": 1}]}) is None
+
+
+def test_mongo_shape_ignores_values():
+    a = mongo_shape("find", {"find": "remarks", "filter": {"task_id": 1, "_id": {"$in": [1, 2, 3]}}, "lsid": {}})
+    b = mongo_shape("find", {"find": "remarks", "filter": {"task_id": 9, "_id": {"$in": [4]}}})
+    assert a == b
+    assert "9" not in b
+
+
+def test_slow_sql_statements_are_submitted_but_explains_are_not(captured, tmp_path):
+    log, items = captured
+    engine = create_engine(f"sqlite:///{tmp_path}/slow.db")
+    log.watch_engine(engine, "sync")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1 WHERE 1 = :x"), {"x": 1})
+        conn.exec_driver_sql("EXPLAIN QUERY PLAN SELECT 1")
+    engine.dispose()
+    assert [i["statement"] for i in items] == ["SELECT 1 WHERE 1 = ?"]
+    assert items[0]["engine"] == "sync"
+
+
+def test_disabled_log_watches_nothing(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/off.db")
+    log = SlowQueryLog(threshold_ms=0)
+    log.watch_engine(engine, "sync")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    engine.dispose()
+    assert log.stats()["queue_depth"] == 0
+
+
+def test_mongo_listener_watches_only_configured_collections(captured):
+    log, items = captured
+    listener = log.mongo_listener()
+    for request_id, collection in ((1, "remarks"), (2, "logs")):
+        listener.started(SimpleNamespace(request_id=request_id, command_name="find", database_name="ust",
+                                         command={"find": collection, "filter": {"task_id": 1}}))
+        listener.succeeded(SimpleNamespace(request_id=request_id, command_name="find", duration_micros=300_000))
+    assert [i["command"]["find"] for i in items] == ["remarks"]
+
+
+def test_stored_record_is_redacted_and_explained_once_per_shape(mongo, db):
+    log = SlowQueryLog(threshold_ms=100)
+    log._store(_sql_item("SELECT * FROM tasks WHERE title LIKE ? AND t_id IN (?, ?)", ("%bug%", 1, 2)))
+    log._store(_sql_item("SELECT * FROM tasks WHERE title LIKE ? AND t_id IN (?)", ("%fix%", 3)))
+    records = list(mongo["slow_queries"].find())
+    assert len(records) == 2
+    assert records[0]["shape_id"] == records[1]["shape_id"]
+    assert records[0]["parameters"] == ["%<str:5>%", "<int>", "<int>"]
+    assert log.explained == 1
+    plan = mongo["slow_query_plans"].find_one({"_id": records[0]["shape_id"]})
+    assert plan["plan"]
+
+
+def test_nothing_is_stored_while_the_breaker_is_open(mongo, monkeypatch):
+    monkeypatch.setattr(mongo_breaker, "_opened_at", 1.0)
+    monkeypatch.setattr(sq, "SLOW_QUERY_EXPLAIN", False)
+    log = SlowQueryLog(threshold_ms=100)
+    log._store(_sql_item("SELECT 1"))
+    monkeypatch.setattr(mongo_breaker, "_opened_at", None)
+    assert mongo["slow_queries"].count_documents({}) == 0
+
+
+def test_top_offenders_rank_shapes_by_total_time(mongo, monkeypatch):
+    monkeypatch.setattr(sq, "SLOW_QUERY_EXPLAIN", False)
+    log = SlowQueryLog(threshold_ms=100)
+    for ms in (300, 300):
+        log._store(_sql_item("SELECT * FROM tasks WHERE status = ?", ("to_do",), ms))
+    log._store(_sql_item("SELECT * FROM users", (), 500))
+    offenders = top_offenders(60)
+    assert [o["count"] for o in offenders] == [2, 1]
+    assert offenders[0]["total_ms"] == 600 and offenders[0]["avg_ms"] == 300
+    assert offenders[0]["routes"] == ["GET /api/Task/getall"]
+    assert offenders[0]["plan"] is None
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+from app.schemas.schemas import TaskStatus, TaskPriority
+
+
+def _pages(client, headers, **params):
+    pages, cursor = [], None
+    while True:
+        query = dict(params, role="Manager")
+        if cursor:
+            query["cursor"] = cursor
+        r = client.get("/api/Task/getall", params=query, headers=headers)
+        assert r.status_code == 200, r.text
+        pages.append([t["t_id"] for t in r.json()])
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+
+
+def test_pages_by_t_id_without_gaps_or_repeats(client, make_user, make_task, login):
+    make_user(1)
+    for t in range(1, 8):
+        make_task(t)
+    pages = _pages(client, login(1), limit=3)
+    assert pages == [[1, 2, 3], [4, 5, 6], [7]]
+
+
+def test_pages_by_updated_at_newest_first_with_never_updated_last(client, make_user, make_task, login):
+    make_user(1)
+    base = datetime(2025, 6, 1)
+    make_task(1, updated_at=base)
+    make_task(2, updated_at=base + timedelta(hours=2))
+    make_task(3)
+    make_task(4, updated_at=base + timedelta(hours=2))
+    make_task(5, updated_at=base + timedelta(hours=1))
+    pages = _pages(client, login(1), limit=2, sort="updated_at")
+    assert sum(pages, []) == [4, 2, 5, 1, 3]
+
+
+def test_filters_run_together(client, make_user, make_task, login):
+    make_user(1)
+    make_user(2, roles=["Developer"])
+    make_task(1, assigned_to=2, status=TaskStatus.REVIEW, priority=TaskPriority.HIGH)
+    make_task(2, assigned_to=2, status=TaskStatus.REVIEW, priority=TaskPriority.LOW)
+    make_task(3, assigned_to=1, status=TaskStatus.REVIEW, priority=TaskPriority.HIGH)
+    make_task(4, assigned_to=2, status=TaskStatus.DONE, priority=TaskPriority.HIGH,
+              expected_closure=datetime(2027, 1, 1))
+    r = client.get("/api/Task/getall", headers=login(1),
+                   params={"role": "Manager", "status": "review", "priority": "high", "assigned_to": 2})
+    assert [t["t_id"] for t in r.json()] == [1]
+    r = client.get("/api/Task/getall", headers=login(1),
+                   params={"role": "Manager", "due_from": "2026-06-01T00:00:00"})
+    assert [t["t_id"] for t in r.json()] == [4]
+
+
+def test_empty_page_is_200(client, make_user, login):
+    make_user(1)
+    r = client.get("/api/Task/getall", params={"role": "Manager"}, headers=login(1))
+    assert r.status_code == 200
+    assert r.json() == []
+    assert "X-Next-Cursor" not in r.headers
+
+
+def test_developer_only_sees_assigned_tasks(client, make_user, make_task, login):
+    make_user(1)
+    make_user(2, roles=["Developer"])
+    make_task(1, assigned_to=2)
+    make_task(2, assigned_to=1)
+    r = client.get("/api/Task/getall", params={"role": "Developer"}, headers=login(2))
+    assert [t["t_id"] for t in r.json()] == [1]
+
+
+def test_bad_cursor_is_400(client, make_user, login):
+    make_user(1)
+    headers = login(1)
+    r = client.get("/api/Task/getall", params={"role": "Manager", "cursor": "not-a-cursor"}, headers=headers)
+    assert r.status_code == 400
+
+
+def test_cursor_is_bound_to_its_sort_order(client, make_user, make_task, login):
+    make_user(1)
+    for t in range(1, 4):
+        make_task(t)
+    headers = login(1)
+    r = client.get("/api/Task/getall", params={"role": "Manager", "limit": 1}, headers=headers)
+    cursor = r.headers["X-Next-Cursor"]
+    r = client.get("/api/Task/getall", params={"role": "Manager", "sort": "updated_at", "cursor": cursor}, headers=headers)
+    assert r.status_code == 400
@@ -0,0 +1,48 @@
+from sqlalchemy import text
+from app.schemas.schemas import TaskStatus, check_indexes
+
+
+def _by_status(client, headers, status, role="Manager"):
+    r = client.get("/api/Task/getbystatus", params={"status": status, "role": role}, headers=headers)
+    assert r.status_code == 200, r.text
+    return sorted(t["t_id"] for t in r.json())
+
+
+def test_filters_by_status(client, make_user, make_task, login):
+    make_user(1)
+    make_task(1, status=TaskStatus.TO_DO)
+    make_task(2, status=TaskStatus.REVIEW)
+    make_task(3, status=TaskStatus.TO_DO)
+    assert _by_status(client, login(1), "to_do") == [1, 3]
+    assert _by_status(client, login(1), "review") == [2]
+
+
+def test_status_casing_is_normalised(client, make_user, make_task, login):
+    make_user(1)
+    make_task(1, status=TaskStatus.IN_PROGRESS)
+    headers = login(1)
+    for status in ("in_progress", "IN_PROGRESS", "In_Progress"):
+        assert _by_status(client, headers, status) == [1]
+
+
+def test_unknown_status_matches_nothing(client, make_user, make_task, login):
+    make_user(1)
+    make_task(1)
+    assert _by_status(client, login(1), "blocked") == []
+
+
+def test_developer_sees_only_assigned_tasks_in_a_status(client, make_user, make_task, login):
+    make_user(1)
+    make_user(2, roles=["Developer"])
+    make_task(1, assigned_to=2)
+    make_task(2, assigned_to=1)
+    assert _by_status(client, login(2), "to_do", role="Developer") == [1]
+
+
+def test_composite_indexes_are_declared_and_checked(db):
+    from app.database.mysql_connection import engine
+
+    assert check_indexes(engine) == []
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_tasks_status_reviewer"))
+    assert check_indexes(engine) == ["ix_tasks_status_reviewer"]
@@ -0,0 +1,105 @@
+import pytest
+from jose import jwt
+from app.core import revocation
+from app.core.revocation import TokenStateTable, token_state, refresh_token_state
+from app.core.principal_cache import principal_cache
+from app.database.mysql_connection import async_engine
+
+
+@pytest.fixture
+def claims(monkeypatch):
+    """Turn on the signed-claims fast path with an empty revocation table."""
+    import app.core.security as security
+    import app.routers.auth_router as auth_router
+
+    monkeypatch.setattr(security, "JWT_EMBED_CLAIMS", True)
+    monkeypatch.setattr(auth_router, "JWT_EMBED_CLAIMS", True)
+    yield token_state
+    with token_state._lock:
+        token_state._versions = {}
+        token_state._loaded_at = None
+
+
+def _me(client, headers):
+    metrics = async_engine.pool.metrics
+    before = metrics.checkouts
+    r = client.get("/api/auth/me", headers=headers)
+    return r, metrics.checkouts - before
+
+
+def test_table_trusts_only_a_fresh_matching_version(monkeypatch):
+    table = TokenStateTable(max_age=10)
+    assert not table.is_current(1, 1)
+    table.replace([(1, 3, "active")])
+    assert table.is_current(1, 3)
+    assert not table.is_current(1, 2)
+    assert not table.is_current(2, 1)
+    loaded = table._loaded_at
+    monkeypatch.setattr(revocation.time, "monotonic", lambda: loaded + 11)
+    assert not table.is_current(1, 3)
+
+
+def test_login_signs_roles_status_and_version(client, make_user, claims):
+    make_user(1, roles=["Developer"])
+    r = client.post("/api/auth/login", json={"e_id": 1, "password": "secret1"})
+    payload = jwt.get_unverified_claims(r.json()["access_token"])
+    assert payload["roles"] == ["Developer"]
+    assert payload["status"] == "active"
+    assert payload["ver"] == 1
+
+
+@pytest.mark.anyio
+async def test_refresh_loads_every_user(db, make_user):
+    make_user(1)
+    make_user(2)
+    try:
+        await refresh_token_state()
+        assert token_state.is_current(1, 1) and token_state.is_current(2, 1)
+    finally:
+        token_state.replace([])
+
+
+def test_current_claims_skip_the_database(client, make_user, login, claims):
+    make_user(1, roles=["Developer"])
+    headers = login(1)
+    claims.replace([(1, 1, "active")])
+    principal_cache.clear()
+    r, checkouts = _me(client, headers)
+    assert r.status_code == 200
+    assert r.json()["roles"] == ["Developer"]
+    assert checkouts == 0
+
+
+def test_stale_table_falls_back_to_the_database(client, make_user, login, claims):
+    make_user(1, roles=["Developer"])
+    headers = login(1)
+    principal_cache.clear()
+    r, checkouts = _me(client, headers)
+    assert r.status_code == 200
+    assert checkouts == 1
+
+
+def test_role_change_revokes_the_signed_claims(client, make_user, login, claims):
+    make_user(1, roles=["Admin"])
+    make_user(2, roles=["Developer"])
+    admin = login(1)
+    developer = login(2)
+    claims.replace([(1, 1, "active"), (2, 1, "active")])
+
+    r = client.put("/api/Users/update", params={"id": 2}, json={"roles": ["Manager"]}, headers=admin)
+    assert r.status_code == 200, r.text
+    assert not claims.is_current(2, 1)
+    # the old token still verifies, but its roles come from the users table now
+    r, checkouts = _me(client, developer)
+    assert r.json()["roles"] == ["Manager"]
+    assert checkouts == 1
+
+
+def test_deleted_user_loses_the_fast_path(client, make_user, login, claims):
+    make_user(1, roles=["Admin"])
+    make_user(2, roles=["Developer"])
+    developer = login(2)
+    claims.replace([(1, 1, "active"), (2, 1, "active")])
+    assert client.delete("/api/Users/delete", params={"id": 2}).status_code == 200
+    assert not claims.is_current(2, 1)
+    assert client.get("/api/auth/me", headers=developer).status_code == 401
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+import app.crud.notification_crud as nc
+from app.crud.notification_crud import (
+    count_new_remark, forget_remark, is_read, mark_all_read, mark_read, read_state, recount_unread, unread_count,
+)
+
+T0 = datetime(2026, 10, 1, 9, 0)
+
+
+def _add(mongo, minutes: int, notify_to=(2,), **extra) -> dict:
+    remark = {"_id": ObjectId(), "task_id": 1, "created_by": 1, "notify_to": list(notify_to),
+              "created_at": T0 + timedelta(minutes=minutes), **extra}
+    mongo["remarks"].insert_one(remark)
+    count_new_remark(remark["notify_to"], remark["created_at"])
+    return remark
+
+
+def _state(mongo, e_id: int = 2) -> dict:
+    return mongo["notification_state"].find_one({"_id": e_id})
+
+
+def test_first_lookup_counts_and_later_remarks_increment(mongo):
+    _add(mongo, 0)
+    _add(mongo, 1, read_by=[2])  # read through the old read_by array
+    _add(mongo, 2, notify_to=(3,))
+    assert unread_count(2) == 1
+    _add(mongo, 3)
+    assert unread_count(2) == 2
+    assert _state(mongo)["unread"] == 2
+
+
+def test_mark_read_counts_each_remark_once(mongo):
+    first = _add(mongo, 0)
+    _add(mongo, 1)
+    assert mark_read(2, str(first["_id"]))
+    assert not mark_read(2, str(first["_id"]))
+    assert not mark_read(3, str(first["_id"]))  # not addressed to 3
+    assert unread_count(2) == 1
+    with pytest.raises(HTTPException) as exc:
+        mark_read(2, "not-an-id")
+    assert exc.value.status_code == 400
+
+
+def test_reading_oldest_first_compacts_into_the_watermark(mongo):
+    remarks = [_add(mongo, m) for m in range(3)]
+    unread_count(2)
+    for remark in remarks[:2]:
+        mark_read(2, str(remark["_id"]))
+    state = _state(mongo)
+    assert state["watermark"] == remarks[1]["created_at"]
+    assert state["read"] == []
+    assert state["unread"] == 1
+
+
+def test_a_gap_keeps_newer_reads_in_the_read_set(mongo):
+    remarks = [_add(mongo, m) for m in range(3)]
+    unread_count(2)
+    mark_read(2, str(remarks[2]["_id"]))
+    state = _state(mongo)
+    assert state["watermark"] is None
+    assert state["read"] == [remarks[2]["_id"]]
+    watermark, read = read_state(2)
+    assert is_read(remarks[2], 2, watermark, read)
+    assert not is_read(remarks[0], 2, watermark, read)
+
+
+def test_watermark_stops_before_a_partly_read_timestamp(mongo):
+    a = _add(mongo, 0)
+    _add(mongo, 0)
+    unread_count(2)
+    mark_read(2, str(a["_id"]))
+    assert _state(mongo)["watermark"] is None
+
+
+def test_recount_retries_when_the_state_changed_under_it(mongo, monkeypatch):
+    _add(mongo, 0)
+    unread_count(2)
+    real = nc.get_remarks_collection
+    raced = []
+
+    class Racing:
+        """The remarks collection, with a new remark landing while the first count runs."""
+
+        def __getattr__(self, name):
+            return getattr(real(), name)
+
+        def count_documents(self, query):
+            result = real().count_documents(query)
+            if not raced:
+                raced.append(_add(mongo, 5))
+            return result
+
+    monkeypatch.setattr(nc, "get_remarks_collection", Racing)
+    assert recount_unread(2) == 2
+    assert _state(mongo)["unread"] == 2
+
+
+def test_deleting_a_remark_fixes_counters_and_read_sets(mongo):
+    remarks = [_add(mongo, m, notify_to=(2, 3)) for m in range(3)]
+    unread_count(2), unread_count(3)
+    mark_read(2, str(remarks[2]["_id"]))
+    forget_remark(remarks[2])
+    assert _state(mongo, 2)["unread"] == 2 and _state(mongo, 2)["read"] == []
+    assert _state(mongo, 3)["unread"] == 2
+
+
+def test_mark_all_read_and_the_badge_routes(client, make_user, make_task, login):
+    make_user(1)
+    make_user(2)
+    make_task(1, assigned_by=1, reviewer=2)
+    author, reviewer = login(1), login(2)
+    for comment in ("one", "two"):
+        client.post("/api/Remark/create", data={"task_id": 1, "comment": comment, "role": "Manager"}, headers=author)
+    badge = lambda: client.get("/api/Remark/notifications/unread_count", headers=reviewer).json()["unread"]
+    assert badge() == 2
+    first = client.get("/api/Remark/notifications", headers=reviewer).json()[-1]
+    client.post("/api/Remark/notifications/markread", data={"remark_id": first["_id"]}, headers=reviewer)
+    assert badge() == 1
+    client.post("/api/Remark/notifications/markallread", headers=reviewer)
+    assert badge() == 0
+    assert all(n["read"] for n in client.get("/api/Remark/notifications", headers=reviewer).json())
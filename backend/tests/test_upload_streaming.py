@@ -0,0 +1,80 @@
+import hashlib
+import io
+import pytest
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+import app.utils.blob_store as bs
+from app.utils.blob_store import store_upload
+
+CHUNK = 1024
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(bs, "UPLOAD_CHUNK_SIZE", CHUNK)
+
+
+class ReadRecorder(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+def _upload(data: bytes, name: str = "notes.txt", size=None, content_type: str = "text/plain") -> UploadFile:
+    return UploadFile(file=ReadRecorder(data), filename=name, size=size,
+                      headers=Headers({"content-type": content_type}))
+
+
+def test_upload_is_streamed_into_gridfs_chunks_with_its_hash(mongo, db, small_chunks):
+    data = b"x" * (CHUNK * 2 + 10)
+    upload = _upload(data)
+    blob_id = store_upload(upload)
+    assert blob_id == hashlib.sha256(data).hexdigest()
+    assert all(size == CHUNK for size in upload.file.reads)
+    stored = mongo["fs.files"].find_one({"metadata.sha256": blob_id})
+    assert stored["chunkSize"] == CHUNK and stored["length"] == len(data)
+    assert mongo["fs.chunks"].count_documents({"files_id": stored["_id"]}) == 3
+    assert stored["contentType"] == "text/plain"
+
+
+def test_declared_size_over_the_limit_is_rejected_before_reading(mongo, db, monkeypatch):
+    monkeypatch.setattr(bs, "UPLOAD_MAX_BYTES", 100)
+    upload = _upload(b"y" * 200, size=200)
+    with pytest.raises(HTTPException) as exc:
+        store_upload(upload)
+    assert exc.value.status_code == 413
+    assert upload.file.reads == []
+
+
+def test_oversized_stream_leaves_nothing_behind(mongo, db, small_chunks, monkeypatch):
+    from app.schemas.schemas import BlobSchema
+
+    monkeypatch.setattr(bs, "UPLOAD_MAX_BYTES", CHUNK * 2)
+    with pytest.raises(HTTPException) as exc:
+        store_upload(_upload(b"z" * (CHUNK * 3)))
+    assert exc.value.status_code == 413
+    assert mongo["fs.files"].count_documents({}) == 0
+    assert mongo["fs.chunks"].count_documents({}) == 0
+    assert db.query(BlobSchema).count() == 0
+
+
+def test_remark_upload_round_trip_and_413(client, make_user, make_task, login, monkeypatch):
+    make_user(1)
+    make_task(1)
+    headers = login(1)
+    form = {"task_id": 1, "comment": "with a file", "role": "Manager"}
+    r = client.post("/api/Remark/create", data=form, files={"file": ("a.txt", b"hello", "text/plain")}, headers=headers)
+    assert r.status_code == 200, r.text
+    remark = r.json()["remark"]
+    assert client.get(f"/api/file/{remark['file_id']}", headers=headers).content == b"hello"
+
+    monkeypatch.setattr(bs, "UPLOAD_MAX_BYTES", 4)
+    r = client.put("/api/Remark/update", data={"remark_id": remark["_id"], "role": "Manager"},
+                   files={"file": ("b.txt", b"too large", "text/plain")}, headers=headers)
+    assert r.status_code == 413
+    # the rejected replacement kept the current attachment
+    assert client.get(f"/api/file/{remark['file_id']}", headers=headers).content == b"hello"